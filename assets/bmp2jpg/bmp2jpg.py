@@ -1,22 +1,164 @@
+import hashlib
+import json
+import multiprocessing
 import os
+import sys
+import time
 from PIL import Image
 
 # Input and output directories
 input_dir = "."
 output_dir = "."
 
-# Ensure the output directory exists
-os.makedirs(output_dir, exist_ok=True)
+# Conversion settings, stored with the hashes so a change converts everything again
+QUALITY = 75  # PIL's default JPEG quality
+MAX_SIZE = None  # (width, height) to shrink larger images to, None to keep their size
 
-# Iterate through BMP files and convert
-for filename in os.listdir(input_dir):
-    if filename.endswith(".bmp"):
+MANIFEST = ".bmp2jpg.json"  # content hashes of the converted files, in the output directory
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_up_to_date(bmp_path, jpg_path, entry, settings, sha256):
+    """
+    Tells whether jpg_path was converted from the current bmp_path: newer than it,
+    or, given the `sha256` of bmp_path, converted from a file with the same content
+    and settings according to its manifest `entry` (screenshots copied again from
+    the SD card get new mtimes but the same content).
+    """
+    if not os.path.exists(jpg_path):
+        return False
+    if sha256 is None:
+        return os.path.getmtime(jpg_path) >= os.path.getmtime(bmp_path)
+    return entry is not None and entry['settings'] == settings and entry['sha256'] == sha256
+
+
+def convert(bmp_path, jpg_path, quality, max_size):
+    """Converts one image to JPEG."""
+    with Image.open(bmp_path) as img:
+        if max_size is not None:
+            # Decoder-level downscaling where the format has it (JPEG), then a cheap
+            # integer reduce instead of a full resample of the large image
+            img.draft('RGB', max_size)
+            factor = max(1, min(img.width // max_size[0], img.height // max_size[1]))
+            img = img.reduce(factor) if factor > 1 else img
+            if img.width > max_size[0] or img.height > max_size[1]:
+                img.thumbnail(max_size)
+        # Written next to the output and renamed, so an interrupted run never leaves a
+        # partial JPEG that looks up to date
+        tmp_path = jpg_path + ".tmp"
+        try:
+            img.convert("RGB").save(tmp_path, "JPEG", quality=quality)
+            os.replace(tmp_path, jpg_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def process(job):
+    """
+    Converts one image unless its JPEG is up to date. With hashing, the image is read
+    once here for its hash, in the worker, and the hash is returned for the manifest.
+    Runs in the worker processes.
+
+    Returns:
+    - (bmp_path, converted, bytes read for the conversion, sha256 or None, error message or None)
+    """
+    bmp_path, jpg_path, quality, max_size, settings, use_hash, entry = job
+    try:
+        sha256 = file_hash(bmp_path) if use_hash else None
+        if is_up_to_date(bmp_path, jpg_path, entry, settings, sha256):
+            return bmp_path, False, 0, sha256, None
+        convert(bmp_path, jpg_path, quality, max_size)
+        return bmp_path, True, os.path.getsize(bmp_path), sha256, None
+    except Exception as e:  # a corrupt or unreadable image must not stop the batch
+        return bmp_path, False, 0, None, f"{type(e).__name__}: {e}"
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    # Renamed into place, so an interrupted write never loses the previous manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def convert_all(input_dir, output_dir, workers=None, use_hash=False, quality=QUALITY, max_size=MAX_SIZE):
+    """
+    Converts every .bmp of input_dir that has no up-to-date .jpg in output_dir,
+    across a pool of processes, and prints the throughput. Images that cannot be
+    converted are reported and the others converted anyway.
+
+    Returns:
+    - list of the images that could not be converted
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    manifest = load_manifest(manifest_path) if use_hash else {}
+    settings = {'quality': quality, 'max_size': list(max_size) if max_size else None}
+
+    jobs = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.lower().endswith(".bmp"):
+            continue
         bmp_path = os.path.join(input_dir, filename)
         jpg_path = os.path.join(output_dir, os.path.splitext(filename)[0] + ".jpg")
+        jobs.append((bmp_path, jpg_path, quality, max_size, settings, use_hash, manifest.get(filename)))
+
+    start = time.perf_counter()
+    read = 0
+    converted = 0
+    skipped = 0
+    failed = []
+    try:
+        if jobs:
+            with multiprocessing.Pool(min(workers or os.cpu_count() or 1, len(jobs))) as pool:
+                for bmp_path, was_converted, size, sha256, error in pool.imap_unordered(process, jobs):
+                    if error is not None:
+                        failed.append(bmp_path)
+                        print(f"Failed: {bmp_path}: {error}")
+                        continue
+                    if sha256 is not None:
+                        manifest[os.path.basename(bmp_path)] = {'sha256': sha256, 'settings': settings}
+                    if was_converted:
+                        converted += 1
+                        read += size
+                        print(f"Converted: {bmp_path}")
+                    else:
+                        skipped += 1
+    finally:
+        # Also after a failure or an interruption, for the images converted so far
+        if use_hash:
+            save_manifest(manifest_path, manifest)
+    elapsed = time.perf_counter() - start
+
+    rate = f", {converted / elapsed:.1f} images/s, {read / elapsed / 1e6:.1f} MB/s" if converted and elapsed > 0 else ""
+    print(f"Batch conversion complete! {converted} converted, {skipped} up to date, {len(failed)} failed, "
+          f"{read / 1e6:.1f} MB in {elapsed:.2f} s{rate}")
+    return failed
 
-        # Open and convert the image
-        with Image.open(bmp_path) as img:
-            img.convert("RGB").save(jpg_path, "JPEG")
-            print(f"Converted: {bmp_path} -> {jpg_path}")
 
-print("Batch conversion complete!")
+if __name__ == "__main__":
+    # python bmp2jpg.py [INPUT_DIR [OUTPUT_DIR]] [--hash]
+    # --hash: skip files by content instead of by modification time
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if args:
+        input_dir = args[0]
+        output_dir = args[1] if len(args) > 1 else input_dir
+    failed = convert_all(input_dir, output_dir, use_hash="--hash" in sys.argv)
+    sys.exit(1 if failed else 0)
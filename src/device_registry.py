@@ -0,0 +1,219 @@
+import glob
+import os
+import time
+from collections import namedtuple
+
+try:
+    import hid  # optional, for the HID paths used by pyjoycon
+except ImportError:
+    hid = None
+
+try:
+    import pyudev  # optional, for hotplug notifications
+except ImportError:
+    pyudev = None
+
+# Same IDs as in hid_testing.py
+JOYCON_VENDOR_ID = 0x057E
+JOYCON_L_PRODUCT_ID = 0x2006
+JOYCON_R_PRODUCT_ID = 0x2007
+JOYCON_PRODUCT_IDS = (JOYCON_L_PRODUCT_ID, JOYCON_R_PRODUCT_ID)
+
+SYSFS_INPUT = "/sys/class/input"
+INPUT_PROP_ACCELEROMETER = 0x06  # same value as evdev.ecodes.INPUT_PROP_ACCELEROMETER
+
+def serial_key(serial):
+    """
+    Normalizes a controller serial to a key, e.g. of the registry or of the calibration
+    cache. The serial that hid_testing.get_device_ids reports for a Bluetooth Joy-Con is
+    its Bluetooth address, which evdev exposes as the `uniq` of its input nodes, with or
+    without separators and in either case.
+    """
+    return serial.replace(':', '').replace('-', '').lower() if serial else None
+
+
+# One evdev node as described by sysfs
+InputNode = namedtuple('InputNode', 'path name vendor product uniq accelerometer')
+
+
+class JoyConNodes(namedtuple('JoyConNodes', 'serial product_id hid_path hid_serial buttons_node imu_node')):
+    """
+    Every node of one Joy-Con: the hidraw path and serial string used by pyjoycon and
+    the evdev nodes of its buttons and of its IMU, None for the ones that are not there.
+    """
+
+    @property
+    def side(self):
+        return 'L' if self.product_id == JOYCON_L_PRODUCT_ID else 'R'
+
+    @property
+    def device_id(self):
+        """(vendor_id, product_id, serial_number), like hid_testing.get_device_ids"""
+        return (JOYCON_VENDOR_ID, self.product_id, self.hid_serial)
+
+
+def _read_attribute(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def _serial(uniq):
+    # hidapi and evdev report the Bluetooth address with different case
+    return uniq.lower() if uniq else None
+
+
+def scan_input_nodes(sysfs=SYSFS_INPUT):
+    """
+    Lists the evdev nodes of the Joy-Cons from sysfs, without opening the devices
+    (no permissions needed, no ioctl per device).
+    """
+    nodes = []
+    for event_dir in glob.glob(os.path.join(sysfs, "event*")):
+        device_dir = os.path.join(event_dir, "device")
+        vendor = _read_attribute(os.path.join(device_dir, "id", "vendor"))
+        product = _read_attribute(os.path.join(device_dir, "id", "product"))
+        try:
+            vendor, product = int(vendor, 16), int(product, 16)
+        except ValueError:
+            continue
+        if vendor != JOYCON_VENDOR_ID or product not in JOYCON_PRODUCT_IDS:
+            continue
+        # Bitmap of input properties, as hex words with the lowest bits last
+        properties = _read_attribute(os.path.join(device_dir, "properties")).split()
+        props = int(properties[-1], 16) if properties else 0
+        nodes.append(InputNode(
+            path=os.path.join("/dev/input", os.path.basename(event_dir)),
+            name=_read_attribute(os.path.join(device_dir, "name")),
+            vendor=vendor,
+            product=product,
+            uniq=_serial(_read_attribute(os.path.join(device_dir, "uniq"))),
+            accelerometer=bool(props & (1 << INPUT_PROP_ACCELEROMETER)),
+        ))
+    return sorted(nodes, key=lambda node: _node_number(node.path))
+
+
+def _node_number(path):
+    return int(path.rsplit("event", 1)[-1])
+
+
+class DeviceRegistry:
+    """
+    Index of the connected Joy-Cons by serial (Bluetooth address), built once from
+    sysfs and hidapi and only rebuilt when an input or hidraw device is added or
+    removed (udev notifications through pyudev, see poll()) or on refresh().
+
+    Parameters:
+    - hotplug: watch udev for new and removed devices, if pyudev is installed
+    - sysfs: sysfs directory of the input devices
+    """
+
+    def __init__(self, hotplug=True, sysfs=SYSFS_INPUT):
+        self.sysfs = sysfs
+        self.by_serial = {}  # by serial_key(serial)
+        self.refresh_time = 0.0  # s taken by the last refresh
+        self._monitor = None
+        if hotplug and pyudev is not None:
+            self._monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            self._monitor.filter_by('input')
+            self._monitor.filter_by('hidraw')
+            self._monitor.start()
+        self.refresh()
+
+    def refresh(self):
+        """Enumerates the Joy-Cons again."""
+        start = time.perf_counter()
+        by_serial = {}
+
+        def update(serial, product_id, **nodes):
+            key = serial_key(serial)
+            entry = by_serial.get(key) or JoyConNodes(serial, product_id, None, None, None, None)
+            by_serial[key] = entry._replace(**nodes)
+
+        # Only the Nintendo devices, not every HID device of the host
+        if hid is not None:
+            for device in hid.enumerate(JOYCON_VENDOR_ID, 0):
+                hid_serial = device.get('serial') or device.get('serial_number')
+                serial = _serial(hid_serial)
+                if device['product_id'] not in JOYCON_PRODUCT_IDS or not serial:
+                    continue
+                update(serial, device['product_id'], hid_path=device['path'], hid_serial=hid_serial)
+
+        for node in scan_input_nodes(self.sysfs):
+            if not node.uniq:
+                continue
+            if node.accelerometer:
+                update(node.uniq, node.product, imu_node=node.path)
+            else:
+                update(node.uniq, node.product, buttons_node=node.path)
+
+        self.by_serial = by_serial
+        self.refresh_time = time.perf_counter() - start
+
+    def fileno(self):
+        """File descriptor of the udev monitor, to wait for hotplug events (e.g. in a selector); None without pyudev."""
+        return self._monitor.fileno() if self._monitor is not None else None
+
+    def poll(self):
+        """Handles pending hotplug notifications; returns True if the registry was rebuilt."""
+        if self._monitor is None:
+            return False
+        changed = False
+        for udev_device in iter(lambda: self._monitor.poll(0), None):
+            changed |= udev_device.action in ('add', 'remove')
+        if changed:
+            self.refresh()
+        return changed
+
+    def joycons(self, side=None):
+        """Every known Joy-Con, or only the 'L' or 'R' ones, sorted by serial."""
+        self.poll()
+        return [nodes for _, nodes in sorted(self.by_serial.items())
+                if side is None or nodes.side == side.upper()]
+
+    def lookup(self, serial):
+        """Nodes of the Joy-Con with the given serial, None if it is not connected."""
+        self.poll()
+        return self.by_serial.get(serial_key(serial))
+
+    def imu_nodes(self, side=None):
+        """Evdev paths of the IMU nodes, as myJoyCon and JoyConHub take them."""
+        return [nodes.imu_node for nodes in self.joycons(side) if nodes.imu_node]
+
+    def get_device_ids(self):
+        """Same as hid_testing.get_device_ids, from the index; only the Joy-Cons seen through hidapi."""
+        return [nodes.device_id for nodes in self.joycons() if nodes.hid_path]
+
+    def get_R_id(self):
+        ids = [nodes.device_id for nodes in self.joycons('R') if nodes.hid_path]
+        return ids[0] if ids else (None, None, None)
+
+    def get_L_id(self):
+        ids = [nodes.device_id for nodes in self.joycons('L') if nodes.hid_path]
+        return ids[0] if ids else (None, None, None)
+
+    def close(self):
+        if self._monitor is not None:
+            self._monitor.stop()
+            self._monitor = None
+
+
+_registry = None
+
+
+def get_registry():
+    """Shared DeviceRegistry of the process, created on first use."""
+    global _registry
+    if _registry is None:
+        _registry = DeviceRegistry()
+    return _registry
+
+
+if __name__ == "__main__":
+    registry = get_registry()
+    print(f"Enumerated in {registry.refresh_time * 1000:.1f} ms")
+    for nodes in registry.joycons():
+        print(f"Joy-Con ({nodes.side}) {nodes.serial}: hid {nodes.hid_path!r}, "
+              f"buttons {nodes.buttons_node}, IMU {nodes.imu_node}")
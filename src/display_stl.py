@@ -1,10 +1,12 @@
-from stl import mesh
+import os
+import sys
 from mpl_toolkits import mplot3d
 from matplotlib import pyplot
+from mesh_lod import CAD_DIR, joycon_lods, load_lods
 
 # Create a new plot
 figure = pyplot.figure()
-axes = mplot3d.Axes3D(figure)
+axes = figure.add_subplot(111, projection="3d")
 
 # Colors
 neon_red = (255 / 255, 60 / 255, 40 / 255)  # Nintendo Switch Neon Joy-Con Red
@@ -12,32 +14,42 @@ neon_blue = (10 / 255, 185 / 255, 230 / 255)  # Nintendo Switch Neon Joy-Con Blu
 
 alpha = 1
 
-# Load the STL files and add the vectors to the plot
-JoyCon_L = mesh.Mesh.from_file("./CAD/JoyCon_L_xs.stl")
+# Level of detail to show, 0 is the full mesh (see mesh_lod.DEFAULT_LEVELS). By default
+# the light CAD/JoyCon_[LR]_xs.stl meshes (~4000 triangles) shown before the levels existed
+level = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+
+def load_mesh(side):
+    if level is None:
+        return load_lods(os.path.join(CAD_DIR, f"JoyCon_{side}_xs.stl"), (1.0,))[0]
+    return joycon_lods(side)[level]
+
+
+# Load the meshes (cached after the first run) and add the faces to the plot,
+# shaded instead of outlined: edge lines cost more to draw than the faces.
+# Side by side along Y, as in joy_con_gui
+JoyCon_L = load_mesh('L')
+JoyCon_L_faces = JoyCon_L.faces + (0, 60, 0)
 axes.add_collection3d(mplot3d.art3d.Poly3DCollection(
-                        JoyCon_L.vectors, 
-                        # shade=True, 
-                        # lightsource = mplot3d.art3d.LightSource(azdeg=315, altdeg=45),
-                        facecolors=neon_red, 
-                        linewidths=1, 
-                        edgecolors="black", 
-                        alpha=alpha)
+                        JoyCon_L_faces,
+                        facecolors=JoyCon_L.face_colors(neon_red, alpha),
+                        linewidths=0,
+                        edgecolors="none")
                         )
 
-JoyCon_R = mesh.Mesh.from_file("./CAD/JoyCon_R_xs.stl")
+JoyCon_R = load_mesh('R')
+JoyCon_R_faces = JoyCon_R.faces + (0, -60, 0)
 axes.add_collection3d(mplot3d.art3d.Poly3DCollection(
-                        JoyCon_R.vectors, 
-                        # shade=True, 
-                        # lightsource = mplot3d.art3d.LightSource(azdeg=315, altdeg=45),
-                        facecolors=neon_blue, 
-                        linewidths=1, 
-                        edgecolors="black", 
-                        alpha=alpha)
+                        JoyCon_R_faces,
+                        facecolors=JoyCon_R.face_colors(neon_blue, alpha),
+                        linewidths=0,
+                        edgecolors="none")
                         )
+print(f"{'xs meshes' if level is None else f'Level {level}'}: {len(JoyCon_L)} + {len(JoyCon_R)} triangles")
 
 # Auto scale to the mesh size
-scale = JoyCon_L.points.flatten()
+scale = [JoyCon_R_faces.min(), JoyCon_L_faces.max()]
 axes.auto_scale_xyz(scale, scale, scale)
 
 # Show the plot to the screen
-pyplot.show()
\ No newline at end of file
+pyplot.show()
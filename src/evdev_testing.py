@@ -1,9 +1,15 @@
 import evdev
+import sys
+from device_registry import get_registry
 
-# Adjust to your event numbers (check evtest output)
-joycon_left_IMU_path = "/dev/input/event20"
-joycon_right_IMU_path = "/dev/input/event22"
-joycon_combined_path = "/dev/input/event23"
+# Found from sysfs, no need to check the event numbers with evtest
+joycons_left = get_registry().joycons('L')
+if not joycons_left or joycons_left[0].imu_node is None:
+    print("Error: left Joy-Con not found. Ensure Bluetooth is enabled and the Joy-Con is paired.")
+    sys.exit(1)
+joycon_left_nodes = joycons_left[0]
+joycon_left_IMU_path = joycon_left_nodes.imu_node
+joycon_left_buttons_path = joycon_left_nodes.buttons_node
 
 # Open the left Joy-Con device
 joycon_left = evdev.InputDevice(joycon_left_IMU_path)
@@ -0,0 +1,237 @@
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import numpy as np
+from orientation_filters import OrientationFilter, make_filter
+from shm_ring import ShmRing
+
+# Calibrated samples sent to the workers; dt is NaN for a filter reset
+FRAME_DTYPE = np.dtype([
+    ('t', '<f8'),            # timestamp of the sample, s
+    ('dt', '<f8'),
+    ('accel', '<f8', (3,)),  # G
+    ('gyro', '<f8', (3,)),   # deg/s
+])
+
+# Every filtered frame, with its orientation; none for the resets
+ORIENTATION_DTYPE = np.dtype([
+    ('seq', '<i8'),                # index of the frame in the device's frame ring
+    ('t', '<f8'),
+    ('accel', '<f8', (3,)),
+    ('gyro', '<f8', (3,)),
+    ('orientation', '<f8', (3,)),  # roll, pitch, yaw in degrees
+])
+
+
+class RemoteEstimator(OrientationFilter):
+    """
+    Orientation filter of one Joy-Con that runs in a FilterPool worker process.
+
+    The filter math is not done by the ingestion thread: the samples are appended
+    to the device's frame ring, and the worker sends every sample back with its
+    orientation once it has filtered it, typically one poll of the worker later
+    (under a millisecond). So the estimator is deferred: filter_samples() returns
+    the samples the worker has finished since the previous call, with the
+    timestamps they were taken at, which myJoyCon publishes instead of the samples
+    just given. update() and update_many() return the latest orientation available,
+    which is that of an earlier sample.
+    """
+
+    deferred = True
+
+    def __init__(self, frames, orientations):
+        self.frames = frames
+        self.orientations = orientations  # read from the position they were at when created
+        self.orientation = (0.0, 0.0, 0.0)
+        self._frame = np.zeros((), dtype=FRAME_DTYPE)
+
+    def _latest(self):
+        record = self.orientations.latest()
+        if record is not None:
+            self.orientation = tuple(record['orientation'].tolist())
+        return self.orientation
+
+    def _send(self, t, accel, gyro, dt):
+        frame = self._frame
+        frame['t'] = t
+        frame['dt'] = dt
+        frame['accel'] = accel
+        frame['gyro'] = gyro
+        self.frames.write(frame)
+
+    def _send_many(self, t, accel, gyro, dt):
+        frames = np.empty(len(dt), dtype=FRAME_DTYPE)
+        frames['t'] = t
+        frames['dt'] = dt
+        frames['accel'] = accel
+        frames['gyro'] = gyro
+        self.frames.write_many(frames)
+
+    def update(self, accel, gyro, dt):
+        self._send(math.nan, accel, gyro, dt)
+        return self._latest()
+
+    def update_many(self, accel, gyro, dt):
+        self._send_many(math.nan, accel, gyro, dt)
+        out = np.empty((len(dt), 3))
+        out[:] = self._latest()
+        return out
+
+    def filter_samples(self, t, accel, gyro, dt):
+        if len(t) == 1:
+            self._send(t[0], accel[0], gyro[0], dt[0])
+        else:
+            self._send_many(t, accel, gyro, dt)
+        done = self.orientations.read()
+        return done['t'], done['accel'], done['gyro'], done['orientation']
+
+    def reset(self):
+        self._send(math.nan, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), math.nan)
+
+
+def _filter_frames(estimator, frames):
+    """Runs a batch of frames through an estimator, resetting it at every NaN dt."""
+    dt = frames['dt']
+    out = np.zeros((len(frames), 3))
+    resets = np.flatnonzero(np.isnan(dt))
+    start = 0
+    for stop in (*resets, len(frames)):
+        if stop > start:
+            out[start:stop] = estimator.update_many(frames['accel'][start:stop], frames['gyro'][start:stop],
+                                                    dt[start:stop])
+        if stop < len(frames):
+            estimator.reset()
+            out[stop] = out[stop - 1] if stop > 0 else 0.0
+        start = stop + 1
+    return out
+
+
+def _run_worker(devices, stop, idle_sleep):
+    """
+    Worker process: filters the frames of its devices and writes the orientations back.
+    New devices arrive as (frames ring name, orientations ring name, estimator, params)
+    through the `devices` queue.
+    """
+    filters = []  # (frame ring, orientation ring, estimator)
+    try:
+        while not stop.is_set():
+            try:
+                while True:
+                    frames_name, orientations_name, name, params = devices.get_nowait()
+                    filters.append((ShmRing(FRAME_DTYPE, name=frames_name, oldest=True),
+                                    ShmRing(ORIENTATION_DTYPE, name=orientations_name),
+                                    make_filter(name, **params)))
+            except queue.Empty:
+                pass
+
+            busy = False
+            for frames, orientations, estimator in filters:
+                batch = frames.read()
+                if len(batch) == 0:
+                    continue
+                busy = True
+                filtered = ~np.isnan(batch['dt'])
+                records = np.empty(len(batch), dtype=ORIENTATION_DTYPE)
+                records['seq'] = np.arange(frames.position - len(batch), frames.position)
+                records['t'] = batch['t']
+                records['accel'] = batch['accel']
+                records['gyro'] = batch['gyro']
+                records['orientation'] = _filter_frames(estimator, batch)
+                orientations.write_many(records[filtered])
+            if not busy:
+                time.sleep(idle_sleep)
+    finally:
+        for frames, orientations, _ in filters:
+            frames.close()
+            orientations.close()
+
+
+class FilterPool:
+    """
+    Runs the orientation filters of many Joy-Cons in worker processes, so the filter
+    math uses several cores instead of sharing the GIL with the ingestion loop.
+
+    Each device gets a frame ring and an orientation ring in shared memory
+    (shm_ring.ShmRing): the ingestion side writes calibrated samples and reads
+    orientations, the worker the other way round, with no pickling per sample.
+    Devices are spread over the workers in turn, so a worker filters a group of them.
+
+    Use estimator() as the estimator of a myJoyCon (see myJoyCon.set_estimator).
+
+    Parameters:
+    - workers: number of worker processes, one per core by default
+    - capacity: frames kept per ring (1024 is ~5 s at 200 Hz)
+    - idle_sleep: seconds a worker sleeps when none of its devices had new frames
+    """
+
+    def __init__(self, workers=None, capacity=1024, idle_sleep=0.0005):
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = capacity
+        # spawn: do not fork the ingestion threads and open devices into the workers
+        context = multiprocessing.get_context('spawn')
+        self._stop = context.Event()
+        self._queues = [context.Queue() for _ in range(self.workers)]
+        self._processes = [context.Process(target=_run_worker, args=(q, self._stop, idle_sleep),
+                                           name=f"FilterPool-{i}", daemon=True)
+                           for i, q in enumerate(self._queues)]
+        self._rings = []
+        for process in self._processes:
+            process.start()
+
+    def estimator(self, name='complementary', **params):
+        """Returns a RemoteEstimator running the orientation filter `name` in the next worker."""
+        frames = ShmRing(FRAME_DTYPE, self.capacity)
+        orientations = ShmRing(ORIENTATION_DTYPE, self.capacity)
+        self._rings += [frames, orientations]
+        worker = (len(self._rings) // 2 - 1) % self.workers
+        self._queues[worker].put((frames.name, orientations.name, name, params))
+        return RemoteEstimator(frames, orientations)
+
+    def close(self):
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        for ring in self._rings:
+            ring.close()
+        self._rings = []
+
+
+def benchmark(n_devices=8, n_frames=20000, workers=None, estimator='madgwick'):
+    """
+    Filters `n_frames` synthetic frames on each of `n_devices` devices and returns
+    the throughput in frames per second.
+    """
+    rng = np.random.default_rng(0)
+    frames = np.empty(n_frames, dtype=FRAME_DTYPE)
+    frames['t'] = np.arange(n_frames) * 0.005
+    frames['dt'] = 0.005
+    frames['accel'] = rng.normal((0.0, 0.0, 1.0), 0.05, (n_frames, 3))
+    frames['gyro'] = rng.normal(0.0, 20.0, (n_frames, 3))
+
+    pool = FilterPool(workers, capacity=2 * n_frames)
+    try:
+        estimators = [pool.estimator(estimator) for _ in range(n_devices)]
+        start = time.perf_counter()
+        for remote in estimators:
+            remote.frames.write_many(frames)
+        # Wait until every frame has been filtered
+        for remote in estimators:
+            while (remote.orientations.latest() is None
+                   or remote.orientations.latest()['seq'] < n_frames - 1):
+                time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.close()
+    return n_devices * n_frames / elapsed
+
+
+if __name__ == "__main__":
+    n_devices = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        rate = benchmark(n_devices, workers=workers)
+        print(f"{workers: >2} workers: {rate / 1000: >7.1f} k frames/s ({rate / 200: >5.0f} Joy-Cons at 200 Hz)")
@@ -0,0 +1,146 @@
+import time
+import numpy as np
+from joycon_geometry import JOYCON_MODEL, JOYCON_SIZE, brick_frames, pose_faces
+from mesh_lod import PosedMesh, joycon_lods, view_vector
+
+N_CONTROLLERS = 8
+N_FRAMES = 500
+
+
+def legacy_orientation_vector_from_rpy(roll, pitch, yaw):
+    """The original joy_con_gui.orientation_vector_from_rpy, kept as the benchmark baseline."""
+    reference_vector = np.array([0, 0, 1])
+
+    Rz_yaw = np.array([
+        [np.cos(yaw), -np.sin(yaw), 0],
+        [np.sin(yaw),  np.cos(yaw), 0],
+        [0,            0,           1]
+    ])
+
+    Ry_pitch = np.array([
+        [ np.cos(pitch), 0, np.sin(pitch)],
+        [ 0,             1, 0           ],
+        [-np.sin(pitch), 0, np.cos(pitch)]
+    ])
+
+    Rx_roll = np.array([
+        [1, 0,           0          ],
+        [0, np.cos(roll), -np.sin(roll)],
+        [0, np.sin(roll),  np.cos(roll)]
+    ])
+
+    R = Rz_yaw @ Ry_pitch @ Rx_roll
+    oriented_vector = R @ reference_vector
+    oriented_vector /= np.linalg.norm(oriented_vector)
+    return oriented_vector
+
+
+def legacy_brick_faces(cog, roll, pitch, yaw, length, width, height):
+    """The vertex computation of the original joy_con_gui.draw_brick, without the drawing."""
+    normal = legacy_orientation_vector_from_rpy(roll, pitch, yaw)
+    normal = normal / np.linalg.norm(normal)
+
+    z_axis = normal
+    x_axis = np.array([1, 0, 0])
+    if np.allclose(z_axis, x_axis):
+        x_axis = np.array([0, 1, 0])
+    x_axis = np.cross(z_axis, x_axis)
+    x_axis /= np.linalg.norm(x_axis)
+    y_axis = np.cross(z_axis, x_axis)
+    y_axis /= np.linalg.norm(y_axis)
+
+    l2, w2, h2 = length / 2, width / 2, height / 2
+    local_vertices = np.array(
+        [
+            [-l2, -w2, -h2],
+            [l2, -w2, -h2],
+            [l2, w2, -h2],
+            [-l2, w2, -h2],
+            [-l2, -w2, h2],
+            [l2, -w2, h2],
+            [l2, w2, h2],
+            [-l2, w2, h2],
+        ]
+    )
+
+    transformation_matrix = np.column_stack((x_axis, y_axis, z_axis))
+    global_vertices = np.dot(local_vertices, transformation_matrix.T) + cog
+
+    faces = [
+        [global_vertices[i] for i in [0, 1, 2, 3]],
+        [global_vertices[i] for i in [4, 5, 6, 7]],
+        [global_vertices[i] for i in [0, 1, 5, 4]],
+        [global_vertices[i] for i in [1, 2, 6, 5]],
+        [global_vertices[i] for i in [2, 3, 7, 6]],
+        [global_vertices[i] for i in [3, 0, 4, 7]],
+    ]
+    return [[list(vertex) for vertex in face] for face in faces]
+
+
+def make_poses(n_frames, n_controllers):
+    """Random roll and pitch (rad) with zero yaw, and the CoGs used by joy_con_gui."""
+    rng = np.random.default_rng(0)
+    roll = rng.uniform(-np.pi, np.pi, (n_frames, n_controllers))
+    pitch = rng.uniform(-np.pi / 2, np.pi / 2, (n_frames, n_controllers))
+    cogs = np.array([[0, 120 * ((n_controllers - 1) / 2 - i), 0] for i in range(n_controllers)], dtype=float)
+    return roll, pitch, cogs
+
+
+if __name__ == "__main__":
+    roll, pitch, cogs = make_poses(N_FRAMES, N_CONTROLLERS)
+    n_bricks = roll.size
+
+    start = time.perf_counter()
+    reference = np.array([[legacy_brick_faces(cogs[c], roll[f, c], pitch[f, c], 0.0, *JOYCON_SIZE)
+                           for c in range(N_CONTROLLERS)] for f in range(N_FRAMES)])
+    legacy_us = (time.perf_counter() - start) / n_bricks * 1e6
+
+    # One controller at a time, as the renderer did before
+    start = time.perf_counter()
+    for f in range(N_FRAMES):
+        for c in range(N_CONTROLLERS):
+            pose_faces(JOYCON_MODEL, brick_frames(roll[f, c], pitch[f, c], 0.0), cogs[c])
+    single_us = (time.perf_counter() - start) / n_bricks * 1e6
+
+    # All the controllers of a frame in one call, as JoyConRenderer.update does
+    out = np.empty((N_CONTROLLERS, 6, 4, 3))
+    start = time.perf_counter()
+    for f in range(N_FRAMES):
+        pose_faces(JOYCON_MODEL, brick_frames(roll[f], pitch[f], 0.0), cogs, out=out)
+    frame_us = (time.perf_counter() - start) / n_bricks * 1e6
+
+    # Every controller and frame in one einsum
+    start = time.perf_counter()
+    batch = pose_faces(JOYCON_MODEL, brick_frames(roll, pitch, 0.0), cogs)
+    batch_us = (time.perf_counter() - start) / n_bricks * 1e6
+
+    error = np.abs(batch - reference).max()
+    print(f"{N_CONTROLLERS} controllers x {N_FRAMES} frames, max error vs legacy {error:.1e} mm")
+    print(f"{'implementation': <16} {'us/brick': >10} {'speedup': >8}")
+    for name, us in (("legacy", legacy_us), ("per brick", single_us),
+                     ("per frame", frame_us), ("whole batch", batch_us)):
+        print(f"{name: <16} {us: >10.2f} {legacy_us / us: >7.1f}x")
+
+    # STL mesh of a Joy-Con: every corner of every triangle posed, or the PosedMesh render stage
+    model = joycon_lods('L')[0]
+    frames = brick_frames(roll, pitch, 0.0)
+    start = time.perf_counter()
+    for f in range(N_FRAMES):
+        for c in range(N_CONTROLLERS):
+            pose_faces(model, frames[f, c], cogs[c])
+    corners_us = (time.perf_counter() - start) / n_bricks * 1e6
+
+    mesh = PosedMesh(model, (1.0, 0.0, 0.0))
+    view = view_vector(30, -60)  # default view of a matplotlib 3D axis
+    visible = 0
+    start = time.perf_counter()
+    for f in range(N_FRAMES):
+        for c in range(N_CONTROLLERS):
+            visible += len(mesh.pose(frames[f, c], cogs[c], view))
+            mesh.face_colors()
+    culled_us = (time.perf_counter() - start) / n_bricks * 1e6
+
+    print(f"\nMesh of {len(model)} triangles, {visible / n_bricks / len(model):.0%} of them kept by culling")
+    print(f"{'implementation': <16} {'us/mesh': >10} {'speedup': >8}")
+    for name, us in (("all corners", corners_us), ("culled", culled_us)):
+        print(f"{name: <16} {us: >10.1f} {corners_us / us: >7.1f}x")
@@ -1,4 +1,5 @@
 import hid
+from device_registry import get_registry
 
 JOYCON_VENDOR_ID    = 0x057E
 JOYCON_L_PRODUCT_ID = 0x2006
@@ -9,9 +10,11 @@ def get_device_ids(debug=False):
     """
     returns a list of tuples like `(vendor_id, product_id, serial_number)`
     """
-    devices = hid.enumerate(0, 0)
-    print (devices)
-    
+    # Only the Nintendo devices, not every HID device of the host
+    devices = hid.enumerate(JOYCON_VENDOR_ID, 0)
+    if debug:
+        print(devices)
+
     out = []
     for device in devices:
         vendor_id      = device["vendor_id"]
@@ -51,7 +54,12 @@ def get_ids_of_type(lr, **kw):
         product_id = JOYCON_L_PRODUCT_ID
     else:
         product_id = JOYCON_R_PRODUCT_ID
-    return [i for i in get_device_ids(**kw) if i[1] == product_id]
+    if kw:
+        ids = get_device_ids(**kw)
+    else:
+        # Cached enumeration, rebuilt on hotplug only
+        ids = get_registry().get_device_ids()
+    return [i for i in ids if i[1] == product_id]
 
 
 def get_R_ids(**kw):
@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import time
+import numpy as np
+from device_registry import serial_key
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "joycon_calibration.json")
+
+
+class GyroCalibrator:
+    """
+    Estimates the gyro bias and the accelerometer scale of a Joy-Con while it is in use.
+
+    Samples are grouped in blocks of `block_size` with running sums. A block in which the
+    gyro and accel barely vary (standard deviation under the thresholds on every axis) was
+    taken while the controller rested: its mean gyro rate is the bias, and its mean accel
+    magnitude is 1 G. Every stationary block refines the estimates as a running mean,
+    which after `max_blocks` blocks turns into an exponential average to follow slow
+    drift (e.g. with temperature).
+
+    Parameters:
+    - block_size: samples per block (200 is 1 s at the Joy-Con IMU rate)
+    - gyro_threshold: largest gyro standard deviation of a stationary block (deg/s)
+    - accel_threshold: largest accel standard deviation of a stationary block (G)
+    - max_blocks: weight limit of the previous estimate
+    """
+
+    def __init__(self, block_size=200, gyro_threshold=0.5, accel_threshold=0.01, max_blocks=20):
+        self.block_size = block_size
+        self.gyro_threshold = gyro_threshold
+        self.accel_threshold = accel_threshold
+        self.max_blocks = max_blocks
+        self.reset()
+
+    def reset(self):
+        """Forgets the calibration."""
+        self.gyro_bias = (0.0, 0.0, 0.0)  # deg/s
+        self.accel_scale = 1.0
+        self.blocks = 0  # stationary blocks behind the estimates
+        self.updated = False  # True when a block changed the estimates, cleared by the owner
+        self._start_block()
+
+    def _start_block(self):
+        # Running sums of accel xyz, gyro xyz and their squares, as plain floats for the per-sample path
+        self._n = 0
+        self._sum = [0.0] * 6
+        self._sum_sq = [0.0] * 6
+
+    def load(self, gyro_bias, accel_scale, blocks):
+        """Starts from a known calibration, e.g. from a CalibrationCache."""
+        self.gyro_bias = tuple(float(b) for b in gyro_bias)
+        self.accel_scale = float(accel_scale)
+        self.blocks = int(blocks)
+
+    @property
+    def calibrated(self):
+        return self.blocks > 0
+
+    def correct(self, accel, gyro):
+        """
+        Observes one sample, accel in G and gyro in deg/s as (x, y, z), and returns it
+        corrected as two tuples.
+        """
+        bx, by, bz = self.gyro_bias
+        scale = self.accel_scale
+        corrected = ((accel[0] * scale, accel[1] * scale, accel[2] * scale),
+                     (gyro[0] - bx, gyro[1] - by, gyro[2] - bz))
+        s, sq = self._sum, self._sum_sq
+        for i, x in enumerate((*accel, *gyro)):
+            s[i] += x
+            sq[i] += x * x
+        self._n += 1
+        if self._n == self.block_size:
+            self._end_block()
+        return corrected
+
+    def correct_many(self, accel, gyro):
+        """
+        Same as correct() for (N, 3) arrays of samples; returns the corrected arrays.
+        A block that ends within the batch only applies to the samples after it.
+        """
+        imu = np.concatenate((accel, gyro), axis=1)
+        out = np.empty_like(imu)
+        start = 0
+        while start < len(imu):
+            stop = min(len(imu), start + self.block_size - self._n)
+            chunk = imu[start:stop]
+            np.multiply(chunk[:, :3], self.accel_scale, out=out[start:stop, :3])
+            np.subtract(chunk[:, 3:], self.gyro_bias, out=out[start:stop, 3:])
+            self._sum = [a + b for a, b in zip(self._sum, chunk.sum(axis=0).tolist())]
+            self._sum_sq = [a + b for a, b in zip(self._sum_sq, (chunk * chunk).sum(axis=0).tolist())]
+            self._n += stop - start
+            if self._n == self.block_size:
+                self._end_block()
+            start = stop
+        return out[:, :3], out[:, 3:]
+
+    def _end_block(self):
+        n = self._n
+        mean = [x / n for x in self._sum]
+        var = [max(sq / n - m * m, 0.0) for sq, m in zip(self._sum_sq, mean)]
+        self._start_block()
+        if max(var[3:]) > self.gyro_threshold ** 2 or max(var[:3]) > self.accel_threshold ** 2:
+            return  # moving
+
+        gravity = math.sqrt(mean[0] ** 2 + mean[1] ** 2 + mean[2] ** 2)
+        if gravity == 0:
+            return
+        self.blocks += 1
+        weight = 1 / min(self.blocks, self.max_blocks)
+        self.gyro_bias = tuple(b + weight * (m - b) for b, m in zip(self.gyro_bias, mean[3:]))
+        self.accel_scale += weight * (1 / gravity - self.accel_scale)
+        self.updated = True
+
+    def as_dict(self):
+        return {
+            'gyro_bias': list(self.gyro_bias),
+            'accel_scale': self.accel_scale,
+            'blocks': self.blocks,
+        }
+
+
+class CalibrationCache:
+    """
+    Calibration of every known controller, stored as JSON and keyed by serial
+    (see device_registry.serial_key), so a controller starts calibrated from its last session.
+
+    Parameters:
+    - path: cache file, created on the first store()
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError:
+            print(f"Ignoring unreadable calibration cache {path}")
+            self.entries = {}
+
+    def apply(self, serial, calibrator):
+        """Loads the cached calibration of a controller into a GyroCalibrator; returns False if none."""
+        entry = self.entries.get(serial_key(serial))
+        if entry is None:
+            return False
+        calibrator.load(entry['gyro_bias'], entry['accel_scale'], entry['blocks'])
+        return True
+
+    def store(self, serial, calibrator):
+        """Saves the calibration of a controller."""
+        key = serial_key(serial)
+        if key is None:
+            return
+        self.entries[key] = dict(calibrator.as_dict(), updated=time.time())
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first, so a crash never leaves a truncated cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import evdev
+import numpy as np
+from imu_calibration import DEFAULT_CACHE_PATH, CalibrationCache, GyroCalibrator
+from sample_clock import use_monotonic_clock
+
+# File layout: a fixed-size header followed by fixed-width frames, appended as they arrive.
+# The header holds the device names and the calibration of every device when the recording
+# started; the recordings of version 1 have a smaller header, without the calibrations.
+MAGIC = b"JCIMU002"
+HEADER_SIZE = 1024
+_HEADER_SIZES = {b"JCIMU001": 256, MAGIC: HEADER_SIZE}
+
+FRAME_DTYPE = np.dtype([
+    ('t', '<f8'),             # kernel timestamp of the SYN_REPORT closing the IMU sample (s)
+    ('device', '<u4'),        # index in the list of device names stored in the header
+    ('buttons', '<u4'),       # bitmask of pressed buttons, bit i is BUTTON_CODES[i]
+    ('accel', '<i4', (3,)),   # raw ABS_X, ABS_Y, ABS_Z of the IMU node
+    ('gyro', '<i4', (3,)),    # raw ABS_RX, ABS_RY, ABS_RZ of the IMU node
+    ('stick', '<i2', (4,)),   # raw ABS_X, ABS_Y, ABS_RX, ABS_RY of the buttons node
+])
+
+IMU_CODES = (evdev.ecodes.ABS_X, evdev.ecodes.ABS_Y, evdev.ecodes.ABS_Z,
+             evdev.ecodes.ABS_RX, evdev.ecodes.ABS_RY, evdev.ecodes.ABS_RZ)
+STICK_CODES = (evdev.ecodes.ABS_X, evdev.ecodes.ABS_Y, evdev.ecodes.ABS_RX, evdev.ecodes.ABS_RY)
+BUTTON_CODES = (
+    evdev.ecodes.BTN_SOUTH, evdev.ecodes.BTN_EAST, evdev.ecodes.BTN_NORTH, evdev.ecodes.BTN_WEST,
+    evdev.ecodes.BTN_TL, evdev.ecodes.BTN_TR, evdev.ecodes.BTN_TL2, evdev.ecodes.BTN_TR2,
+    evdev.ecodes.BTN_SELECT, evdev.ecodes.BTN_START, evdev.ecodes.BTN_MODE, evdev.ecodes.BTN_Z,
+    evdev.ecodes.BTN_THUMBL, evdev.ecodes.BTN_THUMBR,
+    evdev.ecodes.BTN_DPAD_UP, evdev.ecodes.BTN_DPAD_DOWN, evdev.ecodes.BTN_DPAD_LEFT, evdev.ecodes.BTN_DPAD_RIGHT,
+    evdev.ecodes.BTN_TRIGGER_HAPPY1, evdev.ecodes.BTN_TRIGGER_HAPPY2,  # SL, SR
+)
+_BUTTON_BITS = {code: 1 << i for i, code in enumerate(BUTTON_CODES)}
+
+
+def _read_header(f):
+    """Returns the header of a recording as a dict, and its size in bytes."""
+    size = _HEADER_SIZES.get(f.read(len(MAGIC)))
+    raw = f.read(size - len(MAGIC)) if size else b""
+    if size is None or len(raw) != size - len(MAGIC):
+        raise ValueError("Not a Joy-Con IMU recording")
+    header = json.loads(raw.rstrip(b"\0"))
+    header.setdefault('calibrations', [None] * len(header['devices']))
+    return header, size
+
+
+class ImuRecorder:
+    """
+    Appends timestamped IMU frames of one or more Joy-Cons to a binary file.
+
+    Every frame has the fixed layout FRAME_DTYPE, so recordings can be opened
+    with numpy.memmap (see open_recording) without any parsing.
+
+    The frames are raw values. The calibration each Joy-Con had when the recording
+    started is kept in the header (see read_calibrations), so a replay corrects them
+    as myJoyCon did. Appending to a recording keeps the calibrations it started with.
+
+    Parameters:
+    - path: recording file, appended to if it exists
+    - device_names: name of every device
+    - calibrations: GyroCalibrator.as_dict() of every device, or None for a device
+                    (or all of them) without a calibration
+    """
+
+    def __init__(self, path, device_names, calibrations=None):
+        self.path = path
+        self.device_names = list(device_names)
+        self.buttons = [0] * len(self.device_names)
+        self.stick = [[0, 0, 0, 0] for _ in self.device_names]
+        self._frame = np.zeros(1, dtype=FRAME_DTYPE)
+        self.frames = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, 'r+b')
+            try:
+                header, header_size = _read_header(self.file)
+                if header['devices'] != self.device_names:
+                    raise ValueError(f"{path} was recorded with other devices: {header['devices']}")
+                # A recorder killed mid-write may have left a partial frame at the end:
+                # drop it, or every frame appended after it would be misaligned
+                n_frames = (os.path.getsize(path) - header_size) // FRAME_DTYPE.itemsize
+                self.file.truncate(header_size + n_frames * FRAME_DTYPE.itemsize)
+                self.file.seek(0, os.SEEK_END)
+            except Exception:
+                self.file.close()
+                raise
+        else:
+            if calibrations is None:
+                calibrations = [None] * len(self.device_names)
+            header = MAGIC + json.dumps({'devices': self.device_names, 'calibrations': list(calibrations)}).encode()
+            if len(header) > HEADER_SIZE:
+                raise ValueError("Too many devices for the recording header")
+            self.file = open(path, 'wb')
+            self.file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def write_frame(self, device, t, accel, gyro):
+        """Appends one IMU sample, together with the latest button and stick state of the device."""
+        frame = self._frame[0]
+        frame['t'] = t
+        frame['device'] = device
+        frame['buttons'] = self.buttons[device]
+        frame['accel'] = accel
+        frame['gyro'] = gyro
+        frame['stick'] = self.stick[device]
+        self.file.write(self._frame.tobytes())
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def record_imu(recorder, device, imu_device):
+    """Records every SYN_REPORT frame of an IMU node, the same frames myJoyCon.monitor filters."""
+    use_monotonic_clock(imu_device)
+    accel = [0, 0, 0]
+    gyro = [0, 0, 0]
+    frame_pending = False
+    async for event in imu_device.async_read_loop():
+        if event.type == evdev.ecodes.EV_ABS and event.code in IMU_CODES:
+            axis = IMU_CODES.index(event.code)
+            if axis < 3:
+                accel[axis] = event.value
+            else:
+                gyro[axis - 3] = event.value
+            frame_pending = True
+        elif event.type == evdev.ecodes.EV_SYN and event.code == evdev.ecodes.SYN_REPORT and frame_pending:
+            recorder.write_frame(device, event.timestamp(), accel, gyro)
+            frame_pending = False
+
+
+async def record_buttons(recorder, device, button_device):
+    """Tracks the buttons and sticks of a Joy-Con, which are stored with its next IMU frame."""
+    async for event in button_device.async_read_loop():
+        if event.type == evdev.ecodes.EV_KEY and event.code in _BUTTON_BITS:
+            if event.value:
+                recorder.buttons[device] |= _BUTTON_BITS[event.code]
+            else:
+                recorder.buttons[device] &= ~_BUTTON_BITS[event.code]
+        elif event.type == evdev.ecodes.EV_ABS and event.code in STICK_CODES:
+            recorder.stick[device][STICK_CODES.index(event.code)] = event.value
+
+
+def open_recording(path):
+    """
+    Opens a recording without reading it.
+
+    Returns:
+    - device_names: list of device names, indexed by the `device` field of the frames
+    - frames: read-only numpy.memmap of FRAME_DTYPE records
+    """
+    with open(path, 'rb') as f:
+        header, header_size = _read_header(f)
+    device_names = header['devices']
+    # A recorder killed mid-write may leave a partial frame at the end
+    n_frames = (os.path.getsize(path) - header_size) // FRAME_DTYPE.itemsize
+    if n_frames == 0:
+        return device_names, np.zeros(0, dtype=FRAME_DTYPE)
+    frames = np.memmap(path, dtype=FRAME_DTYPE, mode='r', offset=header_size, shape=(n_frames,))
+    return device_names, frames
+
+
+def read_calibrations(path):
+    """
+    Returns the calibration of every device of a recording when it started, as
+    GyroCalibrator.as_dict() or None for a device that had none (or an older recording).
+    """
+    with open(path, 'rb') as f:
+        header, _ = _read_header(f)
+    return header['calibrations']
+
+
+def device_frames(frames, device):
+    """
+    Returns the frames of one device as the (t, imu) arrays used by imu_replay,
+    with imu holding the raw accel xyz and gyro xyz values.
+    """
+    frames = frames[frames['device'] == device]
+    return frames['t'], np.concatenate((frames['accel'], frames['gyro']), axis=1)
+
+
+class PlaybackDevice:
+    """
+    Stand-in for the evdev.InputDevice of a Joy-Con IMU node that replays a recording,
+    so myJoyCon and the display scripts can run without hardware. myJoyCon starts from
+    the recorded `calibration` of the device.
+
+    Parameters:
+    - path: recording file
+    - device: name or index of the recorded device to play back
+    - realtime: if True, events are paced with the recorded timestamps
+    """
+
+    def __init__(self, path, device=0, realtime=False):
+        device_names, frames = open_recording(path)
+        if isinstance(device, str):
+            device = device_names.index(device)
+        self.path = path
+        self.name = device_names[device]
+        self.calibration = read_calibrations(path)[device]
+        self.fd = -1
+        self.realtime = realtime
+        self.frames = frames[frames['device'] == device]
+
+    def _events(self, frame):
+        sec = int(frame['t'])
+        usec = int(round((frame['t'] - sec) * 1e6))
+        for code, value in zip(IMU_CODES, (*frame['accel'], *frame['gyro'])):
+            yield evdev.InputEvent(sec, usec, evdev.ecodes.EV_ABS, code, int(value))
+        yield evdev.InputEvent(sec, usec, evdev.ecodes.EV_SYN, evdev.ecodes.SYN_REPORT, 0)
+
+    def read_loop(self):
+        start = time.monotonic()
+        for frame in self.frames:
+            if self.realtime:
+                time.sleep(max(0.0, frame['t'] - self.frames[0]['t'] - (time.monotonic() - start)))
+            yield from self._events(frame)
+
+    async def async_read_loop(self):
+        start = time.monotonic()
+        for frame in self.frames:
+            if self.realtime:
+                await asyncio.sleep(max(0.0, frame['t'] - self.frames[0]['t'] - (time.monotonic() - start)))
+            else:
+                await asyncio.sleep(0)  # let other tasks run between frames
+            for event in self._events(frame):
+                yield event
+
+    def close(self):
+        pass
+
+
+def playback_devices(path, realtime=True):
+    """Returns one PlaybackDevice per device stored in a recording."""
+    device_names, _ = open_recording(path)
+    return [PlaybackDevice(path, i, realtime) for i in range(len(device_names))]
+
+
+async def main(path, device_specs):
+    # Each device is given as IMU_PATH or IMU_PATH,BUTTONS_PATH
+    device_paths = [spec.split(',') for spec in device_specs]
+    imu_devices = [evdev.InputDevice(paths[0]) for paths in device_paths]
+    # The calibration myJoyCon would start from, for the replays to correct the frames as it does
+    cache = CalibrationCache(DEFAULT_CACHE_PATH)
+    calibrations = []
+    for device in imu_devices:
+        calibrator = GyroCalibrator()
+        calibrations.append(calibrator.as_dict() if cache.apply(device.uniq, calibrator) else None)
+    with ImuRecorder(path, [device.name for device in imu_devices], calibrations) as recorder:
+        tasks = []
+        for i, (paths, imu_device) in enumerate(zip(device_paths, imu_devices)):
+            print(f"Recording {imu_device.name} ({paths[0]}) to {path}")
+            tasks.append(record_imu(recorder, i, imu_device))
+            if len(paths) > 1:
+                tasks.append(record_buttons(recorder, i, evdev.InputDevice(paths[1])))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            print(f"\n{recorder.frames} frames recorded")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python imu_recorder.py OUTPUT IMU_PATH[,BUTTONS_PATH] ...")
+        print("   or: python imu_recorder.py --info RECORDING")
+    elif sys.argv[1] == "--info":
+        device_names, frames = open_recording(sys.argv[2])
+        for i, name in enumerate(device_names):
+            t = frames['t'][frames['device'] == i]
+            duration = t[-1] - t[0] if len(t) else 0.0
+            print(f"{i}: {name}: {len(t)} frames, {duration:.1f} s")
+    else:
+        try:
+            asyncio.run(main(sys.argv[1], sys.argv[2:]))
+        except KeyboardInterrupt:
+            pass
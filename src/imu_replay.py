@@ -0,0 +1,265 @@
+import os
+import re
+import sys
+import time
+import numpy as np
+from imu_calibration import GyroCalibrator
+from myjoycon import myJoyCon
+from raw_events import EV_ABS, EV_SYN, IMU_AXES, INPUT_EVENT_DTYPE, SYN_REPORT
+
+# str(evdev.InputEvent), as printed by evdev_testing.py
+_EVENT_LINE = re.compile(r"event at (\d+)\.(\d+), code (\d+), type (\d+), val (-?\d+)")
+
+
+def load_raw_events(path):
+    """
+    Loads a binary dump of struct input_event records (e.g. `cat /dev/input/event20 > imu.raw`),
+    recorded on a machine with the same word size as this one.
+    """
+    size = os.path.getsize(path)
+    if size % INPUT_EVENT_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a whole number of {INPUT_EVENT_DTYPE.itemsize}-byte input events "
+                         f"(recorded on a machine with another word size?)")
+    return np.fromfile(path, dtype=INPUT_EVENT_DTYPE)
+
+
+def load_event_log(path):
+    """
+    Loads a text log of evdev events, one `str(InputEvent)` per line, as printed by evdev_testing.py.
+    Lines that are not events are ignored.
+    """
+    with open(path) as f:
+        rows = [tuple(int(x) for x in m.groups()) for m in map(_EVENT_LINE.search, f) if m]
+    events = np.zeros(len(rows), dtype=INPUT_EVENT_DTYPE)
+    if rows:
+        sec, usec, code, type_, value = np.array(rows, dtype=np.int64).T
+        events['sec'], events['usec'] = sec, usec
+        events['type'], events['code'], events['value'] = type_, code, value
+    return events
+
+
+def load_events(path):
+    """Loads a recorded evdev stream, either as a text log or as a raw binary dump."""
+    with open(path, 'rb') as f:
+        head = f.read(64)
+    if b"event at" in head:
+        return load_event_log(path)
+    return load_raw_events(path)
+
+
+def assemble_frames(events):
+    """
+    Groups an evdev event stream into IMU frames, like myJoyCon.monitor does:
+    each SYN_REPORT closes a frame holding the latest value of every axis.
+
+    Parameters:
+    - events: structured array with INPUT_EVENT_DTYPE
+
+    Returns:
+    - t: (N,) kernel timestamp of each frame in seconds
+    - imu: (N, 6) raw axis values, accel xyz then gyro xyz
+    """
+    n = len(events)
+    index = np.arange(n)
+    is_abs = events['type'] == EV_ABS
+    is_syn = (events['type'] == EV_SYN) & (events['code'] == SYN_REPORT)
+
+    # Only SYN_REPORTs preceded by at least one axis event close a frame
+    syn = np.flatnonzero(is_syn)
+    abs_count = np.cumsum(is_abs)[syn]
+    syn = syn[np.diff(abs_count, prepend=0) > 0]
+
+    # Forward-fill the last value of each axis up to every event, then sample it at the frames
+    imu = np.zeros((len(syn), len(IMU_AXES)), dtype=np.int32)
+    for col, code in enumerate(IMU_AXES):
+        last = np.where(is_abs & (events['code'] == code), index, -1)
+        np.maximum.accumulate(last, out=last)
+        last = last[syn]
+        imu[:, col] = np.where(last >= 0, events['value'][last], 0)
+
+    t = events['sec'][syn] + events['usec'][syn] * 1e-6
+    return t, imu
+
+
+def sample_intervals(t):
+    """Time step of each frame; 0 for the first one and if the clock went backwards (see SampleClock)."""
+    dt = np.diff(t, prepend=t[:1])
+    np.maximum(dt, 0.0, out=dt)
+    return dt
+
+
+def calibrate(imu, calibration=None, accel_sensitivity=myJoyCon._ACCEL_SENSITIVITY,
+              gyro_sensitivity=myJoyCon._GYRO_SENSITIVITY):
+    """
+    Converts raw frames to accel in G and gyro in deg/s and corrects them as myJoyCon
+    does: with a GyroCalibrator that starts from the calibration the Joy-Con had and
+    keeps estimating the gyro bias and accel scale along the recording.
+
+    Parameters:
+    - imu: (N, 6) raw axis values, as returned by assemble_frames
+    - calibration: GyroCalibrator.as_dict() to start from (see imu_recorder.read_calibrations),
+                   None for an uncalibrated Joy-Con
+
+    Returns:
+    - accel, gyro: (N, 3) arrays
+    """
+    calibrator = GyroCalibrator()
+    if calibration is not None:
+        calibrator.load(**calibration)
+    return calibrator.correct_many(imu[:, :3] * accel_sensitivity, imu[:, 3:] * gyro_sensitivity)
+
+
+def replay_complementary(t, imu, alpha=myJoyCon._ALPHA, calibration=None,
+                         accel_sensitivity=myJoyCon._ACCEL_SENSITIVITY,
+                         gyro_sensitivity=myJoyCon._GYRO_SENSITIVITY):
+    """
+    Runs myJoyCon's complementary filter over a whole recording at once, on the
+    frames corrected as myJoyCon does (see calibrate).
+
+    Returns:
+    - (N, 3) array of roll, pitch and yaw in degrees, one row per frame.
+    """
+    dt = sample_intervals(t)
+    accel, gyro = calibrate(imu, calibration, accel_sensitivity, gyro_sensitivity)
+
+    roll = np.arctan2(accel[:, 1], accel[:, 2])
+    pitch = np.arctan2(-accel[:, 0], np.sqrt(accel[:, 1]**2 + accel[:, 2]**2))
+
+    # Open-loop yaw integration
+    yaw = np.cumsum(gyro[:, 2] * dt) % 360
+
+    roll = alpha * (roll + np.radians(gyro[:, 0] * dt)) + (1 - alpha) * roll
+    pitch = alpha * (pitch + np.radians(gyro[:, 1] * dt)) + (1 - alpha) * pitch
+
+    return np.column_stack((np.degrees(roll), np.degrees(pitch), yaw))
+
+
+def _chunked_scan(M, x0, apply, normalize=False):
+    """
+    Runs a recurrence x[k] = apply(M[k], x[k-1]) whose steps compose as matrix products,
+    so that x[k] = apply(M[k] @ M[k-1] @ ... @ M[0], x0).
+
+    The sequence is cut into ~sqrt(N) chunks: one pass builds the prefix products inside
+    all chunks at once, a short loop carries x from one chunk to the next, and a final
+    batched call applies every prefix to the x its chunk started from. Keeping the products
+    short keeps them well conditioned. With `normalize`, products are rescaled by their
+    largest entry, which is harmless for projective maps such as the Riccati equation.
+    """
+    n, d, _ = M.shape
+    chunk = int(np.clip(np.sqrt(n), 16, 1024))
+    n_chunks = -(-n // chunk)
+    # Chunk-major layout: blocks[j] holds step j of every chunk contiguously,
+    # the last chunk is padded with identities
+    blocks = np.empty((chunk, n_chunks, d, d))
+    full, rest = divmod(n, chunk)
+    blocks[:, :full] = M[:full * chunk].reshape(full, chunk, d, d).transpose(1, 0, 2, 3)
+    if rest:
+        blocks[:rest, -1] = M[full * chunk:]
+        blocks[rest:, -1] = np.eye(d)
+
+    # Prefix products inside every chunk, all chunks at once
+    for j in range(1, chunk):
+        np.matmul(blocks[j], blocks[j - 1], out=blocks[j])
+        if normalize:
+            blocks[j] /= np.abs(blocks[j]).max(axis=(1, 2), keepdims=True)
+
+    # Carry the value across chunks
+    starts = np.empty((n_chunks,) + np.shape(x0))
+    x = x0
+    for i in range(n_chunks):
+        starts[i] = x
+        x = apply(blocks[-1, i], x)
+
+    out = apply(blocks, starts)
+    return out.transpose((1, 0) + tuple(range(2, out.ndim))).reshape((-1,) + np.shape(x0))[:n]
+
+
+def _moebius(T, P):
+    """Applies a 4x4 Moebius matrix to a 2x2 covariance: (T11 P + T12) (T21 P + T22)^-1."""
+    num = T[..., :2, :2] @ P + T[..., :2, 2:]
+    den = T[..., 2:, :2] @ P + T[..., 2:, 2:]
+    # Closed-form 2x2 inverse
+    inv = np.empty_like(den)
+    inv[..., 0, 0], inv[..., 1, 1] = den[..., 1, 1], den[..., 0, 0]
+    inv[..., 0, 1], inv[..., 1, 0] = -den[..., 0, 1], -den[..., 1, 0]
+    inv /= (den[..., 0, 0] * den[..., 1, 1] - den[..., 0, 1] * den[..., 1, 0])[..., None, None]
+    return num @ inv
+
+
+def replay_kalman(t, imu, process_noise=myJoyCon._PROCESS_NOISE_VARIANCE,
+                  measurement_noise=myJoyCon._MEASUREMENT_NOISE_VARIANCE, calibration=None,
+                  accel_sensitivity=myJoyCon._ACCEL_SENSITIVITY,
+                  gyro_sensitivity=myJoyCon._GYRO_SENSITIVITY):
+    """
+    Runs myJoyCon's Kalman filter over a whole recording at once, on the frames
+    corrected as myJoyCon does (see calibrate).
+
+    The 4-state filter splits into two identical [angle, bias] filters for roll and pitch.
+    Their covariance only depends on dt, so it is computed for all frames by scanning the
+    Riccati recursion as products of 4x4 Moebius matrices; the state update is then an
+    affine recurrence, scanned with 3x3 homogeneous matrices.
+
+    Returns:
+    - (N, 3) array of roll, pitch and yaw in degrees (the Kalman filter does not estimate yaw).
+    """
+    n = len(t)
+    dt = sample_intervals(t)
+    accel, gyro = calibrate(imu, calibration, accel_sensitivity, gyro_sensitivity)
+    q, r = process_noise, measurement_noise
+
+    # Covariance. Predict P = F P F' + Q is the Moebius map [[F, Q F^-T], [0, F^-T]];
+    # update P = P (I + H' H P / r)^-1 is [[I, 0], [H' H / r, I]].
+    step = np.zeros((n, 4, 4))
+    step[:, 0, 0] = step[:, 1, 1] = 1.0
+    step[:, 0, 1] = -dt
+    step[:, 0, 2] = q
+    step[:, 1, 2] = q * dt
+    step[:, 1, 3] = q
+    step[:, 2, 2] = step[:, 3, 3] = 1.0
+    step[:, 3, 2] = dt
+    step[:, 2] += step[:, 0] / r  # update @ predict
+
+    # Posterior covariance after each frame, starting from P = I
+    P = _chunked_scan(step, np.eye(2), _moebius, normalize=True)
+    P_prev = np.concatenate((np.eye(2)[None], P[:-1]))
+
+    # Prior covariance and gain of each frame: K = P- H' / (H P- H' + r)
+    p00, p01, p11 = P_prev[:, 0, 0], P_prev[:, 0, 1], P_prev[:, 1, 1]
+    prior00 = p00 - 2 * dt * p01 + dt**2 * p11 + q
+    prior10 = p01 - dt * p11
+    k0 = prior00 / (prior00 + r)
+    k1 = prior10 / (prior00 + r)
+
+    # State: x = (I - K H) (A x + [g dt, 0]) + K z, with A = [[1, -2 dt], [0, 1]]
+    # (F plus the bias removed from the gyro input)
+    A = np.zeros((n, 3, 3))
+    A[:, 0, 0] = 1 - k0
+    A[:, 0, 1] = -2 * dt * (1 - k0)
+    A[:, 1, 0] = -k1
+    A[:, 1, 1] = 1 + 2 * dt * k1
+    A[:, 2, 2] = 1.0
+
+    accel_roll = np.arctan2(accel[:, 1], accel[:, 2])
+    accel_pitch = np.arctan2(-accel[:, 0], np.sqrt(accel[:, 1]**2 + accel[:, 2]**2))
+
+    angles = []
+    for g, z in ((gyro[:, 0], accel_roll), (gyro[:, 1], accel_pitch)):
+        A[:, 0, 2] = (1 - k0) * g * dt + k0 * z
+        A[:, 1, 2] = -k1 * g * dt + k1 * z
+        x = _chunked_scan(A, np.array([[0.0], [0.0], [1.0]]), np.matmul)
+        angles.append(x[:, 0, 0])
+
+    return np.column_stack((np.degrees(angles[0]), np.degrees(angles[1]), np.zeros(n)))
+
+
+if __name__ == "__main__":
+    events = load_events(sys.argv[1])
+    t, imu = assemble_frames(events)
+    print(f"Loaded {len(events)} events, {len(t)} IMU frames")
+
+    for name, replay in (("complementary", replay_complementary), ("kalman", replay_kalman)):
+        start = time.perf_counter()
+        orientation = replay(t, imu)
+        elapsed = time.perf_counter() - start
+        print(f"{name: <14} {elapsed * 1000: >8.1f} ms  {len(t) / elapsed / 1e6: >6.2f} M samples/s"
+              f"  final roll/pitch/yaw: {orientation[-1, 0]: >+6.1f} {orientation[-1, 1]: >+6.1f} {orientation[-1, 2]: >+6.1f}")
@@ -0,0 +1,167 @@
+import glob
+import os
+import sys
+import time
+import numpy as np
+from device_registry import serial_key
+from shm_ring import ShmRing
+
+# One filtered sample of a Joy-Con, as published by myJoyCon
+IMU_RECORD_DTYPE = np.dtype([
+    ('seq', '<i8'),                # sample number, consecutive unless the producer was restarted
+    ('t', '<f8'),                  # timestamp of the sample (monotonic s, see myJoyCon.monotonic_clock)
+    ('accel', '<f8', (3,)),        # G, calibrated
+    ('gyro', '<f8', (3,)),         # deg/s, calibrated
+    ('orientation', '<f8', (3,)),  # roll, pitch, yaw in degrees
+])
+
+STREAM_PREFIX = "joycon_imu_"
+DEFAULT_CAPACITY = 4096  # ~20 s at 200 Hz
+
+
+def stream_name(serial):
+    """Name of the shared memory block of the Joy-Con with the given serial (Bluetooth address)."""
+    return STREAM_PREFIX + serial_key(serial)
+
+
+def list_streams():
+    """Serials (as device_registry.serial_key) of the Joy-Cons currently published on this host."""
+    return sorted(os.path.basename(path)[len(STREAM_PREFIX):]
+                  for path in glob.glob(os.path.join("/dev/shm", STREAM_PREFIX + "*")))
+
+
+class ImuStream:
+    """
+    Publishes every filtered sample of one Joy-Con to a shared memory ring
+    (shm_ring.ShmRing of IMU_RECORD_DTYPE records), so any number of other
+    processes (robot bridge, logger, GUI) can read all the samples with
+    ImuSubscriber without pickling or sockets, and without the producer knowing
+    about them: a slow or stuck consumer only loses its own oldest samples.
+
+    The ring is named after the serial of the Joy-Con (see stream_name), so
+    consumers find it again after the producer restarts: a block left behind by a
+    producer that did not exit cleanly is reset in place, which the subscribers
+    still attached to it notice (ShmRing generation), and after a clean exit the
+    subscribers attach to the new producer's block by name.
+
+    Parameters:
+    - serial: Bluetooth address of the Joy-Con, or any name for the stream
+    - capacity: samples kept in the ring
+    """
+
+    def __init__(self, serial, capacity=DEFAULT_CAPACITY):
+        self.name = stream_name(serial)
+        # Reuses a block left behind by a producer that did not exit cleanly
+        self.ring = ShmRing(IMU_RECORD_DTYPE, capacity, name=self.name, reuse=True)
+        self.seq = 0
+        self._record = np.zeros((), dtype=IMU_RECORD_DTYPE)
+
+    def publish(self, t, accel, gyro, orientation):
+        record = self._record
+        record['seq'] = self.seq
+        record['t'] = t
+        record['accel'] = accel
+        record['gyro'] = gyro
+        record['orientation'] = orientation
+        self.ring.write(record)
+        self.seq += 1
+
+    def publish_many(self, t, accel, gyro, orientation):
+        """Publishes a batch of samples, as arrays of n timestamps and n x 3 values."""
+        records = np.empty(len(t), dtype=IMU_RECORD_DTYPE)
+        records['seq'] = np.arange(self.seq, self.seq + len(t))
+        records['t'] = t
+        records['accel'] = accel
+        records['gyro'] = gyro
+        records['orientation'] = orientation
+        self.ring.write_many(records)
+        self.seq += len(t)
+
+    def close(self):
+        self.ring.close()
+
+
+class ImuSubscriber:
+    """
+    Reads the samples of one Joy-Con published by an ImuStream, from any process.
+
+    read() returns every sample published since the previous read as an array of
+    IMU_RECORD_DTYPE records, in one copy out of the ring. Samples the subscriber
+    was too slow to read are counted in `lost`; gaps in `seq` also show them.
+    When the producer restarts, the subscriber follows it to its new ring and
+    `seq` starts over from 0 (counted in `restarts`).
+
+    Parameters:
+    - serial: serial of the Joy-Con, as given to ImuStream
+    - oldest: start with the samples already in the ring instead of the next ones
+    """
+
+    def __init__(self, serial, oldest=False):
+        self.name = stream_name(serial)
+        self.ring = ShmRing(IMU_RECORD_DTYPE, name=self.name, oldest=oldest)
+        self._lost = 0  # of the rings left behind
+        self._restarts = 0
+
+    @property
+    def lost(self):
+        return self._lost + self.ring.lost
+
+    @property
+    def restarts(self):
+        return self._restarts + self.ring.restarts
+
+    def _follow(self):
+        """Attaches to the ring of a restarted producer; False while there is none."""
+        try:
+            ring = ShmRing(IMU_RECORD_DTYPE, name=self.name, oldest=True)
+        except (FileNotFoundError, ValueError):
+            return False
+        if ring.closed:
+            ring.close()  # still the old block
+            return False
+        self._lost += self.ring.lost
+        self._restarts += self.ring.restarts + 1
+        self.ring.close()
+        self.ring = ring
+        return True
+
+    def read(self, max_records=None):
+        records = self.ring.read(max_records)
+        if len(records) == 0 and self.ring.closed and self._follow():
+            records = self.ring.read(max_records)
+        return records
+
+    def latest(self):
+        """Last published sample, None if there is none yet."""
+        if self.ring.closed:
+            self._follow()
+        return self.ring.latest()
+
+    def close(self):
+        self.ring.close()
+
+
+if __name__ == "__main__":
+    # Example consumer: rate and latest orientation of every published Joy-Con
+    serials = sys.argv[1:] or list_streams()
+    if not serials:
+        print("No Joy-Con stream found, start a producer with JoyConHub(streams=True)")
+        sys.exit(1)
+    subscribers = [ImuSubscriber(serial) for serial in serials]
+    print(" |".join(f" {serial: <30}" for serial in serials))
+    try:
+        while True:
+            time.sleep(0.5)
+            line = []
+            for subscriber in subscribers:
+                records = subscriber.read()
+                roll, pitch, yaw = records['orientation'][-1] if len(records) else (0.0, 0.0, 0.0)
+                line.append(f" {roll: >+6.1f} {pitch: >+6.1f} {yaw: >+6.1f} {len(records) * 2: >4d} Hz"
+                            f" {subscriber.lost: >5d} lost")
+            sys.stdout.write("\r" + " |".join(line))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for subscriber in subscribers:
+            subscriber.close()
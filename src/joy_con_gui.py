@@ -1,103 +1,18 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-import math
+import time
 import asyncio
+import sys
+import threading
 from myjoycon import myJoyCon 
+from imu_calibration import DEFAULT_CACHE_PATH
+from imu_recorder import playback_devices
+from joycon_hub import JoyConHub, joycon_side
+from joycon_state import JoyConState
+from joycon_geometry import JOYCON_MODEL, JOYCON_SIZE, brick_frames, orientation_vectors, pose_faces
+from mesh_lod import LodSelector, PosedMesh, joycon_lods, view_vector
 
-def draw_brick(ax, cog, euler_angles_radians, length, width, height, color, alpha=0.5):
-    """
-    Draws a brick in the given 3D axis based on its center of gravity (CoG),
-    normal vector, and dimensions.
-
-    Parameters:
-    - ax: Matplotlib 3D axis handler.
-    - cog: CoG position (x, y, z) 
-    - euler_angles: roll, pitch, yaw in degrees
-    - length: Length of the brick.
-    - width: Width of the brick.
-    - height: Height of the brick.
-    - color: RGB tuple for the brick color.
-    - alpha: Transparency of the brick faces.
-
-    Returns:
-    - True if the brick is successfully added, False otherwise.
-    """
-    try:
-        # extract Euler angles 
-        roll = euler_angles_radians.get('roll', 0.0)
-        pitch = euler_angles_radians.get('pitch', 0.0)
-        yaw = euler_angles_radians.get('yaw', 0.0)
-
-        # Compute the normal vector
-        normal = orientation_vector_from_rpy(roll, pitch, yaw)
-
-        # Normalize the normal vector
-        normal = normal / np.linalg.norm(normal)
-
-        # Define local coordinate system (aligning with the normal vector)
-        z_axis = normal  # Normal is treated as the local z-axis
-        x_axis = np.array([1, 0, 0])  # Default x-axis
-        if np.allclose(z_axis, x_axis):  # Prevent singularity
-            x_axis = np.array([0, 1, 0])
-        x_axis = np.cross(z_axis, x_axis)
-        x_axis /= np.linalg.norm(x_axis)  # Normalize
-        y_axis = np.cross(z_axis, x_axis)  # Define y-axis
-        y_axis /= np.linalg.norm(y_axis)  # Normalize
-
-        # Define half-dimensions
-        l2, w2, h2 = length / 2, width / 2, height / 2
-
-        # Define vertices in local coordinates
-        local_vertices = np.array(
-            [
-                [-l2, -w2, -h2],
-                [l2, -w2, -h2],
-                [l2, w2, -h2],
-                [-l2, w2, -h2],  # Bottom face
-                [-l2, -w2, h2],
-                [l2, -w2, h2],
-                [l2, w2, h2],
-                [-l2, w2, h2],  # Top face
-            ]
-        )
-
-        # Transform vertices to global coordinates
-        transformation_matrix = np.column_stack((x_axis, y_axis, z_axis))
-        global_vertices = np.dot(local_vertices, transformation_matrix.T) + cog
-
-        # Define faces using transformed vertices
-        faces = [
-            [global_vertices[i] for i in [0, 1, 2, 3]],  # Bottom face
-            [global_vertices[i] for i in [4, 5, 6, 7]],  # Top face
-            [global_vertices[i] for i in [0, 1, 5, 4]],  # Side face
-            [global_vertices[i] for i in [1, 2, 6, 5]],  # Side face
-            [global_vertices[i] for i in [2, 3, 7, 6]],  # Side face
-            [global_vertices[i] for i in [3, 0, 4, 7]],  # Side face
-        ]
-
-        # Add the brick to the 3D axis
-        poly3d = [[list(vertex) for vertex in face] for face in faces]
-        ax.add_collection3d(
-            Poly3DCollection(
-                poly3d, facecolors=color, linewidths=3, edgecolors=color, alpha=alpha
-            )
-        )
-
-        # text label
-        ax.text(
-            cog[0], cog[1], cog[2] + height / 2,
-            f"Roll: {math.degrees(euler_angles_radians['roll']):.1f}º\n"
-            f"Pitch: {math.degrees(euler_angles_radians['pitch']):.1f}º",
-            color='black'
-        )
-
-        return True  # Successful execution
-
-    except Exception as e:
-        print(f"Error: {e}")
-        return False  # Failed execution
- 
 def set_axes_equal(ax):
     """Set equal aspect ratio for 3D plots (for older Matplotlib versions)."""
     x_limits = ax.get_xlim()
@@ -131,54 +46,31 @@ def setup_figure():
     return fig, ax
 
 
-def draw_joycons(orientations, ax):
+# Colors
+neon_red = (255 / 255, 60 / 255, 40 / 255)  # Nintendo Switch Neon Joy-Con Red
+neon_blue = (10 / 255, 185 / 255, 230 / 255)  # Nintendo Switch Neon Joy-Con Blue
+JOYCON_COLORS = {'L': neon_red, 'R': neon_blue}
+UNKNOWN_COLOR = (0.5, 0.5, 0.5)
+
+# Distance between the Joy-Cons along the Y axis in mm
+JOYCON_SPACING = 120
+
+
+def layout_joycons(ax, n):
     """
-    Draws Joy-Cons based on their orientations.
+    Sets the axis limits for `n` Joy-Cons side by side along the Y axis.
 
-    Parameters:
-    - orientations: Dictionary where keys are device names and values are dictionaries
-                    with 'roll', 'pitch', and 'yaw' angles in degrees.
-                    Example: {"JoyCon_L": {'roll': 0.0, 'pitch': 0.0, 'yaw': 0.0}}
+    Returns:
+    - list with the CoG of every Joy-Con
     """
-    # Joy-Con dimensions in mm
-    length, width, height = 35.9, 102, 13.9
-
-    # Colors
-    neon_red = (255 / 255, 60 / 255, 40 / 255)  # Nintendo Switch Neon Joy-Con Red
-    neon_blue = (10 / 255, 185 / 255, 230 / 255)  # Nintendo Switch Neon Joy-Con Blue
-
-    # Base positions for left and right Joy-Cons
-    cog_left = np.array([0, 60, 0])     # Base position for left Joy-Con
-    cog_right = np.array([0, -60, 0])     # Base position for right Joy-Con
-    
-    # Iterate through the orientations dictionary
-    for device_name, angles_degrees in orientations.items():
-
-        # Determine position and color based on device name
-        if device_name == "Nintendo Switch Left Joy-Con IMU":
-            position = cog_left
-            color = neon_red
-        elif device_name == "Nintendo Switch Right Joy-Con IMU":
-            position = cog_right
-            color = neon_blue
-        else:
-            # Default position and color for any other device
-            position = np.array([0, 0, 0])
-            color = (0.5, 0.5, 0.5)  # Grey color for unknown devices
-
-        angles_radians = {key: math.radians(value) for key, value in angles_degrees.items()}
-        angles_radians['yaw'] = 0  # Yaw angle is not used in this example
-
-        # Add the Joy-Con to the plot
-        draw_brick(ax, position, angles_radians, length, width, height, color)
-
-    # Adjust axis limits to fit both bricks
-    all_x = [
-        cog_left[0],
-        cog_right[0] + width,
-        cog_left[0] + width,
-    ]
-    all_y = [-width / 2, width / 2, -width / 2, width / 2]
+    # Base positions 120 mm apart, e.g. left Joy-Con at Y=60 and right Joy-Con at Y=-60
+    length, width, height = JOYCON_SIZE
+    spacing = JOYCON_SPACING
+    cogs = [np.array([0, spacing * ((n - 1) / 2 - i), 0]) for i in range(n)]
+
+    # Adjust axis limits to fit all bricks
+    all_x = [0, width]
+    all_y = [spacing * (1 - n) / 2 - width / 2, spacing * (n - 1) / 2 + width / 2]
     all_z = [0, height, height]
 
     ax.set_xlim(min(all_x) - 10, max(all_x) + 10)
@@ -186,75 +78,255 @@ def draw_joycons(orientations, ax):
     ax.set_zlim(min(all_z) - 10, max(all_z) + 10)
 
     set_axes_equal(ax)  # Ensure equal scaling
+    return cogs
 
-def orientation_vector_from_rpy(roll, pitch, yaw):
+
+class JoyConRenderer:
     """
-    Converts roll, pitch, and yaw angles (in radians) to a normal vector.
+    Retained-mode drawing of the Joy-Cons for the live display.
+
+    The brick collections and labels are created once; every frame only moves their
+    vertices (set_verts) and changes the label texts, instead of clearing the axis
+    and rebuilding everything. Where the canvas supports blitting, the static part
+    of the figure (axes, grid, ticks) is cached and only the Joy-Cons are redrawn on
+    top of it; the cache is refreshed on every full draw, e.g. when the window is
+    resized or the view rotated with the mouse.
+
+    With `mesh`, the left and right Joy-Cons are drawn with their STL meshes
+    (see mesh_lod) instead of bricks, at the finest level of detail that keeps the
+    frame time under `target_frame_time` (see mesh_lod.LodSelector).
+
+    Parameters:
+    - fig, ax: figure and 3D axis from setup_figure()
+    - device_names: name of every Joy-Con, in the order of the states passed to update()
+    - mesh: draw the STL meshes of the Joy-Cons
+    - target_frame_time: s per frame the level of detail is chosen for
     """
-    # Define the reference vector along the z-axis
-    reference_vector = np.array([0, 0, 1])
 
-    # Rotation matrices
-    Rz_yaw = np.array([
-        [np.cos(yaw), -np.sin(yaw), 0],
-        [np.sin(yaw),  np.cos(yaw), 0],
-        [0,            0,           1]
-    ])
+    def __init__(self, fig, ax, device_names, mesh=False, target_frame_time=1 / 30):
+        self.fig = fig
+        self.ax = ax
+        self.canvas = fig.canvas
+        self.blit = self.canvas.supports_blit
+        self.background = None
+
+        height = JOYCON_SIZE[2]
+        self.cogs = np.array(layout_joycons(ax, len(device_names)), dtype=float).reshape(-1, 3)
+        self.faces = pose_faces(JOYCON_MODEL, np.eye(3), self.cogs)  # (N, 6, 4, 3), reused every frame
+        self._angles = np.zeros((2, len(device_names)))  # roll and pitch in degrees
+        self.bricks = []
+        self.labels = []
+
+        # Levels of detail of the meshes, None for the Joy-Cons drawn as bricks
+        sides = [joycon_side(device_name) for device_name in device_names]
+        meshes = {side: joycon_lods(side) for side in set(sides) if mesh and side}
+        self.lods = [meshes.get(side) for side in sides]
+        self.colors = [JOYCON_COLORS.get(side, UNKNOWN_COLOR) for side in sides]
+        n_levels = min((len(lods) for lods in self.lods if lods), default=0)
+        self.lod = LodSelector(n_levels, target_frame_time) if n_levels else None
+        self.meshes = [None] * len(device_names)  # PosedMesh of the Joy-Cons drawn as meshes
+        self._frame_start = None
+
+        for i, (cog, faces) in enumerate(zip(self.cogs, self.faces)):
+            color = self.colors[i]
+            if self.lods[i]:
+                mesh = self.meshes[i] = PosedMesh(self.lods[i][self.lod.level], color)
+                brick = Poly3DCollection(mesh.pose(np.eye(3), cog), facecolors=mesh.face_colors(),
+                                         linewidths=0, edgecolors='none', animated=self.blit)
+            else:
+                brick = Poly3DCollection(faces,
+                                         facecolors=color, linewidths=3, edgecolors=color, alpha=0.5,
+                                         animated=self.blit)
+            ax.add_collection3d(brick)
+            self.bricks.append(brick)
+            self.labels.append(ax.text(cog[0], cog[1], cog[2] + height / 2, "", color='black',
+                                       animated=self.blit))
+        self.fps_text = ax.text2D(0.02, 0.98, "", transform=ax.transAxes, animated=self.blit)
+
+        # Achieved frame rate, averaged over about one second
+        self.frames = 0
+        self.fps = 0.0
+        self._fps_start = time.perf_counter()
+
+        self._draw_callback = self.canvas.mpl_connect('draw_event', self._on_draw) if self.blit else None
+
+    def remove(self):
+        """Takes the Joy-Cons off the axis, e.g. to lay out a new renderer for more of them."""
+        if self._draw_callback is not None:
+            self.canvas.mpl_disconnect(self._draw_callback)
+        for artist in (*self.bricks, *self.labels, self.fps_text):
+            artist.remove()
+
+    def _on_draw(self, event):
+        """Caches the static background after a full draw and draws the Joy-Cons on it."""
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for brick in self.bricks:
+            brick.do_3d_projection()  # normally done by Axes3D.draw, which skips animated artists
+            self.ax.draw_artist(brick)
+        for label in self.labels:
+            self.ax.draw_artist(label)
+        self.ax.draw_artist(self.fps_text)
+
+    def update(self, states):
+        """Moves the bricks to the orientations of `states` (JoyConState, in degrees)."""
+        self._frame_start = time.perf_counter()
+        # All the Joy-Cons are posed in one batch
+        for i, state in enumerate(states):
+            self._angles[0, i] = state.roll
+            self._angles[1, i] = state.pitch
+        roll, pitch = np.radians(self._angles)
+        frames = brick_frames(roll, pitch, 0.0)
+        pose_faces(JOYCON_MODEL, frames, self.cogs, out=self.faces)
+        view = view_vector(self.ax.elev, self.ax.azim)
+
+        for i, (faces, brick, label, state) in enumerate(zip(self.faces, self.bricks, self.labels, states)):
+            mesh = self.meshes[i]
+            if mesh is not None:
+                # Only the triangles facing the camera go to the depth sort
+                faces = mesh.pose(frames[i], self.cogs[i], view)
+                brick.set_facecolor(mesh.face_colors())
+            brick.set_verts(faces)
+            label.set_text(f"Roll: {state.roll:.1f}º\nPitch: {state.pitch:.1f}º")
+
+    def draw(self, status=""):
+        """Renders a frame and updates the FPS counter, followed by `status`."""
+        self.frames += 1
+        now = time.perf_counter()
+        if now - self._fps_start >= 1.0:
+            self.fps = self.frames / (now - self._fps_start)
+            self.frames = 0
+            self._fps_start = now
+        lod = f"  LOD {self.lod.level}" if self.lod is not None else ""
+        self.render(f"{self.fps:.1f} FPS{lod}  {status}")
+
+        if self.lod is not None and self._frame_start is not None:
+            if self.lod.update(time.perf_counter() - self._frame_start):
+                self.set_level(self.lod.level)
+
+    def render(self, text=""):
+        """
+        Renders a frame with `text` in the corner, without the FPS counter and the
+        level of detail adjustment of draw(), e.g. for offscreen rendering.
+        """
+        self.fps_text.set_text(text)
+        if self.blit and self.background is not None:
+            self.canvas.restore_region(self.background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        else:
+            self.canvas.draw_idle()  # first frame, or a backend without blitting
+        self.canvas.flush_events()  # Yield to the GUI event loop
 
-    Ry_pitch = np.array([
-        [ np.cos(pitch), 0, np.sin(pitch)],
-        [ 0,             1, 0           ],
-        [-np.sin(pitch), 0, np.cos(pitch)]
-    ])
+    def set_level(self, level):
+        """Swaps the meshes for another level of detail (see mesh_lod.DEFAULT_LEVELS)."""
+        self.lod.level = level
+        for i, lods in enumerate(self.lods):
+            if lods:
+                self.meshes[i] = PosedMesh(lods[level], self.colors[i])
 
-    Rx_roll = np.array([
-        [1, 0,           0          ],
-        [0, np.cos(roll), -np.sin(roll)],
-        [0, np.sin(roll),  np.cos(roll)]
-    ])
 
-    # Combined rotation matrix
-    R = Rz_yaw @ Ry_pitch @ Rx_roll
+def orientation_vector_from_rpy(roll, pitch, yaw):
+    """
+    Converts roll, pitch, and yaw angles (in radians) to a normal vector.
+    """
+    return orientation_vectors(roll, pitch, yaw)
+
 
-    # Apply rotation to the reference vector
-    oriented_vector = R @ reference_vector
+def ingest_status(joycons):
+    """One-line summary of the kernel buffer overflows and the dropped samples of every Joy-Con."""
+    stats = [joycon.get_ingest_stats() for joycon in joycons]
+    return (f"overflows {' '.join(str(s['overflows']) for s in stats)}"
+            f"  dropped {' '.join(str(s['dropped']) for s in stats)}")
 
-    # Normalize the resulting vector
-    oriented_vector /= np.linalg.norm(oriented_vector)
 
-    return oriented_vector
+def display_joycons(joycons, interval=0.005, mesh=False):
+    """
+    Draws the Joy-Cons until the window is closed, as bricks or with their meshes
+    (see JoyConRenderer).
 
+    Runs on the main thread (GUI toolkits require it) while the Joy-Cons are read
+    in another thread: the renderer only copies the published JoyConState snapshots,
+    so a slow redraw delays the picture but never the event reads.
 
-async def display_joycons(joycons, interval=0.1):
+    Parameters:
+    - joycons: list of myJoyCon, may grow, or a JoyConHub: its list is read again every
+      frame, and the Joy-Cons are laid out again when it adds one on hotplug
+    """
     # setup
     fig, ax = setup_figure()
-    orientations = {joycon.device.name: joycon.get_orientation() for joycon in joycons}
+    pads = list(getattr(joycons, 'joycons', joycons))
+    # one snapshot per device, refreshed in place
+    states = [JoyConState() for _ in pads]
+    renderer = JoyConRenderer(fig, ax, [joycon.device.name for joycon in pads], mesh=mesh)
+    samples = 0  # samples published by the ingestion thread
+    skipped = 0  # samples never drawn because a newer one was already there
 
     plt.ion()  # Enable interactive mode
-    draw_joycons(orientations, ax) # Initial draw
+    renderer.update(states)  # Initial pose
     plt.show()
 
-    # loop
-    while True:
-        # update orientations
-        orientations = {joycon.device.name: joycon.get_orientation() for joycon in joycons}
-        
-        ax.cla()
-        draw_joycons(orientations, ax)
-        fig.canvas.draw_idle()  # Schedule a redraw
-        plt.pause(0.001)  # Yield to the GUI event loop
+    # loop, until the window is closed
+    while plt.fignum_exists(fig.number):
+        # update orientations, redraw only if any of them changed
+        changed = False
+        pads = list(getattr(joycons, 'joycons', joycons))
+        if len(pads) > len(states):
+            # Joy-Cons added on hotplug: a new renderer lays all of them out
+            states += [JoyConState() for _ in range(len(states), len(pads))]
+            renderer.remove()
+            renderer = JoyConRenderer(fig, ax, [joycon.device.name for joycon in pads], mesh=mesh)
+            changed = True
+        for joycon, snapshot in zip(pads, states):
+            seq = snapshot.seq
+            if joycon.state.read_into(snapshot):
+                changed = True
+                published = (snapshot.seq - seq) // 2
+                samples += published
+                skipped += published - 1
+
+        if changed:
+            renderer.update(states)
+            renderer.draw(ingest_status(pads))
+        else:
+            fig.canvas.flush_events()  # Keep the window responsive
 
-        await asyncio.sleep(interval)
+        time.sleep(interval)  # Let the ingestion thread run
 
-async def main():
-    device_paths = ['/dev/input/event20', '/dev/input/event22']
-    joycons = [myJoyCon(path) for path in device_paths]
-    monitor_tasks = [joycon.monitor() for joycon in joycons]
-    display_task = display_joycons(joycons)
+    print(f"Drew {samples - skipped} of {samples} samples, last at {renderer.fps:.1f} FPS")
 
-    await asyncio.gather(*monitor_tasks, display_task)
 
+async def monitor_all(joycons):
+    await asyncio.gather(*(joycon.monitor() for joycon in joycons))
 
-if __name__ == "__main__":
-    asyncio.run(main())
 
+def main(recording=None, mesh=False):
+    hub = None
+    if recording:
+        # Replay a session recorded with imu_recorder.py instead of reading the Joy-Cons
+        joycons = [myJoyCon(recording, device=device) for device in playback_devices(recording)]
+        threading.Thread(target=asyncio.run, args=(monitor_all(joycons),), name="playback", daemon=True).start()
+    else:
+        # Every connected Joy-Con, read by the hub in its own thread
+        hub = JoyConHub(calibration_path=DEFAULT_CACHE_PATH)
+        hub.start()
+        joycons = hub.joycons
+
+    try:
+        display_joycons(hub or joycons, mesh=mesh)
+    finally:
+        if hub is not None:
+            hub.close()
+
+    for joycon in joycons:
+        stats = joycon.get_ingest_stats()
+        print(f"{joycon.device.name}: {stats['samples']} samples, {stats['overflows']} buffer overflows,"
+              f" {stats['dropped']} dropped, {stats['resyncs']} resynced, {stats['filter_resets']} filter resets")
+
+
+if __name__ == "__main__":
+    # python joy_con_gui.py [RECORDING] [--mesh]
+    args = [arg for arg in sys.argv[1:] if arg != "--mesh"]
+    main(*args[:1], mesh="--mesh" in sys.argv)
@@ -0,0 +1,131 @@
+from functools import lru_cache
+import numpy as np
+
+# Joy-Con dimensions in mm
+JOYCON_SIZE = (35.9, 102, 13.9)  # length, width, height
+
+# Vertex indices of the six faces of a brick
+BRICK_FACES = np.array([
+    [0, 1, 2, 3],  # Bottom face
+    [4, 5, 6, 7],  # Top face
+    [0, 1, 5, 4],  # Side face
+    [1, 2, 6, 5],  # Side face
+    [2, 3, 7, 6],  # Side face
+    [3, 0, 4, 7],  # Side face
+])
+
+
+class BrickModel:
+    """
+    Vertices and faces of a brick centered at the origin, in its local coordinates.
+
+    Parameters:
+    - length, width, height: dimensions along the local x, y and z axes
+    """
+
+    def __init__(self, length, width, height):
+        l2, w2, h2 = length / 2, width / 2, height / 2
+        self.vertices = np.array([
+            [-l2, -w2, -h2],
+            [l2, -w2, -h2],
+            [l2, w2, -h2],
+            [-l2, w2, -h2],  # Bottom face
+            [-l2, -w2, h2],
+            [l2, -w2, h2],
+            [l2, w2, h2],
+            [-l2, w2, h2],  # Top face
+        ])
+        self.faces = self.vertices[BRICK_FACES]  # (6, 4, 3)
+        self.vertices.flags.writeable = False
+        self.faces.flags.writeable = False
+
+
+@lru_cache(maxsize=None)
+def brick_model(length, width, height):
+    """Returns the BrickModel of the given dimensions, built once per size."""
+    return BrickModel(length, width, height)
+
+
+JOYCON_MODEL = brick_model(*JOYCON_SIZE)
+
+
+def rotation_matrices(roll, pitch, yaw):
+    """
+    Rotation matrices Rz(yaw) @ Ry(pitch) @ Rx(roll) for a batch of poses.
+
+    Parameters:
+    - roll, pitch, yaw: angles in radians, scalars or arrays of the same shape
+
+    Returns:
+    - array of shape (..., 3, 3)
+    """
+    roll, pitch, yaw = np.broadcast_arrays(np.asarray(roll, dtype=float),
+                                           np.asarray(pitch, dtype=float),
+                                           np.asarray(yaw, dtype=float))
+    cr, sr = np.cos(roll), np.sin(roll)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+
+    R = np.empty(roll.shape + (3, 3))
+    R[..., 0, 0] = cy * cp
+    R[..., 0, 1] = cy * sp * sr - sy * cr
+    R[..., 0, 2] = cy * sp * cr + sy * sr
+    R[..., 1, 0] = sy * cp
+    R[..., 1, 1] = sy * sp * sr + cy * cr
+    R[..., 1, 2] = sy * sp * cr - cy * sr
+    R[..., 2, 0] = -sp
+    R[..., 2, 1] = cp * sr
+    R[..., 2, 2] = cp * cr
+    return R
+
+
+def orientation_vectors(roll, pitch, yaw):
+    """Unit vectors along the rotated z-axis for a batch of poses (shape (..., 3))."""
+    return rotation_matrices(roll, pitch, yaw)[..., :, 2]
+
+
+def brick_frames(roll, pitch, yaw):
+    """
+    Local frames of the bricks drawn by joy_con_gui for a batch of poses.
+
+    The top face points along the orientation vector (local z-axis); the local
+    x-axis is z cross the global x-axis, or z cross the global y-axis when z is
+    (anti)parallel to x, and y = z cross x.
+
+    Returns:
+    - array of shape (..., 3, 3) whose columns are the local x, y and z axes
+    """
+    z = orientation_vectors(roll, pitch, yaw)
+    zx, zy, zz = z[..., 0], z[..., 1], z[..., 2]
+
+    # z x (1, 0, 0) = (0, zz, -zy); z x (0, 1, 0) = (-zz, 0, zx)
+    singular = zy * zy + zz * zz < 1e-12
+    x = np.empty_like(z)
+    x[..., 0] = np.where(singular, -zz, 0.0)
+    x[..., 1] = np.where(singular, 0.0, zz)
+    x[..., 2] = np.where(singular, zx, -zy)
+    x /= np.linalg.norm(x, axis=-1, keepdims=True)
+    y = np.cross(z, x)
+
+    return np.stack((x, y, z), axis=-1)
+
+
+def pose_faces(model, frames, cogs, out=None):
+    """
+    Transforms the faces of a brick model to a batch of poses in a single einsum.
+
+    Parameters:
+    - model: BrickModel
+    - frames: (..., 3, 3) local frames, e.g. from brick_frames() or rotation_matrices()
+    - cogs: (..., 3) CoG positions, broadcast against the frames
+    - out: optional (..., 6, 4, 3) array to write the result into
+
+    Returns:
+    - (..., 6, 4, 3) global coordinates of the corners of every face
+    """
+    cogs = np.asarray(cogs)[..., None, None, :]
+    if out is None:
+        return np.einsum('...ij,fvj->...fvi', frames, model.faces) + cogs
+    np.einsum('...ij,fvj->...fvi', frames, model.faces, out=out)
+    out += cogs
+    return out
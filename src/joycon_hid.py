@@ -0,0 +1,272 @@
+import asyncio
+import os
+import struct
+import sys
+import time
+from device_registry import get_registry
+from imu_calibration import CalibrationCache, GyroCalibrator
+from joycon_state import JoyConState
+from myjoycon import myJoyCon
+from orientation_filters import OrientationFilter, make_filter
+from sample_clock import JOYCON_IMU_PERIOD, SampleClock
+
+# Standard full input report: buttons, sticks and 3 IMU samples taken 5 ms apart
+FULL_REPORT_ID = 0x30
+IMU_OFFSET = 13  # first IMU sample in the report
+SAMPLES_PER_REPORT = 3
+IMU_SAMPLE = struct.Struct('<6h')  # accel xyz, gyro xyz (raw, ±8 G and ±2000 deg/s ranges)
+FULL_REPORT_SIZE = IMU_OFFSET + SAMPLES_PER_REPORT * IMU_SAMPLE.size
+
+# Output report with a subcommand, as sent by pyjoycon, and the input report replying to it:
+# byte 13 is the ACK (high bit set when the subcommand succeeded), 14 the subcommand
+SUBCOMMAND_REPORT_ID = 0x01
+SUBCOMMAND_REPLY_ID = 0x21
+SUBCOMMAND_REPLY_SIZE = 15
+RUMBLE_NEUTRAL = b'\x00\x01\x40\x40\x00\x01\x40\x40'
+SUBCOMMAND_SET_INPUT_REPORT_MODE = 0x03
+SUBCOMMAND_SPI_READ = 0x10
+SUBCOMMAND_ENABLE_IMU = 0x40
+SUBCOMMAND_TIMEOUT = 1.0  # seconds to wait for a reply
+SUBCOMMAND_RETRIES = 3  # Bluetooth can lose a subcommand
+
+# IMU calibration in the SPI flash: accel origin and sensitivity, gyro origin and
+# sensitivity (3 int16 each), from the factory or, if its magic is there, the user's
+FACTORY_IMU_CALIBRATION = 0x6020
+USER_IMU_CALIBRATION = 0x8026
+USER_CALIBRATION_MAGIC = b'\xb2\xa1'
+IMU_CALIBRATION = struct.Struct('<12h')
+SPI_REPLY_HEADER = 5  # the reply data repeats the address (4 bytes) and size (1 byte)
+
+
+def parse_imu_calibration(data):
+    """
+    Converts an IMU calibration from the SPI flash to the offsets (raw) and the scales
+    (G and deg/s per unit) of the accel and gyro axes, as in pyjoycon.
+
+    Returns:
+    - accel_offset, accel_coeff, gyro_offset, gyro_coeff, tuples of 3 values
+    """
+    values = IMU_CALIBRATION.unpack_from(data)
+    accel_offset, gyro_offset = values[0:3], values[6:9]
+    # Full scale over the measured range of the axis: 4 G over 0x4000, 936 deg/s over 0x343B
+    accel_coeff = tuple(4.0 / (0x4000 - offset) for offset in accel_offset)
+    gyro_coeff = tuple(936.0 / (0x343B - offset) for offset in gyro_offset)
+    return accel_offset, accel_coeff, gyro_offset, gyro_coeff
+
+
+class HidImuReader:
+    """
+    Reads the IMU of one Joy-Con from its hidraw node in an asyncio event loop.
+
+    pyjoycon's JoyCon keeps only one of the three IMU samples of every 0x30 input
+    report and has to be polled with the blocking get_status(); this reader filters
+    all three, so the orientation runs at 200 Hz instead of ~66 Hz, and it is woken
+    up by the event loop when a report arrives, so any number of Joy-Cons can share
+    one loop.
+
+    open() reads the IMU calibration of the Joy-Con from its SPI flash, which the raw
+    samples are converted with, then enables the IMU and the full reports, checking
+    that the Joy-Con acknowledged every subcommand.
+
+    The samples are timestamped from the arrival time of their report: the newest one
+    at the report time and the others 5 ms apart before it. The report time follows
+    the 15 ms report period and is pulled towards the arrival times, which filters
+    out most of the Bluetooth jitter; after a gap it restarts from the arrival time.
+
+    Parameters:
+    - hid_path: hidraw node of the Joy-Con (e.g. from device_registry.JoyConNodes.hid_path)
+    - name: label of the Joy-Con
+    - estimator: orientation filter, see myJoyCon.set_estimator
+    - calibration: imu_calibration.CalibrationCache to start from, or None
+    - serial: key of the Joy-Con in the calibration cache
+    - updated: asyncio.Event set after every report, can be shared by several readers
+    """
+
+    _ACCEL_SENSITIVITY = myJoyCon._ACCEL_SENSITIVITY
+    _GYRO_SENSITIVITY = myJoyCon._GYRO_SENSITIVITY
+    _REPORT_PERIOD = SAMPLES_PER_REPORT * JOYCON_IMU_PERIOD
+    _TIME_GAIN = 0.05  # how fast the report time follows the arrival times
+
+    def __init__(self, hid_path, name=None, estimator='complementary', calibration=None, serial=None,
+                 updated=None):
+        self.hid_path = hid_path.decode() if isinstance(hid_path, bytes) else hid_path
+        self.name = name or self.hid_path
+        if not isinstance(estimator, OrientationFilter):
+            estimator = make_filter(estimator, **myJoyCon._FILTER_PARAMS.get(estimator, {}))
+        self.estimator = estimator
+        self.calibrator = GyroCalibrator()
+        if calibration is not None:
+            calibration.apply(serial, self.calibrator)
+        self.state = JoyConState()
+        self.clock = SampleClock()
+        self.reports = 0
+        self.updated = updated or asyncio.Event()  # for consumers that wait for samples
+        # Nominal scales until open() reads the calibration of the Joy-Con
+        self.accel_offset, self.gyro_offset = (0, 0, 0), (0, 0, 0)
+        self.accel_coeff = (self._ACCEL_SENSITIVITY,) * 3
+        self.gyro_coeff = (self._GYRO_SENSITIVITY,) * 3
+        self._report_time = None
+        self._packet_number = 0
+        self._replies = {}  # subcommand -> future of its reply
+        self._fd = None
+        self._loop = None
+
+    async def open(self, loop=None):
+        """
+        Opens the hidraw node, reads the IMU calibration, switches the Joy-Con to full
+        reports with IMU and starts reading. Raises OSError if the Joy-Con does not
+        acknowledge a subcommand.
+        """
+        self._loop = loop or asyncio.get_running_loop()
+        self._fd = os.open(self.hid_path, os.O_RDWR | os.O_NONBLOCK)
+        self._loop.add_reader(self._fd, self._read)
+        try:
+            self.set_calibration(await self.read_imu_calibration())
+            await self.subcommand(SUBCOMMAND_ENABLE_IMU, b'\x01')
+            await self.subcommand(SUBCOMMAND_SET_INPUT_REPORT_MODE, bytes((FULL_REPORT_ID,)))
+        except OSError:
+            self.close()
+            raise
+
+    def set_calibration(self, calibration):
+        """Converts the raw samples with a calibration given by parse_imu_calibration."""
+        self.accel_offset, self.accel_coeff, self.gyro_offset, self.gyro_coeff = calibration
+
+    async def read_imu_calibration(self):
+        """Reads the user IMU calibration if there is one, else the factory one; see parse_imu_calibration."""
+        user = await self.read_spi(USER_IMU_CALIBRATION, len(USER_CALIBRATION_MAGIC) + IMU_CALIBRATION.size)
+        if user[:len(USER_CALIBRATION_MAGIC)] == USER_CALIBRATION_MAGIC:
+            return parse_imu_calibration(user[len(USER_CALIBRATION_MAGIC):])
+        return parse_imu_calibration(await self.read_spi(FACTORY_IMU_CALIBRATION, IMU_CALIBRATION.size))
+
+    async def read_spi(self, address, size):
+        """Reads `size` bytes of the SPI flash of the Joy-Con."""
+        reply = await self.subcommand(SUBCOMMAND_SPI_READ, struct.pack('<IB', address, size))
+        data = reply[SUBCOMMAND_REPLY_SIZE + SPI_REPLY_HEADER:SUBCOMMAND_REPLY_SIZE + SPI_REPLY_HEADER + size]
+        if len(data) < size:
+            raise OSError(f"{self.name}: short SPI read at {address:#x}")
+        return data
+
+    async def subcommand(self, subcommand, argument):
+        """
+        Sends a subcommand and returns its 0x21 reply once the Joy-Con acknowledged it.
+        The subcommand is sent again if no reply arrives within SUBCOMMAND_TIMEOUT.
+        """
+        for _ in range(SUBCOMMAND_RETRIES):
+            reply = self._loop.create_future()
+            self._replies[subcommand] = reply
+            self._send_subcommand(subcommand, argument)
+            try:
+                report = await asyncio.wait_for(reply, SUBCOMMAND_TIMEOUT)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self._replies.pop(subcommand, None)
+            if not report[13] & 0x80:
+                raise OSError(f"{self.name}: subcommand {subcommand:#04x} rejected")
+            return report
+        raise OSError(f"{self.name}: no reply to subcommand {subcommand:#04x}")
+
+    def _send_subcommand(self, subcommand, argument):
+        report = (bytes((SUBCOMMAND_REPORT_ID, self._packet_number)) + RUMBLE_NEUTRAL
+                  + bytes((subcommand,)) + argument)
+        self._packet_number = (self._packet_number + 1) & 0xF
+        os.write(self._fd, report)
+
+    def _read(self):
+        while True:
+            try:
+                report = os.read(self._fd, 64)
+            except BlockingIOError:
+                break
+            except OSError:
+                # Joy-Con gone (e.g. Bluetooth dropout)
+                self.close()
+                break
+            if report[:1] == bytes((FULL_REPORT_ID,)) and len(report) >= FULL_REPORT_SIZE:
+                self.handle_report(report, time.monotonic())
+            elif report[:1] == bytes((SUBCOMMAND_REPLY_ID,)) and len(report) >= SUBCOMMAND_REPLY_SIZE:
+                reply = self._replies.get(report[14])
+                if reply is not None and not reply.done():
+                    reply.set_result(report)
+        self.updated.set()
+        self.updated.clear()
+
+    def _stamp(self, arrival):
+        """Time of the newest sample of a report that arrived at `arrival`."""
+        expected = None if self._report_time is None else self._report_time + self._REPORT_PERIOD
+        if expected is None or abs(arrival - expected) > self._REPORT_PERIOD:
+            self._report_time = arrival  # first report, or after a gap
+        else:
+            self._report_time = expected + self._TIME_GAIN * (arrival - expected)
+        return self._report_time
+
+    def handle_report(self, report, arrival):
+        """Filters the three IMU samples of a 0x30 input report received at `arrival` (monotonic s)."""
+        t_newest = self._stamp(arrival)
+        self.reports += 1
+        aox, aoy, aoz = self.accel_offset
+        acx, acy, acz = self.accel_coeff
+        gox, goy, goz = self.gyro_offset
+        gcx, gcy, gcz = self.gyro_coeff
+        for k in range(SAMPLES_PER_REPORT):
+            ax, ay, az, gx, gy, gz = IMU_SAMPLE.unpack_from(report, IMU_OFFSET + k * IMU_SAMPLE.size)
+            t = t_newest - (SAMPLES_PER_REPORT - 1 - k) * JOYCON_IMU_PERIOD
+            dt = self.clock.tick(t)
+            accel, gyro = self.calibrator.correct(
+                ((ax - aox) * acx, (ay - aoy) * acy, (az - aoz) * acz),
+                ((gx - gox) * gcx, (gy - goy) * gcy, (gz - goz) * gcz))
+            orientation = self.estimator.update(accel, gyro, dt)
+            self.state.publish(t, accel, gyro, orientation)
+
+    def close(self):
+        for reply in self._replies.values():
+            if not reply.done():
+                reply.set_exception(OSError(f"{self.name}: closed"))
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+
+def show_orientations(readers):
+    line = " |".join(f" {reader.state.roll: >+6.1f} {reader.state.pitch: >+6.1f} {reader.state.yaw: >+6.1f}"
+                     f" {reader.clock.stats()['rate']: >4.0f} Hz" for reader in readers)
+    sys.stdout.write(f"\r{line}")
+    sys.stdout.flush()
+
+
+async def main():
+    # Both Joy-Cons (or any number) from one event loop
+    registry = get_registry()
+    calibration = CalibrationCache()
+    updated = asyncio.Event()
+    readers = [HidImuReader(nodes.hid_path, f"Joy-Con ({nodes.side})", calibration=calibration,
+                            serial=nodes.serial, updated=updated)
+               for nodes in registry.joycons() if nodes.hid_path]
+    if not readers:
+        print("No Joy-Con found")
+        return
+    for reader in list(readers):
+        try:
+            await reader.open()
+        except OSError as e:
+            print(f"Error: {e}")
+            readers.remove(reader)
+    if not readers:
+        return
+    print(" |".join(f" {reader.name: <26}" for reader in readers))
+    try:
+        while True:
+            await updated.wait()
+            show_orientations(readers)
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,301 @@
+import os
+import selectors
+import threading
+import time
+import evdev
+from device_registry import SYSFS_INPUT, scan_input_nodes
+from filter_pool import FilterPool
+from imu_calibration import CalibrationCache
+from myjoycon import myJoyCon
+
+try:
+    import pyudev  # optional, for hotplug notifications
+except ImportError:
+    pyudev = None
+
+# Same IDs as in hid_testing.py
+JOYCON_VENDOR_ID = 0x057E
+JOYCON_PRODUCT_IDS = (0x2006, 0x2007)  # Joy-Con (L), Joy-Con (R)
+
+IMU_AXES = {evdev.ecodes.ABS_X, evdev.ecodes.ABS_Y, evdev.ecodes.ABS_Z,
+            evdev.ecodes.ABS_RX, evdev.ecodes.ABS_RY, evdev.ecodes.ABS_RZ}
+
+
+def joycon_side(device_name):
+    """Returns 'L' or 'R' for the IMU node name of a left or right Joy-Con, None otherwise."""
+    if "Left Joy-Con" in device_name:
+        return 'L'
+    if "Right Joy-Con" in device_name:
+        return 'R'
+    return None
+
+
+def is_joycon_imu(device):
+    """
+    Tells whether an evdev device is the IMU node of a Joy-Con: a Nintendo Joy-Con
+    with the accelerometer input property and the six accel/gyro axes.
+    """
+    if device.info.vendor != JOYCON_VENDOR_ID or device.info.product not in JOYCON_PRODUCT_IDS:
+        return False
+    if evdev.ecodes.INPUT_PROP_ACCELEROMETER not in device.input_props():
+        return False
+    axes = {code for code, _ in device.capabilities(absinfo=True).get(evdev.ecodes.EV_ABS, [])}
+    return IMU_AXES <= axes
+
+
+def find_joycon_imus():
+    """
+    Returns the paths of the IMU nodes of all connected Joy-Cons, from sysfs
+    (see device_registry.scan_input_nodes), or by opening every input device
+    if sysfs is not available.
+    """
+    if os.path.isdir(SYSFS_INPUT):
+        return [node.path for node in scan_input_nodes() if node.accelerometer]
+    paths = []
+    for path in evdev.list_devices():
+        try:
+            device = evdev.InputDevice(path)
+        except OSError:
+            continue  # gone or no permission
+        try:
+            if is_joycon_imu(device):
+                paths.append(path)
+        finally:
+            device.close()
+    return sorted(paths)
+
+
+class JoyConHub:
+    """
+    Reads any number of Joy-Cons from a single epoll loop.
+
+    Every device is a myJoyCon with its own filter, registered in one selector;
+    there is no task or thread per device. The Joy-Cons and their published
+    states are indexed in the order they were added (`joycons[i]`, `states[i]`).
+
+    Controllers that disconnect keep their slot, filter state and calibration.
+    New input devices are watched through udev (pyudev), or by rescanning
+    /dev/input every `rescan_interval` seconds while a controller is missing if
+    pyudev is not installed; a Joy-Con that comes back is reattached to its slot
+    and new Joy-Cons get a new one.
+
+    Parameters:
+    - device_paths: IMU nodes to read, all the connected Joy-Cons if None
+    - estimator: orientation filter of every device (see myJoyCon.set_estimator)
+    - hotplug: watch for reconnecting and new Joy-Cons
+    - rescan_interval: seconds between rescans when pyudev is not available
+    - raw: read the devices through the raw read path (see myJoyCon.read_raw), which
+           avoids one Python object per event when many controllers are read
+    - calibration_path: cache of the controllers' gyro bias and accel scale
+                        (see imu_calibration.CalibrationCache), e.g. DEFAULT_CACHE_PATH;
+                        None to not keep one
+    - workers: run the orientation filters in this many worker processes
+               (see filter_pool.FilterPool), 0 to filter in the reading thread
+    - streams: publish every sample of every Joy-Con to shared memory, for
+               consumers in other processes (see imu_stream.ImuSubscriber)
+    """
+
+    def __init__(self, device_paths=None, estimator='complementary', hotplug=True, rescan_interval=0.5,
+                 raw=False, calibration_path=None, workers=0, streams=False):
+        self.selector = selectors.DefaultSelector()
+        self.joycons = []
+        self.states = []
+        self.estimator = estimator
+        self.raw = raw
+        self.calibration = CalibrationCache(calibration_path) if calibration_path else None
+        self.pool = FilterPool(workers) if workers else None
+        self.streams = streams
+        self.rescan_interval = rescan_interval
+        self.updated = None  # asyncio.Event given to every Joy-Con added, see myJoyCon.updated
+        self._loop = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._scan_handle = None
+        self._last_scan = time.monotonic()
+
+        self._udev_monitor = None
+        if hotplug and pyudev is not None:
+            self._udev_monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            self._udev_monitor.filter_by('input')
+            self._udev_monitor.start()
+            self.selector.register(self._udev_monitor.fileno(), selectors.EVENT_READ, None)
+        self._rescan = hotplug and pyudev is None
+
+        if device_paths is None:
+            device_paths = find_joycon_imus()
+        for device_path in device_paths:
+            self.add(device_path, estimator)
+
+    def add(self, device_path, estimator='complementary', device=None):
+        """Starts reading a Joy-Con and returns its index."""
+        if self.pool is not None and isinstance(estimator, str):
+            estimator = self.pool.estimator(estimator, **myJoyCon._FILTER_PARAMS.get(estimator, {}))
+        joycon = myJoyCon(device_path, device, estimator, self.calibration)
+        if self.streams:
+            print(f"Publishing {joycon.device.name} to shared memory as {joycon.open_stream()}")
+        self.joycons.append(joycon)
+        self.states.append(joycon.state)
+        self._register(joycon)
+        if self.updated is not None:
+            joycon.updated = self.updated
+            self.updated.set()  # a new Joy-Con to show
+        return len(self.joycons) - 1
+
+    def _register(self, joycon):
+        self.selector.register(joycon.device.fd, selectors.EVENT_READ, joycon)
+        if self._loop is not None:
+            self._loop.add_reader(joycon.device.fd, self._read, joycon)
+
+    def _detach(self, joycon):
+        self.selector.unregister(joycon.device.fd)
+        if self._loop is not None:
+            self._loop.remove_reader(joycon.device.fd)
+        joycon.detach()
+        print(f"Lost JoyCon {joycon.uid} ({joycon.device.name}), waiting for it to reconnect")
+
+    def _read(self, joycon):
+        """Handles every event queued on a device and returns how many there were."""
+        if self.raw:
+            try:
+                return joycon.read_raw()
+            except OSError:
+                self._detach(joycon)
+                return 0
+        n = 0
+        try:
+            for event in joycon.device.read():
+                joycon.handle_event(event)
+                n += 1
+        except BlockingIOError:
+            pass
+        except OSError:
+            # Device gone (e.g. Bluetooth dropout)
+            self._detach(joycon)
+        return n
+
+    def _attach(self, device_path, latency=0.0):
+        """Attaches a new input device if it is a Joy-Con IMU: to its old slot if it had one."""
+        start = time.monotonic()
+        if any(joycon.connected and joycon.device.path == device_path for joycon in self.joycons):
+            return
+        try:
+            device = evdev.InputDevice(device_path)
+        except OSError:
+            return
+        if not is_joycon_imu(device):
+            device.close()
+            return
+
+        uid = myJoyCon._device_uid(device)
+        for joycon in self.joycons:
+            if joycon.uid == uid:
+                if joycon.connected:
+                    device.close()  # already read through another node
+                    return
+                joycon.reattach(device, latency + time.monotonic() - start)
+                self._register(joycon)
+                return
+        self.add(device_path, self.estimator, device)
+
+    def _handle_udev(self):
+        for udev_device in iter(lambda: self._udev_monitor.poll(0), None):
+            if (udev_device.action == 'add' and udev_device.device_node
+                    and udev_device.sys_name.startswith('event')):
+                # Time since udev finished setting up the node, to report the full attach latency
+                latency = udev_device.time_since_initialized.total_seconds()
+                self._attach(udev_device.device_node, latency)
+
+    def _scan(self):
+        self._last_scan = time.monotonic()
+        if any(not joycon.connected for joycon in self.joycons):
+            for device_path in find_joycon_imus():
+                self._attach(device_path)
+
+    def rescan_due(self):
+        """
+        Seconds until the next rescan for missing Joy-Cons, None if the hub does not
+        rescan (pyudev notifies it instead, or hotplug is off). The rescans happen in poll().
+        """
+        if not self._rescan:
+            return None
+        return max(0.0, self._last_scan + self.rescan_interval - time.monotonic())
+
+    def poll(self, timeout=None):
+        """Waits for events on any device, handles them and returns how many there were."""
+        if self._rescan:
+            timeout = self.rescan_interval if timeout is None else min(timeout, self.rescan_interval)
+        n = 0
+        for key, _ in self.selector.select(timeout):
+            if key.data is None:
+                self._handle_udev()
+            else:
+                n += self._read(key.data)
+        if self._rescan and time.monotonic() - self._last_scan >= self.rescan_interval:
+            self._scan()
+        return n
+
+    def run(self):
+        """Reads the devices forever (blocking)."""
+        while True:
+            self.poll()
+
+    def start(self):
+        """
+        Reads the devices in a background thread, so a slow consumer (e.g. a GUI redraw)
+        never delays the reads and the kernel event buffers do not overflow. The states
+        can be read from any thread with JoyConState.read_into(). See stop().
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_until_stopped, name="JoyConHub", daemon=True)
+        self._thread.start()
+
+    def _run_until_stopped(self):
+        while not self._stop.is_set():
+            self.poll(0.1)
+
+    def stop(self):
+        """Stops the thread started with start()."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def attach(self, loop):
+        """Reads the devices from an asyncio event loop, with one reader callback per device."""
+        self._loop = loop
+        for joycon in self.joycons:
+            if joycon.connected:
+                loop.add_reader(joycon.device.fd, self._read, joycon)
+        if self._udev_monitor is not None:
+            loop.add_reader(self._udev_monitor.fileno(), self._handle_udev)
+        if self._rescan:
+            self._schedule_scan()
+
+    def _schedule_scan(self):
+        self._scan()
+        self._scan_handle = self._loop.call_later(self.rescan_interval, self._schedule_scan)
+
+    def get_connection_stats(self):
+        """Connection statistics of every Joy-Con (see myJoyCon.get_connection_stats)."""
+        return [joycon.get_connection_stats() for joycon in self.joycons]
+
+    def get_ingest_stats(self):
+        """Ingestion statistics of every Joy-Con (see myJoyCon.get_ingest_stats)."""
+        return [joycon.get_ingest_stats() for joycon in self.joycons]
+
+    def close(self):
+        self.stop()
+        for joycon in self.joycons:
+            joycon.save_calibration()
+            joycon.close_stream()
+            if joycon.connected:
+                if self._loop is not None:
+                    self._loop.remove_reader(joycon.device.fd)
+                joycon.device.close()
+        if self._udev_monitor is not None and self._loop is not None:
+            self._loop.remove_reader(self._udev_monitor.fileno())
+        if self._scan_handle is not None:
+            self._scan_handle.cancel()
+        if self.pool is not None:
+            self.pool.close()
+        self.selector.close()
@@ -17,6 +17,7 @@ class JoyConIMU:
         self.joycon = JoyCon(*joycon_id)
         self.orientation = np.array([0, 0, 1])  # Default orientation (pointing upwards)
         self.alpha = 0.98  # Complementary filter parameter
+        self.last_update = None  # time of the previous update, to measure dt
 
     def read_imu(self):
         """
@@ -27,12 +28,16 @@ class JoyConIMU:
         gyro = np.array([data["gyro_x"], data["gyro_y"], data["gyro_z"]])
         return acc, gyro
 
-    def update_orientation(self, dt=0.01):
+    def update_orientation(self, dt=None):
         """
         Updates the orientation vector using a complementary filter.
-        - dt: Time step for integration (in seconds).
+        - dt: Time step for integration (in seconds), measured since the previous update if None.
         """
         acc, gyro = self.read_imu()
+        now = time.monotonic()
+        if dt is None:
+            dt = 0.0 if self.last_update is None else now - self.last_update
+        self.last_update = now
 
         # Normalize accelerometer data to get a gravity vector
         acc_norm = acc / np.linalg.norm(acc)
@@ -52,6 +57,8 @@ class JoyConIMU:
 
         return self.orientation
 
+# pyjoycon only exposes one IMU sample per report: joycon_hid.HidImuReader reads all
+# three from an asyncio loop, for both Joy-Cons at once.
 if __name__ == "__main__":
     imu = JoyConIMU(is_right_joycon=True)  # Set to False for the left Joy-Con
 
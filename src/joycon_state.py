@@ -0,0 +1,66 @@
+import time
+
+
+class JoyConState:
+    """
+    Latest IMU sample and orientation of one Joy-Con.
+
+    The writer publishes a whole sample at once with publish(); readers copy it into
+    their own JoyConState with read_into(), which never allocates. A sequence number
+    works as a seqlock: it is odd while a sample is being written and increases by 2
+    with every published sample, so readers in other threads can retry on a torn read
+    and tell whether anything changed since their last copy.
+    """
+
+    __slots__ = ('seq', 't', 'ax', 'ay', 'az', 'gx', 'gy', 'gz', 'roll', 'pitch', 'yaw')
+
+    def __init__(self):
+        self.seq = 0
+        self.t = 0.0
+        self.ax = self.ay = self.az = 0.0  # accel in G
+        self.gx = self.gy = self.gz = 0.0  # gyro in deg/s
+        self.roll = self.pitch = self.yaw = 0.0  # orientation in degrees
+
+    def publish(self, t, accel, gyro, orientation, count=1):
+        """
+        Writes a new sample (accel and gyro as (x, y, z), orientation as (roll, pitch, yaw)).
+        When a batch of samples was filtered at once, only the last one is written and
+        `count` tells how many it stands for, so the sequence number still counts them all.
+        """
+        self.seq += 1
+        self.t = t
+        self.ax, self.ay, self.az = accel
+        self.gx, self.gy, self.gz = gyro
+        self.roll, self.pitch, self.yaw = orientation
+        self.seq += 2 * count - 1
+
+    def changed_since(self, seq):
+        return self.seq != seq
+
+    def snapshot(self):
+        """Returns a consistent copy of the latest sample, as a new JoyConState."""
+        snapshot = JoyConState()
+        self.read_into(snapshot)
+        return snapshot
+
+    def read_into(self, snapshot):
+        """
+        Copies a consistent sample into `snapshot`.
+
+        Returns:
+        - True if the sample is newer than the one `snapshot` held, False otherwise.
+        """
+        while True:
+            seq = self.seq
+            if seq == snapshot.seq:
+                return False
+            if seq & 1:
+                time.sleep(0)  # being written, let the writer thread finish
+                continue
+            snapshot.t = self.t
+            snapshot.ax, snapshot.ay, snapshot.az = self.ax, self.ay, self.az
+            snapshot.gx, snapshot.gy, snapshot.gz = self.gx, self.gy, self.gz
+            snapshot.roll, snapshot.pitch, snapshot.yaw = self.roll, self.pitch, self.yaw
+            if self.seq == seq:
+                snapshot.seq = seq
+                return True
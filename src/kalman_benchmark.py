@@ -0,0 +1,90 @@
+import math
+import timeit
+import numpy as np
+from kalman_filter import TiltKalmanFilter
+from myjoycon import myJoyCon
+
+SAMPLE_RATE = 200  # Joy-Con IMU samples per second
+N_UPDATES = 20000
+REPEAT = 5  # runs per implementation, the fastest is kept
+
+
+class LegacyKalmanFilter:
+    """The original myJoyCon._update_orientation_Kalman, kept as the benchmark baseline."""
+
+    def __init__(self, process_noise, measurement_noise):
+        self.state = np.zeros((4, 1))  # [roll, pitch, roll_bias, pitch_bias]
+        self.P = np.eye(4)  # State covariance matrix
+        self.Q = np.eye(4) * process_noise  # Process noise covariance
+        self.R = np.eye(2) * measurement_noise  # Measurement noise covariance
+
+    def update(self, gyro_x, gyro_y, accel_roll, accel_pitch, dt):
+        # Predict Step
+        F = np.eye(4)
+        F[0, 2] = -dt
+        F[1, 3] = -dt
+
+        u = np.array([[gyro_x - self.state[2, 0]],
+                      [gyro_y - self.state[3, 0]],
+                      [0],
+                      [0]])
+
+        self.state = F @ self.state + u * dt
+        self.P = F @ self.P @ F.T + self.Q
+
+        # Measurement Update Step
+        z = np.array([[accel_roll],
+                      [accel_pitch]])
+
+        H = np.array([[1, 0, 0, 0],
+                      [0, 1, 0, 0]])
+
+        y = z - H @ self.state
+        S = H @ self.P @ H.T + self.R
+        K = self.P @ H.T @ np.linalg.inv(S)
+        self.state = self.state + K @ y
+        self.P = (np.eye(4) - K @ H) @ self.P
+
+        return self.state[0, 0], self.state[1, 0]
+
+
+def make_samples(n):
+    """Random gyro rates (deg/s), accel angles (rad) and jittery time steps around 5 ms."""
+    rng = np.random.default_rng(0)
+    gyro = rng.normal(0, 50, (n, 2))
+    angles = rng.uniform(-math.pi / 2, math.pi / 2, (n, 2))
+    dt = 1 / SAMPLE_RATE + rng.normal(0, 2e-4, n)
+    return [(float(g[0]), float(g[1]), float(a[0]), float(a[1]), float(t)) for g, a, t in zip(gyro, angles, dt)]
+
+
+def run(make_kalman, samples, repeat=REPEAT):
+    """
+    Runs the samples through a new filter `repeat` times.
+
+    Returns:
+    - the outputs, and the time per update in microseconds of the fastest run,
+      the one least disturbed by the rest of the system
+    """
+    def updates():
+        kalman = make_kalman()
+        return [kalman.update(*sample) for sample in samples]
+
+    best = min(timeit.repeat(updates, number=1, repeat=repeat))
+    return np.array(updates()), best / len(samples) * 1e6
+
+
+if __name__ == "__main__":
+    samples = make_samples(N_UPDATES)
+    q, r = myJoyCon._PROCESS_NOISE_VARIANCE, myJoyCon._MEASUREMENT_NOISE_VARIANCE
+
+    implementations = (("legacy", lambda: LegacyKalmanFilter(q, r)),
+                       ("array", lambda: TiltKalmanFilter(q, r, scalar=False)),
+                       ("scalar", lambda: TiltKalmanFilter(q, r, scalar=True)))
+    results = [(name, *run(make_kalman, samples)) for name, make_kalman in implementations]
+    _, reference, legacy_us = results[0]  # every row is compared with this one run of the legacy filter
+
+    print(f"{'implementation': <12} {'us/update': >10} {'speedup': >8} {'max error': >10}   CPU load at {SAMPLE_RATE} Hz x controllers")
+    for name, outputs, us in results:
+        error = np.abs(outputs - reference).max()
+        load = "  ".join(f"{n}: {us * 1e-6 * SAMPLE_RATE * n * 100:5.2f}%" for n in (2, 8, 16))
+        print(f"{name: <12} {us: >10.2f} {legacy_us / us: >7.1f}x {error: >10.1e}   {load}")
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class TiltKalmanFilter:
+    """
+    Kalman filter estimating roll and pitch from gyro rates and accelerometer tilt.
+
+    State: [roll, pitch, roll_bias, pitch_bias]. The gyro rates (minus the bias)
+    drive the prediction and the accelerometer angles are the measurement.
+
+    All arrays are allocated once, the 2x2 innovation covariance is inverted in
+    closed form and the covariance is updated in Joseph form, which keeps it
+    symmetric and positive definite. With `scalar=True` the filter runs on plain
+    floats instead: roll and pitch are two independent [angle, bias] filters with
+    identical 2x2 covariances, so only three floats need to be propagated.
+
+    Parameters:
+    - process_noise: variance added to every state at each prediction
+    - measurement_noise: variance of the accelerometer angles
+    - scalar: use the pure-float implementation
+    """
+
+    def __init__(self, process_noise, measurement_noise, scalar=True):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.scalar = scalar
+
+        # Pure-float state: angles, biases and the shared covariance [[p00, p01], [p01, p11]]
+        self.roll = self.pitch = 0.0
+        self.roll_bias = self.pitch_bias = 0.0
+        self.p00, self.p01, self.p11 = 1.0, 0.0, 1.0
+
+        # Array state and preallocated work buffers
+        self.state = np.zeros((4, 1))
+        self.P = np.eye(4)  # State covariance matrix
+        self.Q = np.eye(4) * process_noise  # Process noise covariance
+        self.R = np.eye(2) * measurement_noise  # Measurement noise covariance
+        self._F = np.eye(4)
+        self._FP = np.empty((4, 4))
+        self._S_inv = np.empty((2, 2))
+        self._K = np.empty((4, 2))
+        self._IKH = np.eye(4)
+        self._IKHP = np.empty((4, 4))
+        self._KR = np.empty((4, 2))
+        self._KRK = np.empty((4, 4))
+        self._y = np.empty((2, 1))
+        self._Ky = np.empty((4, 1))
+        self._x = np.empty((4, 1))
+
+    def update(self, gyro_x, gyro_y, accel_roll, accel_pitch, dt):
+        """
+        Runs one predict + measurement step and returns the filtered (roll, pitch).
+        """
+        if self.scalar:
+            return self._update_scalar(gyro_x, gyro_y, accel_roll, accel_pitch, dt)
+        return self._update_array(gyro_x, gyro_y, accel_roll, accel_pitch, dt)
+
+    def _update_scalar(self, gyro_x, gyro_y, accel_roll, accel_pitch, dt):
+        q, r = self.process_noise, self.measurement_noise
+
+        # Predict Step
+        roll = self.roll - dt * self.roll_bias + (gyro_x - self.roll_bias) * dt
+        pitch = self.pitch - dt * self.pitch_bias + (gyro_y - self.pitch_bias) * dt
+        p00 = self.p00 - 2 * dt * self.p01 + dt * dt * self.p11 + q
+        p01 = self.p01 - dt * self.p11
+        p11 = self.p11 + q
+
+        # Measurement Update Step
+        s = p00 + r
+        k0 = p00 / s
+        k1 = p01 / s
+        y_roll = accel_roll - roll
+        y_pitch = accel_pitch - pitch
+        self.roll = roll + k0 * y_roll
+        self.pitch = pitch + k0 * y_pitch
+        self.roll_bias += k1 * y_roll
+        self.pitch_bias += k1 * y_pitch
+
+        # Joseph form: P = (I - K H) P (I - K H)' + K R K'
+        g = 1 - k0
+        self.p00 = g * g * p00 + k0 * k0 * r
+        self.p01 = g * (p01 - k1 * p00) + k0 * k1 * r
+        self.p11 = k1 * k1 * p00 - 2 * k1 * p01 + p11 + k1 * k1 * r
+
+        return self.roll, self.pitch
+
+    def _update_array(self, gyro_x, gyro_y, accel_roll, accel_pitch, dt):
+        x, P, F = self.state, self.P, self._F
+
+        # Predict Step
+        F[0, 2] = F[1, 3] = -dt
+        np.matmul(F, x, out=self._x)
+        self._x[0, 0] += (gyro_x - x[2, 0]) * dt
+        self._x[1, 0] += (gyro_y - x[3, 0]) * dt
+        x[:] = self._x
+        np.matmul(F, P, out=self._FP)
+        np.matmul(self._FP, F.T, out=P)
+        P += self.Q
+
+        # Measurement Update Step (H selects the first two states)
+        a, b = P[0, 0] + self.R[0, 0], P[0, 1] + self.R[0, 1]
+        c, d = P[1, 0] + self.R[1, 0], P[1, 1] + self.R[1, 1]
+        det = a * d - b * c
+        S_inv = self._S_inv
+        S_inv[0, 0], S_inv[0, 1] = d / det, -b / det
+        S_inv[1, 0], S_inv[1, 1] = -c / det, a / det
+        K = self._K
+        np.matmul(P[:, :2], S_inv, out=K)
+
+        self._y[0, 0] = accel_roll - x[0, 0]
+        self._y[1, 0] = accel_pitch - x[1, 0]
+        np.matmul(K, self._y, out=self._Ky)
+        x += self._Ky
+
+        # Joseph form: P = (I - K H) P (I - K H)' + K R K'
+        IKH = self._IKH
+        IKH[:, :2] = -K
+        IKH[0, 0] += 1
+        IKH[1, 1] += 1
+        np.matmul(IKH, P, out=self._IKHP)
+        np.matmul(self._IKHP, IKH.T, out=P)
+        np.matmul(K, self.R, out=self._KR)
+        np.matmul(self._KR, K.T, out=self._KRK)
+        P += self._KRK
+
+        return x[0, 0], x[1, 0]
@@ -0,0 +1,348 @@
+import hashlib
+import os
+import sys
+import time
+import numpy as np
+from joycon_geometry import JOYCON_SIZE
+
+try:
+    from stl import mesh as stl_mesh  # optional, numpy-stl, only needed for ASCII STL files
+except ImportError:
+    stl_mesh = None
+
+CAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "CAD")
+JOYCON_MESHES = {
+    'L': os.path.join(CAD_DIR, "JoyCon_L.stl"),
+    'R': os.path.join(CAD_DIR, "JoyCon_R.stl"),
+}
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "joycon_meshes")
+
+# Fraction of the triangles of the source mesh kept at each level of detail, finest first
+DEFAULT_LEVELS = (1.0, 0.5, 0.25, 0.12, 0.06)
+_CACHE_VERSION = 1  # bump when the decimation changes, to rebuild the cached levels
+
+# Binary STL: 80-byte header, triangle count, then one record per triangle
+STL_HEADER_SIZE = 84
+STL_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vectors', '<f4', (3, 3)),
+    ('attributes', '<u2'),
+])
+
+# Direction of the light baked into the face colors, in the local frame of the mesh
+LIGHT_DIRECTION = np.array([0.3, -0.4, 0.87]) / np.linalg.norm([0.3, -0.4, 0.87])
+
+
+def load_stl(path):
+    """
+    Reads the triangles of an STL file as a (F, 3, 3) float32 array.
+    Binary files are mapped straight into numpy; ASCII ones need numpy-stl.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(STL_HEADER_SIZE)
+    n = int(np.frombuffer(header, '<u4', count=1, offset=80)[0]) if len(header) == STL_HEADER_SIZE else -1
+    if n >= 0 and size == STL_HEADER_SIZE + n * STL_DTYPE.itemsize:
+        return np.fromfile(path, dtype=STL_DTYPE, offset=STL_HEADER_SIZE, count=n)['vectors']
+    if stl_mesh is None:
+        raise ValueError(f"{path} is not a binary STL file (install numpy-stl to read ASCII STL)")
+    return np.asarray(stl_mesh.Mesh.from_file(path).vectors, dtype=np.float32)
+
+
+def weld(triangles):
+    """
+    Merges the corners that triangles share into an indexed mesh.
+
+    Returns:
+    - vertices: (V, 3) array
+    - indices: (F, 3) vertex indices of every triangle
+    """
+    vertices, indices = np.unique(triangles.reshape(-1, 3), axis=0, return_inverse=True)
+    return vertices, indices.reshape(-1, 3)
+
+
+def align_to_joycon(vertices):
+    """
+    Moves a Joy-Con mesh into the local frame of the bricks of joy_con_gui: centered
+    on its bounding box, with its longest side along y, its shortest along z (as in
+    JOYCON_SIZE), and without mirroring it.
+    """
+    low, high = vertices.min(axis=0), vertices.max(axis=0)
+    centered = vertices - (low + high) / 2
+    # Axes of the mesh sorted as JOYCON_SIZE: length (x), width (y), height (z)
+    order = np.argsort(high - low)
+    target_order = np.argsort(JOYCON_SIZE)
+    axes = np.empty(3, dtype=int)
+    axes[target_order] = order
+    aligned = centered[:, axes]
+    if np.linalg.det(np.eye(3)[axes]) < 0:
+        aligned[:, 0] = -aligned[:, 0]  # an odd permutation of the axes mirrors the mesh
+    return aligned
+
+
+def cluster_vertices(vertices, indices, cell):
+    """
+    Decimates an indexed mesh by vertex clustering: the vertices in every cubic cell
+    of side `cell` are merged into their mean, and the triangles that collapse or
+    become duplicates are removed.
+
+    Returns:
+    - vertices, indices of the decimated mesh
+    """
+    keys = np.floor((vertices - vertices.min(axis=0)) / cell).astype(np.int64)
+    _, cluster, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    cluster = cluster.ravel()
+    merged = np.stack([np.bincount(cluster, vertices[:, k], len(counts)) for k in range(3)], axis=1)
+    merged /= counts[:, None]
+
+    faces = cluster[indices]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces = faces[keep]
+    _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    faces = faces[np.sort(first)]
+
+    used, faces = np.unique(faces, return_inverse=True)
+    return merged[used], faces.reshape(-1, 3)
+
+
+def decimate(vertices, indices, target_faces, iterations=24):
+    """
+    Decimates an indexed mesh to at most `target_faces` triangles, with the smallest
+    clustering cell that gets there (bisection on the cell size).
+    """
+    if len(indices) <= target_faces:
+        return vertices, indices
+    low, high = 0.0, float(np.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0)))
+    best = cluster_vertices(vertices, indices, high)
+    for _ in range(iterations):
+        cell = (low + high) / 2
+        result = cluster_vertices(vertices, indices, cell)
+        if len(result[1]) <= target_faces:
+            high, best = cell, result
+        else:
+            low = cell
+    return best
+
+
+def face_normals(triangles):
+    """Unit normals of (F, 3, 3) triangles, from their winding."""
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(lengths > 0, lengths, 1.0)
+
+
+class MeshModel:
+    """
+    One level of detail of a mesh, in the local frame of a Joy-Con brick.
+
+    `faces` has the same layout as BrickModel.faces ((F, 3, 3) instead of (6, 4, 3)),
+    so joycon_geometry.pose_faces poses meshes and bricks alike.
+
+    Parameters:
+    - vertices: (V, 3) array
+    - indices: (F, 3) vertex indices of every triangle
+    """
+
+    def __init__(self, vertices, indices):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.indices = np.ascontiguousarray(indices, dtype=np.intp)
+        self.faces = self.vertices[self.indices]  # (F, 3, 3)
+        self.normals = face_normals(self.faces).astype(np.float32)  # outward, for back-face culling
+        # Light baked into the colors, so the mesh keeps its relief without edge lines
+        self.shade = 0.55 + 0.45 * np.abs(self.normals @ LIGHT_DIRECTION)
+        for array in (self.vertices, self.indices, self.faces, self.normals):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.indices)
+
+    def face_colors(self, color, alpha=1.0):
+        """RGBA color of every face, `color` shaded by the baked light."""
+        colors = np.empty((len(self), 4))
+        colors[:, :3] = np.asarray(color)[None, :] * self.shade[:, None]
+        colors[:, 3] = alpha
+        return colors
+
+
+def view_vector(elev, azim):
+    """Unit vector towards the camera of a matplotlib 3D axis with the given elev and azim (degrees)."""
+    elev, azim = np.radians(elev), np.radians(azim)
+    return np.array([np.cos(elev) * np.cos(azim), np.cos(elev) * np.sin(azim), np.sin(elev)])
+
+
+class PosedMesh:
+    """
+    Per-frame render stage of a MeshModel: poses it and keeps only the triangles
+    that face the camera, in buffers allocated once.
+
+    The pose is a single float32 matmul of the V vertices (instead of the 3F
+    corners of pose_faces) into a preallocated array, and the triangles are then
+    gathered from it. Back faces are found from the precomputed normals, turning
+    the view vector into the local frame instead of turning every normal: about
+    half the triangles of a closed mesh are dropped before they reach
+    Poly3DCollection.set_verts and matplotlib's depth sort.
+
+    Parameters:
+    - model: MeshModel
+    - color: base RGB color, shaded by the baked light
+    - alpha: opacity; culling is only right for opaque meshes
+    - margin: triangles facing away from the view vector by less than this (cosine)
+              are kept, as the perspective of the axis shows a bit around the sides
+              (the camera of a 3D axis is ~10 box sizes away, rays are within ~6 deg)
+    """
+
+    def __init__(self, model, color, alpha=1.0, margin=0.1):
+        self.model = model
+        self.margin = margin
+        self.colors = model.face_colors(color, alpha)
+        self.vertices = np.empty_like(model.vertices)
+        self.faces = np.empty_like(model.faces)
+        self.visible = np.arange(len(model))
+
+    def pose(self, frame, cog, view=None):
+        """
+        Poses the mesh in a local frame ((3, 3), columns are the local axes) at `cog`.
+
+        Parameters:
+        - view: vector towards the camera (see view_vector), None to keep every triangle
+
+        Returns:
+        - (K, 3, 3) view of the visible triangles, valid until the next call
+        """
+        model = self.model
+        np.matmul(model.vertices, np.asarray(frame, dtype=np.float32).T, out=self.vertices)
+        self.vertices += np.asarray(cog, dtype=np.float32)
+        if view is None:
+            self.visible = np.arange(len(model))
+        else:
+            # n_world . view = n_local . (frame.T @ view)
+            facing = model.normals @ (np.asarray(frame).T @ view).astype(np.float32)
+            self.visible = np.flatnonzero(facing > -self.margin)
+        faces = self.faces[:len(self.visible)]
+        np.take(self.vertices, model.indices[self.visible], axis=0, out=faces)
+        return faces
+
+    def face_colors(self):
+        """Colors of the triangles returned by the last pose()."""
+        return self.colors[self.visible]
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_lods(path, levels=DEFAULT_LEVELS):
+    """Loads, aligns and decimates an STL file; returns one MeshModel per level, finest first."""
+    vertices, indices = weld(load_stl(path))
+    vertices = align_to_joycon(vertices)
+    source_faces = len(indices)
+    lods = []
+    for fraction in levels:
+        # Every level is decimated from the previous one, which is smaller than the source
+        vertices, indices = decimate(vertices, indices, max(4, int(fraction * source_faces)))
+        lods.append(MeshModel(vertices, indices))
+    return lods
+
+
+def load_lods(path, levels=DEFAULT_LEVELS, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Levels of detail of an STL file, from a .npz cache keyed by the hash of the file
+    and the levels, built and stored on a miss (or always built if cache_dir is None).
+
+    Returns:
+    - list of MeshModel, finest first
+    """
+    if cache_dir is None:
+        return build_lods(path, levels)
+    key = hashlib.sha256(f"{_file_hash(path)} {tuple(levels)} {_CACHE_VERSION}".encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_dir, f"{stem}-{key}.npz")
+    try:
+        with np.load(cache_path) as cached:
+            return [MeshModel(cached[f'vertices{i}'], cached[f'indices{i}']) for i in range(len(levels))]
+    except (OSError, KeyError, ValueError):
+        pass  # not cached yet, or unreadable
+
+    lods = build_lods(path, levels)
+    arrays = {}
+    for i, lod in enumerate(lods):
+        arrays[f'vertices{i}'] = lod.vertices
+        # uint16 indices whenever they fit, half the size of the default int64
+        arrays[f'indices{i}'] = lod.indices.astype(np.uint16 if len(lod.vertices) < 1 << 16 else np.uint32)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache the meshes of {path}: {e}")
+    return lods
+
+
+def joycon_lods(side, levels=DEFAULT_LEVELS, cache_dir=DEFAULT_CACHE_DIR):
+    """Levels of detail of the left ('L') or right ('R') Joy-Con mesh."""
+    return load_lods(JOYCON_MESHES[side.upper()], levels, cache_dir)
+
+
+class LodSelector:
+    """
+    Picks the level of detail that keeps the frame time under a target.
+
+    The frame time is smoothed over the last frames; the selector moves to a coarser
+    level as soon as it is above `target`, and back to a finer one only when it has
+    stayed under `headroom` x `target` for `patience` frames, so it does not flicker
+    between two levels.
+
+    Parameters:
+    - n_levels: number of levels, 0 being the finest
+    - target: frame time to stay under, in s
+    - level: level to start at
+    """
+
+    def __init__(self, n_levels, target=1 / 30, level=0, headroom=0.5, patience=30, smoothing=0.2):
+        self.n_levels = n_levels
+        self.target = target
+        self.level = level
+        self.headroom = headroom
+        self.patience = patience
+        self.smoothing = smoothing
+        self.frame_time = None
+        self._fast_frames = 0
+
+    def update(self, frame_time):
+        """Registers the time of the last frame; returns True if the level changed."""
+        if self.frame_time is None:
+            self.frame_time = frame_time
+        else:
+            self.frame_time += self.smoothing * (frame_time - self.frame_time)
+        if self.frame_time > self.target and self.level < self.n_levels - 1:
+            return self._switch(self.level + 1)
+        if self.frame_time < self.headroom * self.target and self.level > 0:
+            self._fast_frames += 1
+            if self._fast_frames >= self.patience:
+                return self._switch(self.level - 1)
+        else:
+            self._fast_frames = 0
+        return False
+
+    def _switch(self, level):
+        self.level = level
+        self.frame_time = None  # the new level has its own frame time
+        self._fast_frames = 0
+        return True
+
+
+if __name__ == "__main__":
+    # Builds (or loads) the levels of detail of both Joy-Cons and prints their sizes
+    levels = tuple(float(arg) for arg in sys.argv[1:]) or DEFAULT_LEVELS
+    for side, path in JOYCON_MESHES.items():
+        start = time.perf_counter()
+        lods = load_lods(path, levels)
+        elapsed = time.perf_counter() - start
+        sizes = ", ".join(f"{fraction:g}: {len(lod)}" for fraction, lod in zip(levels, lods))
+        print(f"Joy-Con ({side}) in {elapsed * 1000:.0f} ms, triangles per level {sizes}")
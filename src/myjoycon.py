@@ -1,123 +1,344 @@
 import evdev
-import math
 import time
 import numpy as np
+from imu_calibration import GyroCalibrator
+from imu_stream import ImuStream
+from joycon_state import JoyConState
+from orientation_filters import OrientationFilter, make_filter
+from raw_events import SYN_DROPPED, EV_SYN, FrameAssembler, RawEventReader
+from sample_clock import SampleClock, monotonic_offset, use_monotonic_clock
 
 class myJoyCon:
-    # Constants for Kalman Filter
+    # Constants for the orientation filters
     _ALPHA = 0.98 # Complementary filter constant (tunes how much we trust gyro vs accel)
     _PROCESS_NOISE_VARIANCE = 1e-5
     _MEASUREMENT_NOISE_VARIANCE = 1e-2
     _ACCEL_SENSITIVITY = 0.000244  # Convert raw accel values to G
     _GYRO_SENSITIVITY = 0.070  # Convert gyro raw values to deg/s
+    _IMU_AXES = (evdev.ecodes.ABS_X, evdev.ecodes.ABS_Y, evdev.ecodes.ABS_Z,
+                 evdev.ecodes.ABS_RX, evdev.ecodes.ABS_RY, evdev.ecodes.ABS_RZ)
+    _CALIBRATION_SAVE_INTERVAL = 60.0  # s between saves of an improving calibration
+    _FILTER_PARAMS = {
+        'complementary': {'alpha': _ALPHA},
+        'kalman': {'process_noise': _PROCESS_NOISE_VARIANCE, 'measurement_noise': _MEASUREMENT_NOISE_VARIANCE},
+    }
 
-    def __init__(self, device_path):
+    def __init__(self, device_path, device=None, estimator='complementary', calibration=None):
         self.device_path = device_path
-        self.device = evdev.InputDevice(device_path)
+        # Any object with the evdev.InputDevice interface can be given, e.g. imu_recorder.PlaybackDevice
+        self.device = device if device is not None else evdev.InputDevice(device_path)
+        # Axes of the sample being assembled
         self.gyro = {'x': 0, 'y': 0, 'z': 0}
         self.accel = {'x': 0, 'y': 0, 'z': 0}
-        self.orientation = {'roll': 0.0, 'pitch': 0.0, 'yaw': 0.0}
-        self.prev_time = time.time()
-        self.yaw_angle = 0.0
+        # Latest complete sample and orientation, published atomically
+        self.state = JoyConState()
+        self.clock = SampleClock()  # dt from kernel timestamps, late/dropped samples and jitter
+        # Whether the kernel timestamps are CLOCK_MONOTONIC, or CLOCK_REALTIME if it refused
+        self.monotonic_clock = use_monotonic_clock(self.device)
+        self._frame_pending = False  # True once an axis of the current sample has arrived
+        self._dropping = False  # True from a SYN_DROPPED until the next SYN_REPORT
+        # Ingestion counters, see get_ingest_stats()
+        self.overflows = 0  # SYN_DROPPED events: the kernel buffer was full and events were lost
+        self.resyncs = 0  # frames whose axes were read back from the kernel after an overflow
+        self.filter_resets = 0  # overflows that could not be resynced and reset the filter
+        self.set_estimator(estimator)
+        self.stream = None  # shared memory stream of every sample, see open_stream()
+        # asyncio.Event set after every sample, can be shared by several Joy-Cons; only
+        # for Joy-Cons read in the thread of its event loop (monitor(), JoyConHub.attach)
+        self.updated = None
+        # Raw read path, see read_raw()
+        self._raw_reader = None
+        self._assembler = None
 
-        # Kalman Filter initialization
-        self.state = np.zeros((4, 1))  # [roll, pitch, roll_bias, pitch_bias]
-        self.P = np.eye(4)  # State covariance matrix
-        self.Q = np.eye(4) * self._PROCESS_NOISE_VARIANCE  # Process noise covariance
-        self.R = np.eye(2) * self._MEASUREMENT_NOISE_VARIANCE  # Measurement noise covariance
+        # Connection tracking, see detach() and reattach()
+        self.uid = self._device_uid(self.device)
+        self.connected = True
+        self.disconnected_at = None
+        self.reconnects = 0
+        self.last_outage = 0.0
+        self.last_attach_latency = 0.0
+
+        # Gyro bias and accel scale, estimated online and kept per controller in a
+        # imu_calibration.CalibrationCache if one is given
+        self.calibrator = GyroCalibrator()
+        self.calibration = calibration
+        self.serial = getattr(self.device, 'uniq', None) or None  # Bluetooth address
+        self._calibration_saved_at = time.monotonic()
+        self._calibration_unsaved = False  # the calibrator changed since the last save
+        # An imu_recorder.PlaybackDevice has the calibration the Joy-Con had when it was recorded
+        recorded = getattr(self.device, 'calibration', None)
+        if recorded is not None:
+            self.calibrator.load(**recorded)
+        elif calibration is not None and calibration.apply(self.serial, self.calibrator):
+            print(f"Loaded calibration of {self.serial}: gyro bias "
+                  f"{', '.join(f'{b:+.3f}' for b in self.calibrator.gyro_bias)} deg/s")
 
         print(f"Initialized JoyCon at {device_path} ({self.device.name})")
 
+    @staticmethod
+    def _device_uid(device):
+        # Bluetooth address of the controller, which survives reconnections
+        return getattr(device, 'uniq', None) or getattr(device, 'phys', None) or device.path
+
+    def detach(self):
+        """Marks the device as gone (e.g. Bluetooth dropout), keeping filter state and calibration."""
+        self.connected = False
+        self.disconnected_at = time.monotonic()
+        try:
+            self.device.close()
+        except OSError:
+            pass
+
+    def reattach(self, device, latency=0.0):
+        """
+        Continues with a new evdev device of the same controller after a reconnection.
+
+        Parameters:
+        - device: the new evdev.InputDevice
+        - latency: seconds between the device node appearing and this call, if known
+        """
+        self.device = device
+        self.device_path = device.path
+        self.monotonic_clock = use_monotonic_clock(device)
+        self._frame_pending = False
+        self._dropping = False
+        self._raw_reader = None  # new file descriptor
+        self.clock.restart()  # do not integrate over the outage
+        self.connected = True
+        self.reconnects += 1
+        if self.disconnected_at is not None:
+            self.last_outage = time.monotonic() - self.disconnected_at
+        self.last_attach_latency = latency
+        print(f"Reattached JoyCon at {device.path} ({device.name}) after {self.last_outage:.2f} s")
+
     async def monitor(self):
-        async for event in self.device.async_read_loop():
-            if event.type == evdev.ecodes.EV_ABS:
-                self._process_event(event)
-                self._update_orientation()
+        try:
+            async for event in self.device.async_read_loop():
+                self.handle_event(event)
+        except OSError:
+            # The device went away, let the other Joy-Cons carry on
+            self.detach()
+
+    def handle_event(self, event):
+        if self._dropping:
+            # Events up to the next SYN_REPORT belong to a frame the kernel partly discarded
+            if event.type == evdev.ecodes.EV_SYN and event.code == evdev.ecodes.SYN_REPORT:
+                self._dropping = False
+                self._resync(event.timestamp())
+        elif event.type == evdev.ecodes.EV_ABS:
+            # Accumulate axes until the kernel closes the sample with SYN_REPORT
+            self._process_event(event)
+            self._frame_pending = True
+        elif event.type == evdev.ecodes.EV_SYN:
+            if event.code == evdev.ecodes.SYN_REPORT:
+                if self._frame_pending:
+                    # Run the filter once per complete accel+gyro frame
+                    self._update_orientation(event.timestamp())
+                    self._frame_pending = False
+            elif event.code == evdev.ecodes.SYN_DROPPED:
+                # The reader fell behind and the kernel discarded events
+                self.overflows += 1
+                self._dropping = True
+                self._frame_pending = False
+
+    def read_raw(self):
+        """
+        Reads and filters every event queued on the device through the raw read path
+        (see handle_events) and returns how many there were. Raises OSError like
+        evdev.InputDevice.read() if the device is gone.
+        """
+        if self._raw_reader is None:
+            self._raw_reader = RawEventReader(self.device.fd)
+        events = self._raw_reader.read()
+        if len(events):
+            self.handle_events(events)
+        return len(events)
+
+    def handle_events(self, events):
+        """
+        Filters a chunk of events given as a raw_events.INPUT_EVENT_DTYPE array, e.g. from
+        RawEventReader, without an evdev.InputEvent per event: frames are assembled with
+        array operations and passed to the filter in one batch. Same results as calling
+        handle_event() on each event.
+        """
+        if self._dropping or ((events['type'] == EV_SYN) & (events['code'] == SYN_DROPPED)).any():
+            # Rare: go through the event by event overflow handling
+            for sec, usec, type_, code, value in events.tolist():
+                self.handle_event(evdev.InputEvent(sec, usec, type_, code, value))
+            return
+
+        assembler = self._assembler
+        if assembler is None:
+            scale = (self._ACCEL_SENSITIVITY,) * 3 + (self._GYRO_SENSITIVITY,) * 3
+            assembler = self._assembler = FrameAssembler(scale)
+        # Carry the partial frame over from and back to the event by event path
+        assembler.values[:] = (self.accel['x'], self.accel['y'], self.accel['z'],
+                               self.gyro['x'], self.gyro['y'], self.gyro['z'])
+        assembler.frame_pending = self._frame_pending
+        t, imu = assembler.assemble(events)
+        self.accel['x'], self.accel['y'], self.accel['z'], \
+            self.gyro['x'], self.gyro['y'], self.gyro['z'] = assembler.values.tolist()
+        self._frame_pending = assembler.frame_pending
+
+        if len(t):
+            self._update_orientation_many(t, imu[:, :3], imu[:, 3:])
+
+    def _resync(self, timestamp):
+        """
+        Recovers from a buffer overflow: reads the current value of every IMU axis from
+        the kernel (EVIOCGABS) and filters it as the frame closed by `timestamp`. The
+        samples lost in between show up as dropped in the timing statistics.
+
+        If the axes cannot be read back (the device is gone, or does not support it,
+        e.g. imu_recorder.PlaybackDevice), the stale axes are not used: the filter is
+        reset and starts over with the next complete frame.
+        """
+        try:
+            values = [self.device.absinfo(code).value for code in self._IMU_AXES]
+        except (OSError, AttributeError):
+            self.estimator.reset()
+            self.clock.restart()
+            self.filter_resets += 1
+            return
+        for code, value in zip(self._IMU_AXES, values):
+            self._set_axis(code, value)
+        self.resyncs += 1
+        self._update_orientation(timestamp)
 
     def _process_event(self, event):
-        if event.code == evdev.ecodes.ABS_RX:
-            self.gyro['x'] = event.value * self._GYRO_SENSITIVITY # Convert gyro raw values to deg/s
-        elif event.code == evdev.ecodes.ABS_RY:
-            self.gyro['y'] = event.value * self._GYRO_SENSITIVITY # Convert gyro raw values to deg/s
-        elif event.code == evdev.ecodes.ABS_RZ:
-            self.gyro['z'] = event.value * self._GYRO_SENSITIVITY # Convert gyro raw values to deg/s
-        elif event.code == evdev.ecodes.ABS_X:
-            self.accel['x'] = event.value * self._ACCEL_SENSITIVITY # Convert accel raw values to G
-        elif event.code == evdev.ecodes.ABS_Y:
-            self.accel['y'] = event.value * self._ACCEL_SENSITIVITY # Convert accel raw values to G
-        elif event.code == evdev.ecodes.ABS_Z:
-            self.accel['z'] = event.value * self._ACCEL_SENSITIVITY # Convert accel raw values to G
-
-    def _update_orientation(self):
-        current_time = time.time()
-        dt = current_time - self.prev_time
-        self.prev_time = current_time
-
-        # Compute roll using accelerometer
-        roll = math.atan2(self.accel['y'], self.accel['z'])
-        pitch = math.atan2(-self.accel['x'], math.sqrt(self.accel['y']**2 + self.accel['z']**2))
-
-        # Compute pitch considering roll angle to extend range to [-180, 180]
-        # pitch = math.atan2(-self.accel['x'], self.accel['y'] * math.sin(roll) + self.accel['z'] * math.cos(roll))
-
-        # Integrate gyroscope data for yaw estimation
-        self.yaw_angle += self.gyro['z'] * dt
-
-        # Normalize yaw to [0, 360)
-        self.yaw_angle %= 360
-
-        # Apply Complementary Filter: Blend gyro & accel data
-        roll = self._ALPHA * (roll + math.radians(self.gyro['x'] * dt)) + (1 - self._ALPHA) * roll
-        pitch = self._ALPHA * (pitch + math.radians(self.gyro['y'] * dt)) + (1 - self._ALPHA) * pitch
-
-        self.orientation = {
-            'roll': math.degrees(roll),
-            'pitch': math.degrees(pitch),
-            'yaw': self.yaw_angle
-        }
-    
-    def _update_orientation_Kalman(self):
-        current_time = time.time()
-        dt = current_time - self.prev_time
-        self.prev_time = current_time
-
-        # Predict Step
-        F = np.eye(4)
-        F[0, 2] = -dt
-        F[1, 3] = -dt
-
-        u = np.array([[self.gyro['x'] - self.state[2, 0]],
-                      [self.gyro['y'] - self.state[3, 0]],
-                      [0],
-                      [0]])
-
-        self.state = F @ self.state + u * dt
-        self.P = F @ self.P @ F.T + self.Q
-
-        # Measurement Update Step
-        accel_roll = math.atan2(self.accel['y'], self.accel['z'])
-        accel_pitch = math.atan2(-self.accel['x'], math.sqrt(self.accel['y']**2 + self.accel['z']**2))
-        z = np.array([[accel_roll],
-                      [accel_pitch]])
-
-        H = np.array([[1, 0, 0, 0],
-                      [0, 1, 0, 0]])
-
-        y = z - H @ self.state
-        S = H @ self.P @ H.T + self.R
-        K = self.P @ H.T @ np.linalg.inv(S)
-        self.state = self.state + K @ y
-        self.P = (np.eye(4) - K @ H) @ self.P
-
-        # Update orientation
-        self.orientation = {
-            'roll': math.degrees(self.state[0, 0]),
-            'pitch': math.degrees(self.state[1, 0]),
-            'yaw': self.yaw_angle  # Yaw can be updated similarly
-        }
+        self._set_axis(event.code, event.value)
+
+    def _set_axis(self, code, value):
+        if code == evdev.ecodes.ABS_RX:
+            self.gyro['x'] = value * self._GYRO_SENSITIVITY # Convert gyro raw values to deg/s
+        elif code == evdev.ecodes.ABS_RY:
+            self.gyro['y'] = value * self._GYRO_SENSITIVITY # Convert gyro raw values to deg/s
+        elif code == evdev.ecodes.ABS_RZ:
+            self.gyro['z'] = value * self._GYRO_SENSITIVITY # Convert gyro raw values to deg/s
+        elif code == evdev.ecodes.ABS_X:
+            self.accel['x'] = value * self._ACCEL_SENSITIVITY # Convert accel raw values to G
+        elif code == evdev.ecodes.ABS_Y:
+            self.accel['y'] = value * self._ACCEL_SENSITIVITY # Convert accel raw values to G
+        elif code == evdev.ecodes.ABS_Z:
+            self.accel['z'] = value * self._ACCEL_SENSITIVITY # Convert accel raw values to G
+
+    def set_estimator(self, estimator):
+        """
+        Selects the orientation filter of this Joy-Con.
+
+        Parameters:
+        - estimator: an OrientationFilter, or the name of one in orientation_filters.FILTERS
+                     ('complementary', 'kalman', 'madgwick', 'mahony')
+        """
+        if not isinstance(estimator, OrientationFilter):
+            estimator = make_filter(estimator, **self._FILTER_PARAMS.get(estimator, {}))
+        self.estimator = estimator
+
+    def _update_orientation(self, timestamp=None):
+        # Use the kernel timestamp of the frame when available
+        if timestamp is None:
+            timestamp = time.monotonic()
+        accel = (self.accel['x'], self.accel['y'], self.accel['z'])
+        gyro = (self.gyro['x'], self.gyro['y'], self.gyro['z'])
+        if self.estimator.deferred:
+            self._update_orientation_many(np.array([timestamp]), np.array([accel]), np.array([gyro]))
+            return
+        dt = self.clock.tick(timestamp)
+        accel, gyro = self.calibrator.correct(accel, gyro)
+        orientation = self.estimator.update(accel, gyro, dt)
+        self.state.publish(timestamp, accel, gyro, orientation)
+        if self.stream is not None:
+            self.stream.publish(timestamp if self.monotonic_clock else timestamp + monotonic_offset(),
+                                accel, gyro, orientation)
+        if self.updated is not None:
+            self.updated.set()
+        if self.calibrator.updated:
+            self._calibration_updated()
+
+    def _update_orientation_many(self, t, accel, gyro):
+        dt = self.clock.tick_many(t)
+        accel, gyro = self.calibrator.correct_many(accel, gyro)
+        # A deferred estimator returns the samples it has finished, maybe earlier ones or none
+        t, accel, gyro, orientation = self.estimator.filter_samples(t, accel, gyro, dt)
+        if len(t):
+            # Readers only ever see the latest sample
+            self.state.publish(float(t[-1]), accel[-1].tolist(), gyro[-1].tolist(), orientation[-1].tolist(),
+                               len(t))
+            if self.stream is not None:
+                self.stream.publish_many(t if self.monotonic_clock else t + monotonic_offset(), accel, gyro,
+                                         orientation)
+            if self.updated is not None:
+                self.updated.set()
+        if self.calibrator.updated:
+            self._calibration_updated()
+
+    def open_stream(self, capacity=None):
+        """
+        Publishes every filtered sample to shared memory, for consumers in other
+        processes (see imu_stream.ImuSubscriber), under the serial of the Joy-Con.
+        Timestamps are converted to CLOCK_MONOTONIC if the device's clock could
+        not be switched (see monotonic_clock).
+        """
+        if self.stream is None:
+            kwargs = {} if capacity is None else {'capacity': capacity}
+            self.stream = ImuStream(self.serial or self.uid, **kwargs)
+        return self.stream.name
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def _calibration_updated(self):
+        # Once per stationary block, not per sample: the flag is cleared here
+        self.calibrator.updated = False
+        if self.calibration is None:
+            return
+        self._calibration_unsaved = True
+        # Saving is rare: the first calibration of the controller, then once in a while
+        first = self.calibrator.blocks == 1
+        if first or time.monotonic() - self._calibration_saved_at >= self._CALIBRATION_SAVE_INTERVAL:
+            self.save_calibration()
+
+    def save_calibration(self):
+        """Stores the calibration in the cache, if it has changed and there is a cache."""
+        if self.calibration is None or not self._calibration_unsaved:
+            return
+        try:
+            self.calibration.store(self.serial, self.calibrator)
+        except OSError as e:
+            print(f"Could not save the calibration of {self.serial}: {e}")
+        self._calibration_unsaved = False
+        self._calibration_saved_at = time.monotonic()
+
+    def get_calibration(self):
+        return dict(self.calibrator.as_dict(), serial=self.serial)
 
     def get_orientation(self):
-        return self.orientation
-    
+        # A copy, so the angles all come from the same sample even while another thread publishes
+        state = self.state.snapshot()
+        return {'roll': state.roll, 'pitch': state.pitch, 'yaw': state.yaw}
+
     def get_accel(self):
-        return self.accel
\ No newline at end of file
+        state = self.state.snapshot()
+        return {'x': state.ax, 'y': state.ay, 'z': state.az}
+
+    def get_timing_stats(self):
+        return self.clock.stats()
+
+    def get_ingest_stats(self):
+        return {
+            'samples': self.state.seq // 2,  # filtered samples
+            'overflows': self.overflows,  # kernel buffer overflows (SYN_DROPPED)
+            'dropped': self.clock.dropped,  # samples missing from the stream
+            'resyncs': self.resyncs,  # overflows recovered by reading the axes back
+            'filter_resets': self.filter_resets,  # overflows that reset the filter instead
+        }
+
+    def get_connection_stats(self):
+        return {
+            'connected': self.connected,
+            'reconnects': self.reconnects,
+            'last_outage': self.last_outage,  # s
+            'last_attach_latency': self.last_attach_latency * 1000,  # ms
+        }
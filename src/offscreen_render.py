@@ -0,0 +1,266 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import matplotlib
+matplotlib.use("Agg")  # before pyplot is imported by joy_con_gui, also in the workers
+import numpy as np
+from matplotlib.font_manager import FontProperties, findfont
+from mpl_toolkits.mplot3d import proj3d
+from PIL import Image, ImageDraw, ImageFont
+from imu_recorder import device_frames, open_recording, read_calibrations
+from imu_replay import replay_complementary
+from joy_con_gui import JoyConRenderer, setup_figure
+from joycon_state import JoyConState
+
+try:
+    import imageio_ffmpeg  # optional, ships an ffmpeg binary when there is none on the PATH
+except ImportError:
+    imageio_ffmpeg = None
+
+DEFAULT_SIZE = (1280, 720)  # pixels
+DEFAULT_DPI = 100
+DEFAULT_FPS = 30
+DEFAULT_MESH_LEVEL = 3  # level of detail of the meshes in videos, see mesh_lod.DEFAULT_LEVELS
+
+# Names that give the demo Joy-Cons their colors in JoyConRenderer
+DEMO_DEVICE_NAMES = ["Nintendo Switch Left Joy-Con IMU", "Nintendo Switch Right Joy-Con IMU"]
+
+
+def recording_motion(path):
+    """
+    Orientations of every Joy-Con of an imu_recorder.py recording, filtered offline
+    with imu_replay.replay_complementary.
+
+    Returns:
+    - device_names: name of every device
+    - tracks: (t, orientation) per device, with orientation as (N, 3) roll, pitch, yaw in degrees
+    """
+    device_names, frames = open_recording(path)
+    calibrations = read_calibrations(path)
+    tracks = []
+    for device in range(len(device_names)):
+        t, imu = device_frames(frames, device)
+        tracks.append((t, replay_complementary(t, imu, calibration=calibrations[device])))
+    return device_names, tracks
+
+
+def demo_motion(duration=20.0):
+    """
+    The synthetic motion of joy_con_gui_demo.display_joycons: every 0.1 s the left
+    Joy-Con rolls by 0.01 rad and the right one pitches by 0.02 rad.
+    """
+    t = np.arange(0.0, duration, 0.1)
+    steps = np.arange(len(t))
+    left = np.zeros((len(t), 3))
+    left[:, 0] = np.degrees(0.01 * steps)
+    right = np.zeros((len(t), 3))
+    right[:, 1] = np.degrees(0.02 * steps)
+    return DEMO_DEVICE_NAMES, [(t, left), (t, right)]
+
+
+def resample(tracks, fps):
+    """
+    Interpolates the tracks at the frame times of a video, from the first sample of
+    any track to the last one.
+
+    Returns:
+    - times: (T,) frame times in s from the start
+    - orientations: (T, N, 3) roll, pitch, yaw in degrees of every device
+    """
+    start = min(t[0] for t, _ in tracks if len(t))
+    stop = max(t[-1] for t, _ in tracks if len(t))
+    times = start + np.arange(int((stop - start) * fps) + 1) / fps
+    orientations = np.zeros((len(times), len(tracks), 3))
+    for i, (t, orientation) in enumerate(tracks):
+        if len(t) == 0:
+            continue
+        # Unwrapped, so the interpolation does not spin through +-180 deg
+        unwrapped = np.unwrap(orientation, period=360, axis=0)
+        for k in range(3):
+            orientations[:, i, k] = np.interp(times, t, unwrapped[:, k])
+    orientations = (orientations + 180.0) % 360.0 - 180.0
+    return times - start, orientations
+
+
+def encoder_command(path, width, height, fps):
+    """ffmpeg command that encodes raw RGBA frames read from stdin to `path`."""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None and imageio_ffmpeg is not None:
+        ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg not found: install it, or imageio-ffmpeg, or write a .rgba file")
+    return [ffmpeg, '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path]
+
+
+class TextOverlay:
+    """
+    Writes the labels of a JoyConRenderer straight into its Agg buffer with PIL,
+    in place of the matplotlib text artists, which cost more than the Joy-Cons
+    themselves to lay out and draw every frame. The labels do not move on screen
+    (the Joy-Cons turn in place and the view is fixed), so their pixel positions
+    are computed once.
+    """
+
+    def __init__(self, renderer, dpi):
+        self.renderer = renderer
+        fig, ax = renderer.fig, renderer.ax
+        height = fig.bbox.height
+        self.positions = []
+        for label in renderer.labels:
+            x, y, z = label.get_position_3d()
+            x2, y2, _ = proj3d.proj_transform(x, y, z, ax.get_proj())
+            px, py = ax.transData.transform((x2, y2))
+            self.positions.append((px, height - py))
+        px, py = renderer.fps_text.get_transform().transform(renderer.fps_text.get_position())
+        self.corner = (px, height - py)
+        for text in (*renderer.labels, renderer.fps_text):
+            text.set_visible(False)  # skipped by the blits from now on
+        properties = FontProperties()
+        self.font = ImageFont.truetype(findfont(properties), round(properties.get_size_in_points() * dpi / 72))
+        pixels = np.asarray(renderer.canvas.buffer_rgba())
+        image = Image.frombuffer("RGBA", (pixels.shape[1], pixels.shape[0]), pixels, "raw", "RGBA", 0, 1)
+        image.readonly = False  # draw into the canvas buffer itself
+        self.draw = ImageDraw.Draw(image)
+
+    def render(self, states, text):
+        """Writes the roll and pitch of every Joy-Con next to it, and `text` in the corner."""
+        for (x, y), state in zip(self.positions, states):
+            # Bottom left, like the matplotlib label anchored at its baseline
+            self.draw.multiline_text((x, y), f"Roll: {state.roll:.1f}º\nPitch: {state.pitch:.1f}º",
+                                     fill=(0, 0, 0, 255), font=self.font, anchor="ld")
+        self.draw.text(self.corner, text, fill=(0, 0, 0, 255), font=self.font, anchor="ld")
+
+
+# Renderer of the worker process, see _init_worker
+_renderer = None
+_overlay = None
+_states = None
+_slots = {}  # shared memory blocks of the frames, attached by name
+
+
+def _init_worker(device_names, mesh, size, dpi, level=DEFAULT_MESH_LEVEL):
+    global _renderer, _overlay, _states
+    fig, ax = setup_figure()
+    fig.set_size_inches(size[0] / dpi, size[1] / dpi)
+    fig.set_dpi(dpi)
+    _renderer = JoyConRenderer(fig, ax, device_names, mesh=mesh)
+    if _renderer.lod is not None:
+        _renderer.set_level(min(level, _renderer.lod.n_levels - 1))
+    _states = [JoyConState() for _ in device_names]
+    _renderer.update(_states)
+    fig.canvas.draw()  # full draw once: caches the background the frames are blitted on
+    _overlay = TextOverlay(_renderer, dpi)
+    fig.canvas.draw()  # again without the matplotlib labels
+
+
+def _slot(name, shape):
+    if name not in _slots:
+        # The workers share the resource tracker of render_video, which frees the slots
+        shm = shared_memory.SharedMemory(name=name)
+        _slots[name] = (shm, np.frombuffer(shm.buf, dtype=np.uint8).reshape(shape))
+    return _slots[name][1]
+
+
+def _render_chunk(task):
+    """
+    Renders consecutive frames into a shared memory slot, one RGBA frame after the
+    other, and returns how many there are.
+    """
+    name, times, orientations = task
+    canvas = _renderer.canvas
+    pixels = np.asarray(canvas.buffer_rgba())
+    frames = _slot(name, (-1,) + pixels.shape)
+    for k, (t, orientation) in enumerate(zip(times, orientations)):
+        for state, (roll, pitch, yaw) in zip(_states, orientation.tolist()):
+            state.roll, state.pitch, state.yaw = roll, pitch, yaw
+        _renderer.update(_states)
+        _renderer.render()
+        _overlay.render(_states, f"t = {t:6.2f} s")
+        frames[k] = pixels  # the Agg buffer as is, alpha included: no strided copy
+    return len(times)
+
+
+def render_video(path, device_names, tracks, fps=DEFAULT_FPS, workers=None, mesh=False, size=DEFAULT_SIZE,
+                 dpi=DEFAULT_DPI, chunk_frames=8, level=DEFAULT_MESH_LEVEL):
+    """
+    Renders the motion of the Joy-Cons to a video, offscreen, without a window or
+    plt.pause: the frames are drawn with the Agg backend by a pool of processes,
+    each blitting the Joy-Cons on a cached background as the live GUI does, and
+    their raw RGBA buffers are piped in order to ffmpeg, never written to disk.
+
+    The workers render chunks of frames into shared memory slots, which are written
+    to ffmpeg straight from there and then reused: only 2 chunks per worker are in
+    flight, so memory stays bounded however slow ffmpeg is, and the frames are not
+    pickled.
+
+    Parameters:
+    - path: output video, or a .rgba file to get the raw frames without encoding
+    - device_names, tracks: as returned by recording_motion or demo_motion
+    - fps: frame rate of the video
+    - workers: rendering processes, one per core by default
+    - mesh: draw the STL meshes instead of bricks (see JoyConRenderer)
+    - size: (width, height) in pixels, even for yuv420p
+    - chunk_frames: frames rendered per task
+    - level: level of detail of the meshes (see mesh_lod.DEFAULT_LEVELS), 0 for the full meshes
+
+    Returns:
+    - (frames rendered, seconds of motion, seconds taken)
+    """
+    start = time.perf_counter()
+    times, orientations = resample(tracks, fps)
+    chunks = deque((times[i:i + chunk_frames], orientations[i:i + chunk_frames])
+                   for i in range(0, len(times), chunk_frames))
+    workers = workers or os.cpu_count() or 1
+    frame_size = size[0] * size[1] * 4
+
+    if path.endswith(".rgba"):
+        output, encoder = open(path, 'wb'), None
+    else:
+        encoder = subprocess.Popen(encoder_command(path, *size, fps), stdin=subprocess.PIPE)
+        output = encoder.stdin
+    context = multiprocessing.get_context('spawn')
+    free = [shared_memory.SharedMemory(create=True, size=chunk_frames * frame_size)
+            for _ in range(min(2 * workers, len(chunks)))]
+    slots = list(free)
+    try:
+        with context.Pool(workers, initializer=_init_worker, initargs=(device_names, mesh, size, dpi, level)) as pool:
+            pending = deque()  # (slot, result) in the order of the chunks
+            while chunks or pending:
+                while chunks and free:
+                    slot = free.pop()
+                    chunk_times, chunk_orientations = chunks.popleft()
+                    pending.append((slot, pool.apply_async(_render_chunk,
+                                                           ((slot.name, chunk_times, chunk_orientations),))))
+                slot, result = pending.popleft()
+                with slot.buf[:result.get() * frame_size] as frames:
+                    output.write(frames)
+                free.append(slot)
+    finally:
+        for slot in slots:
+            slot.close()
+            slot.unlink()
+        output.close()
+        if encoder is not None and encoder.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {encoder.returncode}")
+    duration = times[-1] + 1 / fps if len(times) else 0.0
+    return len(times), duration, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    # python offscreen_render.py OUTPUT [RECORDING] [--mesh]
+    args = [arg for arg in sys.argv[1:] if arg != "--mesh"]
+    if not args:
+        print("Usage: python offscreen_render.py OUTPUT.mp4 [RECORDING] [--mesh]")
+        print("       renders an imu_recorder.py recording, or the motion of joy_con_gui_demo.py")
+        sys.exit(1)
+    device_names, tracks = recording_motion(args[1]) if len(args) > 1 else demo_motion()
+    frames, duration, elapsed = render_video(args[0], device_names, tracks, mesh="--mesh" in sys.argv)
+    print(f"{frames} frames ({duration:.1f} s) rendered to {args[0]} in {elapsed:.1f} s, "
+          f"{duration / elapsed:.1f}x real time")
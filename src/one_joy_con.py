@@ -4,56 +4,105 @@ import matplotlib.pyplot as plt
 import numpy as np
 import sys
 import time
+from device_registry import get_registry
+from sample_clock import SampleClock, use_monotonic_clock
 
 def read_joycon_imu(device_path):
+    global overflows
     try:
         device = evdev.InputDevice(device_path)
         print(f"Listening to {device_path} ({device.name})")
+        use_monotonic_clock(device)
     except FileNotFoundError:
         print(f"Error: Device {device_path} not found.")
         return
     
     gyro = {'x': 0, 'y': 0, 'z': 0}
     accel = {'x': 0, 'y': 0, 'z': 0}
+    dropping = False  # True from a SYN_DROPPED until the next SYN_REPORT
+    frame_pending = False  # True once an axis of the current sample has arrived
     
     for event in device.read_loop():
-        if event.type == evdev.ecodes.EV_ABS:
-            abs_event = evdev.categorize(event)
-            
-            if abs_event.event.code == evdev.ecodes.ABS_RX:
-                gyro['x'] = abs_event.event.value
-            elif abs_event.event.code == evdev.ecodes.ABS_RY:
-                gyro['y'] = abs_event.event.value
-            elif abs_event.event.code == evdev.ecodes.ABS_RZ:
-                gyro['z'] = abs_event.event.value
-            elif abs_event.event.code == evdev.ecodes.ABS_X:
-                accel['x'] = abs_event.event.value
-            elif abs_event.event.code == evdev.ecodes.ABS_Y:
-                accel['y'] = abs_event.event.value
-            elif abs_event.event.code == evdev.ecodes.ABS_Z:
-                accel['z'] = abs_event.event.value
-            
-            orientation = calculate_orientation(accel, gyro)
-            show_orientation(orientation)
-            # plot_orientation_vector(orientation)
+        if dropping:
+            # The kernel discarded part of this frame: read every axis back (EVIOCGABS)
+            if event.type == evdev.ecodes.EV_SYN and event.code == evdev.ecodes.SYN_REPORT:
+                dropping = False
+                frame_pending = False
+                if resync_axes(device, accel, gyro):
+                    orientation = calculate_orientation(accel, gyro, event.timestamp())
+                    show_orientation(orientation)
+
+        elif event.type == evdev.ecodes.EV_ABS:
+            set_axis(accel, gyro, event.code, event.value)
+            frame_pending = True
+
+        elif event.type == evdev.ecodes.EV_SYN and event.code == evdev.ecodes.SYN_REPORT:
+            # One complete IMU sample: integrate with its kernel timestamp. A report
+            # without any axis carries no new sample and would tick the clock for nothing
+            if frame_pending:
+                frame_pending = False
+                orientation = calculate_orientation(accel, gyro, event.timestamp())
+                show_orientation(orientation)
+                # plot_orientation_vector(orientation)
+
+        elif event.type == evdev.ecodes.EV_SYN and event.code == evdev.ecodes.SYN_DROPPED:
+            # The reader fell behind and the kernel buffer overflowed
+            overflows += 1
+            dropping = True
+
+def set_axis(accel, gyro, code, value):
+    if code == evdev.ecodes.ABS_RX:
+        gyro['x'] = value
+    elif code == evdev.ecodes.ABS_RY:
+        gyro['y'] = value
+    elif code == evdev.ecodes.ABS_RZ:
+        gyro['z'] = value
+    elif code == evdev.ecodes.ABS_X:
+        accel['x'] = value
+    elif code == evdev.ecodes.ABS_Y:
+        accel['y'] = value
+    elif code == evdev.ecodes.ABS_Z:
+        accel['z'] = value
+
+def resync_axes(device, accel, gyro):
+    """
+    Reads every IMU axis back from the kernel after an overflow and returns True, or
+    False if the device cannot be queried (e.g. it was unplugged): the stale axes are
+    not used, the clock restarts and the next complete frame is filtered instead.
+    """
+    global resyncs
+    try:
+        values = [device.absinfo(code).value for code in IMU_AXES]
+    except OSError:
+        clock.restart()
+        return False
+    for code, value in zip(IMU_AXES, values):
+        set_axis(accel, gyro, code, value)
+    resyncs += 1
+    return True
 
 def show_orientation(orientation):
-    sys.stdout.write(f"\rOrientation Vector: Roll={orientation['roll']: >+6.1f}°, Pitch={orientation['pitch']: >+6.1f}°, Yaw={orientation['yaw']: >+6.1f}°")
+    sys.stdout.write(f"\rOrientation Vector: Roll={orientation['roll']: >+6.1f}°, Pitch={orientation['pitch']: >+6.1f}°, Yaw={orientation['yaw']: >+6.1f}°"
+                     f"  overflows={overflows} resyncs={resyncs}")
     sys.stdout.flush()
 
 
-prev_time = time.time()
+clock = SampleClock()  # dt from kernel timestamps, late/dropped samples and jitter
 yaw_angle = 0.0  # Initialize yaw angle
+overflows = 0  # SYN_DROPPED events: the kernel buffer was full and events were lost
+resyncs = 0  # frames whose axes were read back from the kernel after an overflow
+
+IMU_AXES = (evdev.ecodes.ABS_X, evdev.ecodes.ABS_Y, evdev.ecodes.ABS_Z,
+            evdev.ecodes.ABS_RX, evdev.ecodes.ABS_RY, evdev.ecodes.ABS_RZ)
 
 ALPHA = 0.98  # Complementary filter constant (tunes how much we trust gyro vs accel)
 GYRO_SENSITIVITY = 131.0  # Assuming ±250 dps range (check your device specs)
 
-def calculate_orientation(accel, gyro):
-    global yaw_angle, prev_time
+def calculate_orientation(accel, gyro, timestamp=None):
+    global yaw_angle
 
-    current_time = time.time()
-    dt = current_time - prev_time
-    prev_time = current_time
+    # Use the kernel timestamp of the event when available
+    dt = clock.tick(time.monotonic() if timestamp is None else timestamp)
 
     # Compute roll and pitch using accelerometer
     roll = math.atan2(accel['y'], accel['z'])
@@ -126,4 +175,9 @@ def plot_orientation_vector(orientation):
     plt.show()
 
 if __name__ == "__main__":
-    read_joycon_imu('/dev/input/event22')
+    # IMU node given on the command line, or the one of the first Joy-Con found
+    imu_nodes = sys.argv[1:2] or get_registry().imu_nodes()
+    if imu_nodes:
+        read_joycon_imu(imu_nodes[0])
+    else:
+        print("No Joy-Con found")
@@ -0,0 +1,264 @@
+import math
+from abc import ABC, abstractmethod
+import numpy as np
+from kalman_filter import TiltKalmanFilter
+
+
+class OrientationFilter(ABC):
+    """
+    Interface of the orientation estimators used by myJoyCon.
+
+    update() takes one IMU sample, accel in G and gyro in deg/s as (x, y, z) tuples,
+    plus the time step in seconds, and returns (roll, pitch, yaw) in degrees with
+    yaw normalized to [0, 360).
+    """
+
+    @abstractmethod
+    def update(self, accel, gyro, dt):
+        """Filters one sample and returns (roll, pitch, yaw) in degrees."""
+
+    def update_many(self, accel, gyro, dt):
+        """
+        Filters a batch of samples, (N, 3) accel and gyro arrays and (N,) time steps,
+        and returns the (N, 3) array of orientations. Filters that can, vectorize it.
+        """
+        out = np.empty((len(dt), 3))
+        for i, (a, g, step) in enumerate(zip(accel.tolist(), gyro.tolist(), dt.tolist())):
+            out[i] = self.update(a, g, step)
+        return out
+
+    # True for filters that run elsewhere and return their latest result, not the
+    # orientation of the sample just given (filter_pool.RemoteEstimator): myJoyCon
+    # then publishes the samples filter_samples() returns, with their own timestamps
+    deferred = False
+
+    def filter_samples(self, t, accel, gyro, dt):
+        """
+        Filters a batch of samples taken at times t (see update_many) and returns the
+        samples whose orientation is known, as arrays t, accel, gyro and orientation:
+        all of them, unless the filter is deferred.
+        """
+        return t, accel, gyro, self.update_many(accel, gyro, dt)
+
+    @abstractmethod
+    def reset(self):
+        """Forgets the orientation, e.g. after samples were lost."""
+
+
+def accel_tilt(accel):
+    """Roll and pitch (radians) of the gravity vector measured by the accelerometer."""
+    ax, ay, az = accel
+    return math.atan2(ay, az), math.atan2(-ax, math.sqrt(ay**2 + az**2))
+
+
+class ComplementaryFilter(OrientationFilter):
+    """
+    Blends the accelerometer tilt with the gyro rates; yaw is integrated open-loop.
+
+    Parameters:
+    - alpha: how much we trust gyro vs accel
+    """
+
+    def __init__(self, alpha=0.98):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.yaw_angle = 0.0
+
+    def update(self, accel, gyro, dt):
+        roll, pitch = accel_tilt(accel)
+
+        # Integrate gyroscope data for yaw estimation, normalized to [0, 360)
+        self.yaw_angle += gyro[2] * dt
+        self.yaw_angle %= 360
+
+        # Apply Complementary Filter: Blend gyro & accel data
+        roll = self.alpha * (roll + math.radians(gyro[0] * dt)) + (1 - self.alpha) * roll
+        pitch = self.alpha * (pitch + math.radians(gyro[1] * dt)) + (1 - self.alpha) * pitch
+
+        return math.degrees(roll), math.degrees(pitch), self.yaw_angle
+
+    def update_many(self, accel, gyro, dt):
+        # Roll and pitch only depend on the current sample and yaw is a running sum
+        ax, ay, az = accel.T
+        out = np.empty((len(dt), 3))
+        roll, pitch, yaw = out.T
+        np.arctan2(ay, az, out=roll)
+        np.arctan2(-ax, np.sqrt(ay * ay + az * az), out=pitch)
+        # Blend gyro & accel data: alpha * (angle + gyro dt) + (1 - alpha) * angle
+        rate = gyro * dt[:, None]
+        roll += math.radians(self.alpha) * rate[:, 0]
+        pitch += math.radians(self.alpha) * rate[:, 1]
+        np.degrees(out[:, :2], out=out[:, :2])
+        np.cumsum(rate[:, 2], out=yaw)
+        yaw += self.yaw_angle
+        yaw %= 360
+        if len(dt):
+            self.yaw_angle = float(yaw[-1])
+        return out
+
+
+class KalmanFilter(OrientationFilter):
+    """
+    Kalman filter on roll, pitch and their gyro biases (see TiltKalmanFilter).
+    Yaw is not observable from the accelerometer and is not estimated (always 0).
+    """
+
+    def __init__(self, process_noise=1e-5, measurement_noise=1e-2, scalar=True):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.scalar = scalar
+        self.reset()
+
+    def reset(self):
+        self.kalman = TiltKalmanFilter(self.process_noise, self.measurement_noise, self.scalar)
+
+    def update(self, accel, gyro, dt):
+        accel_roll, accel_pitch = accel_tilt(accel)
+        roll, pitch = self.kalman.update(gyro[0], gyro[1], accel_roll, accel_pitch, dt)
+        return math.degrees(roll), math.degrees(pitch), 0.0
+
+
+class QuaternionFilter(OrientationFilter):
+    """
+    Base for the quaternion estimators: keeps the attitude as a unit quaternion
+    (w, x, y, z), which has no gimbal lock, and converts it to Euler angles on output.
+    The quaternion is initialized from the gravity direction of the first sample.
+    """
+
+    def reset(self):
+        self.quaternion = (1.0, 0.0, 0.0, 0.0)
+        self._initialized = False
+
+    def _init_from_accel(self, accel):
+        roll, pitch = accel_tilt(accel)
+        cr, sr = math.cos(roll / 2), math.sin(roll / 2)
+        cp, sp = math.cos(pitch / 2), math.sin(pitch / 2)
+        self.quaternion = (cr * cp, sr * cp, cr * sp, -sr * sp)
+        self._initialized = True
+
+    def euler(self):
+        """Returns (roll, pitch, yaw) in degrees."""
+        w, x, y, z = self.quaternion
+        roll = math.atan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+        pitch = math.asin(max(-1.0, min(1.0, 2 * (w * y - z * x))))
+        yaw = math.atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+        return math.degrees(roll), math.degrees(pitch), math.degrees(yaw) % 360
+
+    def update(self, accel, gyro, dt):
+        if not self._initialized and any(accel):
+            self._init_from_accel(accel)
+        gx, gy, gz = (math.radians(g) for g in gyro)
+        self._step(accel, gx, gy, gz, dt)
+        return self.euler()
+
+    @abstractmethod
+    def _step(self, accel, gx, gy, gz, dt):
+        """Advances the quaternion by one sample, gyro rates in rad/s."""
+
+    @staticmethod
+    def _integrate(q, gx, gy, gz, dot_correction, dt):
+        """Integrates q' = 0.5 q * (0, g) - correction and renormalizes."""
+        w, x, y, z = q
+        cw, cx, cy, cz = dot_correction
+        dw = 0.5 * (-x * gx - y * gy - z * gz) - cw
+        dx = 0.5 * (w * gx + y * gz - z * gy) - cx
+        dy = 0.5 * (w * gy - x * gz + z * gx) - cy
+        dz = 0.5 * (w * gz + x * gy - y * gx) - cz
+        w, x, y, z = w + dw * dt, x + dx * dt, y + dy * dt, z + dz * dt
+        norm = 1 / math.sqrt(w * w + x * x + y * y + z * z)
+        return w * norm, x * norm, y * norm, z * norm
+
+
+class MadgwickFilter(QuaternionFilter):
+    """
+    Madgwick gradient-descent orientation filter (IMU version, ~150 flops per sample).
+
+    Parameters:
+    - beta: gain of the accelerometer correction (rad/s), higher converges faster but is noisier
+    """
+
+    def __init__(self, beta=0.1):
+        self.beta = beta
+        self.reset()
+
+    def _step(self, accel, gx, gy, gz, dt):
+        w, x, y, z = self.quaternion
+        ax, ay, az = accel
+        correction = (0.0, 0.0, 0.0, 0.0)
+        norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if norm > 0:
+            ax, ay, az = ax / norm, ay / norm, az / norm
+            # Gradient of the error between the measured and the predicted gravity direction
+            f1 = 2 * (x * z - w * y) - ax
+            f2 = 2 * (w * x + y * z) - ay
+            f3 = 1 - 2 * (x * x + y * y) - az
+            sw = -2 * y * f1 + 2 * x * f2
+            sx = 2 * z * f1 + 2 * w * f2 - 4 * x * f3
+            sy = -2 * w * f1 + 2 * z * f2 - 4 * y * f3
+            sz = 2 * x * f1 + 2 * y * f2
+            norm = math.sqrt(sw * sw + sx * sx + sy * sy + sz * sz)
+            if norm > 0:
+                b = self.beta / norm
+                correction = (b * sw, b * sx, b * sy, b * sz)
+        self.quaternion = self._integrate(self.quaternion, gx, gy, gz, correction, dt)
+
+
+class MahonyFilter(QuaternionFilter):
+    """
+    Mahony nonlinear complementary filter: a PI controller on the angle between the
+    measured and the predicted gravity corrects the gyro rates.
+
+    Parameters:
+    - kp: proportional gain
+    - ki: integral gain (estimates the gyro bias)
+    """
+
+    def __init__(self, kp=1.0, ki=0.01):
+        self.kp = kp
+        self.ki = ki
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.integral = [0.0, 0.0, 0.0]
+
+    def _step(self, accel, gx, gy, gz, dt):
+        w, x, y, z = self.quaternion
+        ax, ay, az = accel
+        norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if norm > 0:
+            ax, ay, az = ax / norm, ay / norm, az / norm
+            # Predicted gravity direction and its error with the measurement (cross product)
+            vx = 2 * (x * z - w * y)
+            vy = 2 * (w * x + y * z)
+            vz = w * w - x * x - y * y + z * z
+            ex = ay * vz - az * vy
+            ey = az * vx - ax * vz
+            ez = ax * vy - ay * vx
+            if self.ki > 0:
+                self.integral[0] += self.ki * ex * dt
+                self.integral[1] += self.ki * ey * dt
+                self.integral[2] += self.ki * ez * dt
+            gx += self.kp * ex + self.integral[0]
+            gy += self.kp * ey + self.integral[1]
+            gz += self.kp * ez + self.integral[2]
+        self.quaternion = self._integrate(self.quaternion, gx, gy, gz, (0.0, 0.0, 0.0, 0.0), dt)
+
+
+FILTERS = {
+    'complementary': ComplementaryFilter,
+    'kalman': KalmanFilter,
+    'madgwick': MadgwickFilter,
+    'mahony': MahonyFilter,
+}
+
+
+def make_filter(name, **params):
+    """Creates an orientation filter by name, see FILTERS."""
+    try:
+        cls = FILTERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown orientation filter '{name}', choose one of {', '.join(FILTERS)}") from None
+    return cls(**params)
@@ -0,0 +1,129 @@
+import os
+import struct
+import numpy as np
+
+# Event types and codes (same values as evdev.ecodes)
+EV_SYN = 0x00
+EV_ABS = 0x03
+SYN_REPORT = 0
+SYN_DROPPED = 3
+IMU_AXES = (0x00, 0x01, 0x02, 0x03, 0x04, 0x05)  # ABS_X, ABS_Y, ABS_Z (accel), ABS_RX, ABS_RY, ABS_RZ (gyro)
+
+# Layout of the kernel's struct input_event: the timestamp is two C longs, so the
+# record is 24 bytes on 64-bit Linux and 16 bytes on 32-bit (e.g. Raspberry Pi OS armhf)
+_LONG = f'=i{struct.calcsize("l")}'
+INPUT_EVENT_DTYPE = np.dtype([
+    ('sec', _LONG),
+    ('usec', _LONG),
+    ('type', '=u2'),
+    ('code', '=u2'),
+    ('value', '=i4'),
+])
+
+
+class RawEventReader:
+    """
+    Reads the struct input_event records of an evdev device straight from its file
+    descriptor, without creating an evdev.InputEvent per event.
+
+    Every read() fills the same buffer with as many events as the kernel has queued
+    (up to `max_events`) and returns them as a structured array that views the buffer.
+    The array is only valid until the next read().
+
+    Parameters:
+    - fd: file descriptor of the device, opened non-blocking (as evdev.InputDevice does)
+    - max_events: capacity of the buffer
+    """
+
+    def __init__(self, fd, max_events=512):
+        self.fd = fd
+        self.buffer = bytearray(max_events * INPUT_EVENT_DTYPE.itemsize)
+        self._view = memoryview(self.buffer)
+        self._events = np.frombuffer(self.buffer, dtype=INPUT_EVENT_DTYPE)
+
+    def read(self):
+        """Returns the queued events, an empty array if there are none."""
+        try:
+            n = os.readv(self.fd, [self._view])
+        except BlockingIOError:
+            n = 0
+        if n % INPUT_EVENT_DTYPE.itemsize:
+            # evdev only returns whole events: the record layout does not match the kernel's
+            raise ValueError(f"Read {n} bytes, not a whole number of {INPUT_EVENT_DTYPE.itemsize}-byte input events")
+        return self._events[:n // INPUT_EVENT_DTYPE.itemsize]
+
+
+class FrameAssembler:
+    """
+    Groups chunks of an evdev event stream into IMU frames, like myJoyCon.handle_event
+    does one event at a time: each SYN_REPORT preceded by at least one axis event closes
+    a frame holding the latest value of every axis. Axis values and a frame left open
+    at the end of a chunk carry over to the next one.
+
+    Parameters:
+    - scale: multiplier of each axis (accel xyz then gyro xyz), e.g. to convert to G and deg/s
+    """
+
+    def __init__(self, scale=(1.0,) * len(IMU_AXES)):
+        self.scale = np.asarray(scale, dtype=float)
+        self.values = np.zeros(len(IMU_AXES))  # latest scaled value of every axis
+        self._columns = np.arange(len(IMU_AXES))
+        self.frame_pending = False
+
+    def assemble(self, events):
+        """
+        Parameters:
+        - events: structured array with INPUT_EVENT_DTYPE, without SYN_DROPPED
+
+        Returns:
+        - t: (N,) kernel timestamp of each frame in seconds
+        - imu: (N, 6) scaled axis values, accel xyz then gyro xyz
+        """
+        types = events['type']
+        codes = events['code']
+        is_abs = types == EV_ABS
+        is_syn = (types == EV_SYN) & (codes == SYN_REPORT)
+
+        # Table of the axis values: row 0 holds the values carried over, row k + 1 the axis
+        # events between SYN_REPORT k - 1 and k, the last row those after the last SYN_REPORT
+        all_syn = is_syn.nonzero()[0]
+        row = is_syn.cumsum()
+        row += 1
+        rows = len(all_syn) + 2
+        is_imu = (is_abs & (codes < len(IMU_AXES))).nonzero()[0]
+        imu_row = row[is_imu]
+        imu_col = codes[is_imu]
+        # When an axis changes more than once in a row, the last event wins: keep only that one,
+        # as the order in which a fancy-indexed assignment writes duplicates is not defined
+        keys = imu_row * len(IMU_AXES) + imu_col
+        _, first_from_end = np.unique(keys[::-1], return_index=True)
+        if len(first_from_end) < len(keys):
+            keep = len(keys) - 1 - first_from_end
+            is_imu, imu_row, imu_col = is_imu[keep], imu_row[keep], imu_col[keep]
+        values = np.empty((rows, len(IMU_AXES)))
+        values[0] = self.values
+        values[imu_row, imu_col] = events['value'][is_imu] * self.scale[imu_col]
+        last = np.zeros((rows, len(IMU_AXES)), dtype=np.intp)
+        last[imu_row, imu_col] = imu_row
+
+        # Forward-fill the last value of each axis
+        np.maximum.accumulate(last, axis=0, out=last)
+        filled = values[last, self._columns]
+        self.values = filled[-1]
+
+        # Only SYN_REPORTs preceded by at least one axis event close a frame
+        abs_rows = np.bincount(row[is_abs], minlength=rows)
+        closed = abs_rows[1:-1] > 0
+        if len(all_syn) and self.frame_pending:
+            closed[0] = True
+        syn = all_syn[closed]
+        imu = filled[1:-1][closed]
+
+        # An axis event after the last SYN_REPORT leaves a frame open
+        if len(all_syn):
+            self.frame_pending = bool(abs_rows[-1])
+        else:
+            self.frame_pending = self.frame_pending or bool(abs_rows[-1])
+
+        t = events['sec'][syn] + events['usec'][syn] * 1e-6
+        return t, imu
@@ -0,0 +1,157 @@
+import fcntl
+import math
+import struct
+import time
+import numpy as np
+
+# ioctl to select the clock used for evdev event timestamps: _IOW('E', 0xa0, int)
+EVIOCSCLOCKID = 0x400445A0
+
+JOYCON_IMU_PERIOD = 0.005  # hid-nintendo reports IMU samples every 5 ms (~200 Hz)
+
+
+def use_monotonic_clock(device):
+    """
+    Asks the kernel to stamp the events of an evdev device with CLOCK_MONOTONIC,
+    so timestamps do not jump when the wall clock is adjusted (NTP, manual changes).
+
+    Parameters:
+    - device: evdev.InputDevice
+
+    Returns:
+    - True if the clock was switched, False if the kernel refused (timestamps stay
+      on CLOCK_REALTIME, which is still fine for computing time differences) or the
+      device is not backed by a file descriptor (e.g. imu_recorder.PlaybackDevice).
+    """
+    try:
+        fcntl.ioctl(device.fd, EVIOCSCLOCKID, struct.pack("i", time.CLOCK_MONOTONIC))
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def monotonic_offset():
+    """
+    Seconds to add to a CLOCK_REALTIME timestamp to get the CLOCK_MONOTONIC time of
+    the same instant, for devices whose clock could not be switched.
+    """
+    return time.monotonic() - time.time()
+
+
+class SampleClock:
+    """
+    Turns the kernel timestamps of consecutive IMU samples into integration steps
+    and keeps track of how regular the sample stream is.
+
+    A gap longer than `late_factor` nominal periods counts as a late sample, and
+    the number of whole periods missing in it is added to the dropped count.
+    Jitter is the running standard deviation of dt around the nominal period.
+    """
+
+    def __init__(self, nominal_period=JOYCON_IMU_PERIOD, late_factor=1.5):
+        self.nominal_period = nominal_period
+        self.late_factor = late_factor
+        self.reset()
+
+    def restart(self):
+        """Forgets the previous sample (e.g. after a reconnection) but keeps the statistics."""
+        self.prev_timestamp = None
+
+    def reset(self):
+        self.prev_timestamp = None
+        self.samples = 0
+        self.late = 0
+        self.dropped = 0
+        self.max_dt = 0.0
+        self._dt_mean = 0.0
+        self._dt_m2 = 0.0  # sum of squared deviations (Welford)
+        self._jitter_m2 = 0.0  # sum of squared deviations from the nominal period
+
+    def tick(self, timestamp):
+        """
+        Registers a new sample and returns the time step in seconds since the previous one.
+        Returns 0.0 for the first sample and if the clock went backwards.
+        """
+        prev_timestamp = self.prev_timestamp
+        self.prev_timestamp = timestamp
+        if prev_timestamp is None:
+            return 0.0
+
+        dt = timestamp - prev_timestamp
+        if dt < 0:
+            return 0.0
+
+        # Running statistics of dt
+        self.samples += 1
+        delta = dt - self._dt_mean
+        self._dt_mean += delta / self.samples
+        self._dt_m2 += delta * (dt - self._dt_mean)
+        self._jitter_m2 += (dt - self.nominal_period) ** 2
+        self.max_dt = max(self.max_dt, dt)
+
+        # Late or dropped samples
+        if dt > self.late_factor * self.nominal_period:
+            self.late += 1
+            self.dropped += round(dt / self.nominal_period) - 1
+
+        return dt
+
+    def tick_many(self, timestamps):
+        """
+        Registers a batch of samples at once, with the same statistics as calling tick()
+        on each of them, and returns the (N,) array of their time steps.
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        n = len(timestamps)
+        if n == 0:
+            return np.zeros(0)
+        prev_timestamp = self.prev_timestamp
+        self.prev_timestamp = float(timestamps[-1])
+
+        dt = np.empty(n)
+        np.subtract(timestamps[1:], timestamps[:-1], out=dt[1:])
+        dt[0] = 0.0 if prev_timestamp is None else timestamps[0] - prev_timestamp
+        steps = dt if prev_timestamp is not None else dt[1:]
+        if len(steps) and steps.min() < 0:
+            # The clock went backwards: such steps are 0 and are not counted (steps of 0 are)
+            backwards = steps < 0
+            steps[backwards] = 0.0
+            steps = steps[~backwards]
+        n = len(steps)
+        if n == 0:
+            return dt
+
+        # Merge the running statistics of dt with those of the batch (Chan et al.)
+        total = float(steps.sum())
+        mean = total / n
+        m2 = max(float(steps @ steps) - total * mean, 0.0)
+        merged = self.samples + n
+        delta = mean - self._dt_mean
+        self._dt_m2 += m2 + delta * delta * self.samples * n / merged
+        self._dt_mean += delta * n / merged
+        self.samples = merged
+        self._jitter_m2 += m2 + n * (mean - self.nominal_period) ** 2
+        self.max_dt = max(self.max_dt, float(steps.max()))
+
+        # Late or dropped samples
+        late = steps > self.late_factor * self.nominal_period
+        if late.any():
+            late = steps[late]
+            self.late += len(late)
+            self.dropped += int((np.round(late / self.nominal_period) - 1).sum())
+
+        return dt
+
+    def stats(self):
+        """Returns a dictionary with the timing statistics of the stream (times in ms)."""
+        n = self.samples
+        return {
+            'samples': n,
+            'late': self.late,
+            'dropped': self.dropped,
+            'mean_dt': self._dt_mean * 1000,
+            'std_dt': math.sqrt(self._dt_m2 / n) * 1000 if n else 0.0,
+            'jitter': math.sqrt(self._jitter_m2 / n) * 1000 if n else 0.0,
+            'max_dt': self.max_dt * 1000,
+            'rate': 1 / self._dt_mean if self._dt_mean > 0 else 0.0,
+        }
@@ -0,0 +1,211 @@
+import secrets
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# Header, as int64: number of records ever written, capacity, generation (increased when
+# the ring is reset in place by a new writer) and whether the writer freed the block.
+# It is followed by the sequence number of the record in every slot (-1 while it is
+# being written), then the records.
+_HEADER = np.dtype([('written', '<i8'), ('capacity', '<i8'), ('generation', '<i8'), ('closed', '<i8')])
+_HEADER_SIZE = 64  # keeps the records on their own cache lines
+_SEQ = np.dtype('<i8')
+
+
+class ShmRing:
+    """
+    Ring buffer of fixed-size records in shared memory, written by one process and
+    read by any number of others, without locks, pickling or copies on the writer side.
+
+    The writer stores record i in slot i % capacity, stamps the slot with its sequence
+    number i, and then publishes i + 1 as the `written` count. Every reader keeps its
+    own position, so readers never slow the writer down: a reader that falls more than
+    `capacity` records behind loses the oldest ones (counted in `lost`), it never blocks
+    the writer. A record is only returned if its slot showed sequence number i both
+    before and after it was copied. A slot overwritten while it was being read is
+    dropped instead of returned torn. On a CPU that may make `written` visible before
+    the record (ARM), a slot that does not show i yet is read again on the next call.
+
+    Create the ring in the writer with ShmRing(dtype, capacity) and attach readers,
+    in this or other processes, with ShmRing(dtype, name=ring.name).
+
+    A writer restarted under the same name can `reuse` the block its predecessor left
+    behind: the ring is reset in place and its generation increased, so the readers
+    still attached start over with the new records. If the block is too small it is
+    replaced instead, and marked `closed` like a block freed by its writer, so readers
+    know to attach again by name.
+
+    Parameters:
+    - dtype: numpy dtype of the records
+    - capacity: number of records kept; given when creating the ring, None to attach
+    - name: shared memory block to attach to, or to create under that name
+            (a random one if None)
+    - oldest: start reading at the oldest record still in the ring instead of at the
+              records written from now on
+    - reuse: when creating a ring, take over an existing block of the same name
+    """
+
+    def __init__(self, dtype, capacity=None, name=None, oldest=False, reuse=False):
+        self.dtype = np.dtype(dtype)
+        self.owner = capacity is not None
+        reset = False
+        if self.owner:
+            size = _HEADER_SIZE + capacity * (_SEQ.itemsize + self.dtype.itemsize)
+            name = name or f"joycon_{secrets.token_hex(6)}"
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                if not reuse:
+                    raise
+                self.shm = shared_memory.SharedMemory(name=name)
+                if self.shm.size < size:
+                    header = np.ndarray((), dtype=_HEADER, buffer=self.shm.buf)
+                    header['closed'] = 1
+                    del header
+                    self.shm.close()
+                    self.shm.unlink()
+                    self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                else:
+                    reset = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        # The resource tracker of Python < 3.13 also tracks attached blocks and unlinks them
+        # when a reader exits; the ring is freed by its creator in close() instead
+        resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self._header = np.ndarray((), dtype=_HEADER, buffer=self.shm.buf)
+        if self.owner:
+            # Readers of a reset ring see `written` go back first, and wait for the new generation
+            self._header['written'] = 0
+            self._header['capacity'] = capacity
+            self._header['closed'] = 0
+            self._map(name)
+            self.seqs.fill(-1)
+            if reset:
+                self._header['generation'] += 1
+            else:
+                self._header['generation'] = 0
+        else:
+            self._map(name)
+        # Reader state, per attached ring
+        self.position = max(0, self.written - self.capacity) if oldest else self.written  # next record to read
+        self.generation = int(self._header['generation'])
+        self.lost = 0
+        self.restarts = 0  # resets of the ring by a new writer
+
+    def _map(self, name):
+        """Views the slots of the ring, as many as the header says."""
+        self.capacity = int(self._header['capacity'])
+        if self.shm.size < _HEADER_SIZE + self.capacity * (_SEQ.itemsize + self.dtype.itemsize):
+            self.close()
+            raise ValueError(f"{name} does not hold records of {self.dtype}")
+        self.seqs = np.ndarray((self.capacity,), dtype=_SEQ, buffer=self.shm.buf, offset=_HEADER_SIZE)
+        self.records = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self.shm.buf,
+                                  offset=_HEADER_SIZE + self.capacity * _SEQ.itemsize)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def written(self):
+        return int(self._header['written'])
+
+    @property
+    def closed(self):
+        """True once the writer has freed the block: a new writer's ring must be attached again by name."""
+        return bool(self._header['closed'])
+
+    def write(self, record):
+        """Appends one record (a tuple or a numpy record of the ring's dtype)."""
+        written = int(self._header['written'])
+        slot = written % self.capacity
+        self.seqs[slot] = -1
+        self.records[slot] = record
+        self.seqs[slot] = written
+        self._header['written'] = written + 1
+
+    def write_many(self, records):
+        """Appends an array of records."""
+        written = int(self._header['written'])
+        n = len(records)
+        if n > self.capacity:
+            records = records[-self.capacity:]
+            written += n - self.capacity
+            n = self.capacity
+        start = written % self.capacity
+        first = min(n, self.capacity - start)
+        self.seqs[start:start + first] = -1
+        self.seqs[:n - first] = -1
+        self.records[start:start + first] = records[:first]
+        self.records[:n - first] = records[first:]
+        self.seqs[start:start + first] = np.arange(written, written + first)
+        self.seqs[:n - first] = np.arange(written + first, written + n)
+        self._header['written'] = written + n
+
+    def read(self, max_records=None):
+        """
+        Returns a copy of the records written since the previous read, oldest first,
+        as an array (empty if there are none).
+        """
+        generation = int(self._header['generation'])
+        if generation != self.generation:
+            # Reset in place by a new writer: its records start at 0
+            self.generation = generation
+            self.position = 0
+            self.restarts += 1
+            if int(self._header['capacity']) != self.capacity:
+                self._map(self.name)
+        written = self.written
+        position = self.position
+        if written < position:
+            return self.records[:0].copy()  # being reset, the new generation is not published yet
+        if written - position > self.capacity:
+            self.lost += written - self.capacity - position
+            position = written - self.capacity
+        stop = written if max_records is None else min(written, position + max_records)
+        n = stop - position
+        if n == 0:
+            return self.records[:0].copy()
+        start = position % self.capacity
+        indices = np.arange(start, start + n) % self.capacity if start + n > self.capacity else slice(start, start + n)
+        seqs = self.seqs[indices].copy()
+        out = self.records[indices].copy()
+        expected = np.arange(position, stop)
+        valid = (seqs == expected) & (self.seqs[indices] == expected)
+
+        if not valid.all():
+            # Slots the writer has reused since (those of the records up to `written` + 1 -
+            # capacity, the next one may be half written) lost their record; any other slot
+            # does not show its record yet, which is read from there next time
+            pending = np.flatnonzero(~valid & (expected >= self.written + 1 - self.capacity))
+            n = pending[0] if len(pending) else n
+            self.lost += int(n - np.count_nonzero(valid[:n]))
+            out = out[:n][valid[:n]]
+            stop = position + n
+        self.position = stop
+        return out
+
+    def latest(self):
+        """Returns a copy of the last record written, None if there is none. Does not move the position."""
+        written = self.written
+        # The last record may not show in its slot yet: then the one before it is the latest
+        for seq in range(written - 1, max(written - self.capacity, 0) - 1, -1):
+            slot = seq % self.capacity
+            if self.seqs[slot] == seq:
+                record = self.records[slot].copy()
+                if self.seqs[slot] == seq:
+                    return record
+        if self.written != written:
+            return self.latest()  # overwritten during the copy, very unlikely
+        return None
+
+    def close(self, unlink=None):
+        """Detaches from the ring; the writer that created it also frees it, unless `unlink` is False."""
+        unlink = self.owner if unlink is None else unlink
+        if unlink:
+            self._header['closed'] = 1
+        self._header = None
+        self.records = None
+        self.shm.close()
+        if unlink:
+            resource_tracker.register(self.shm._name, 'shared_memory')  # unlink() unregisters it
+            self.shm.unlink()
@@ -0,0 +1,416 @@
+import multiprocessing
+import selectors
+import socket
+import struct
+import sys
+import time
+from collections import deque
+import evdev
+import numpy as np
+from device_registry import get_registry
+from imu_recorder import BUTTON_CODES, STICK_CODES
+from joycon_state import JoyConState
+from sample_clock import monotonic_offset, use_monotonic_clock
+
+# Packet: header followed by `count` records, all little endian
+MAGIC = b"JT"
+VERSION = 1
+PACKET_HEADER = struct.Struct('<2sBBId')  # magic, version, record count, packet seq, send time (monotonic s)
+MAX_PACKET_SIZE = 1400  # stays in one Ethernet frame
+
+TELEOP_RECORD_DTYPE = np.dtype([
+    ('device', 'u1'),                 # index of the Joy-Con on the sender
+    ('flags', 'u1'),                  # RECORD_* bits
+    ('stick', '<i2', (4,)),           # raw ABS_X, ABS_Y, ABS_RX, ABS_RY of the buttons node
+    ('buttons', '<u4'),               # bitmask of pressed buttons, bit i is imu_recorder.BUTTON_CODES[i]
+    ('sample', '<u4'),                # IMU sample number of the Joy-Con
+    ('t', '<f8'),                     # timestamp of the IMU sample or input event (monotonic s)
+    ('orientation', '<f4', (3,)),     # roll, pitch, yaw in degrees
+    ('accel', '<f4', (3,)),           # G
+])
+RECORD_IMU = 0x01  # a new IMU sample
+RECORD_INPUT = 0x02  # buttons or sticks changed
+MAX_RECORDS = (MAX_PACKET_SIZE - PACKET_HEADER.size) // TELEOP_RECORD_DTYPE.itemsize
+
+DEFAULT_PORT = 9870
+
+_BUTTON_BITS = {code: 1 << i for i, code in enumerate(BUTTON_CODES)}
+
+
+class LatencyStats:
+    """Mean, percentiles and maximum of the last `window` latencies, in ms."""
+
+    def __init__(self, window=10000):
+        self.values = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, latency):
+        self.values.append(latency)
+        self.count += 1
+
+    def stats(self):
+        if not self.values:
+            return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+        values = np.fromiter(self.values, float) * 1000
+        p50, p99 = np.percentile(values, (50, 99))
+        return {'count': self.count, 'mean': float(values.mean()), 'p50': float(p50), 'p99': float(p99),
+                'max': float(values.max())}
+
+
+class ControllerInputs:
+    """
+    Buttons and sticks of one Joy-Con, tracked from the events of its buttons node.
+
+    Parameters:
+    - realtime: the events are stamped with CLOCK_REALTIME (see sample_clock.use_monotonic_clock);
+                their timestamps are then converted, so `t` is always monotonic
+    """
+
+    def __init__(self, realtime=False):
+        self.buttons = 0
+        self.stick = [0, 0, 0, 0]
+        self.t = 0.0
+        self.realtime = realtime
+
+    def handle_event(self, event):
+        """Applies an event; returns True if a button or stick changed."""
+        if event.type == evdev.ecodes.EV_KEY and event.code in _BUTTON_BITS:
+            if event.value:
+                self.buttons |= _BUTTON_BITS[event.code]
+            else:
+                self.buttons &= ~_BUTTON_BITS[event.code]
+        elif event.type == evdev.ecodes.EV_ABS and event.code in STICK_CODES:
+            self.stick[STICK_CODES.index(event.code)] = event.value
+        else:
+            return False
+        self.t = event.timestamp() + monotonic_offset() if self.realtime else event.timestamp()
+        return True
+
+
+class TeleopPublisher:
+    """
+    Streams Joy-Con states to a UDP address as compact binary packets.
+
+    Every packet has a sequence number and its send time, and carries one or more
+    TELEOP_RECORD_DTYPE records (50 bytes each), so a receiver can tell lost,
+    duplicated and reordered packets apart and measure their latency.
+
+    Records are sent as soon as they are added when `batch` is 1. With a larger
+    `batch`, up to that many records go in one packet, and a packet is sent at the
+    latest `max_delay` seconds after its first record was added (see flush_due);
+    input changes (buttons, sticks) are always sent at once.
+
+    The latency from the sample timestamp to the packet being handed to the kernel
+    is kept in `latency` (see LatencyStats).
+
+    Parameters:
+    - address: (host, port) of the receiver
+    - batch: records per packet
+    - max_delay: s a record may wait for a batch to fill
+    """
+
+    def __init__(self, address=('127.0.0.1', DEFAULT_PORT), batch=1, max_delay=0.002):
+        self.address = address
+        self.batch = max(1, min(batch, MAX_RECORDS))
+        self.max_delay = max_delay
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(address)
+        self.seq = 0
+        self.packets = 0
+        self.bytes = 0
+        self.send_errors = 0
+        self.latency = LatencyStats()
+        self._records = np.zeros(MAX_RECORDS, dtype=TELEOP_RECORD_DTYPE)
+        self._pending = 0
+        self._first_added = 0.0
+
+    def add(self, device, state, inputs=None, flags=RECORD_IMU, realtime=False):
+        """
+        Queues the current state of a Joy-Con and sends the packet if it is full.
+
+        Parameters:
+        - device: index of the Joy-Con
+        - state: its JoyConState
+        - inputs: its ControllerInputs, or None if the buttons are not read
+        - flags: RECORD_IMU and/or RECORD_INPUT
+        - realtime: the state's timestamp is CLOCK_REALTIME (myJoyCon.monotonic_clock is False),
+                    it is converted to monotonic time like every timestamp sent
+        """
+        record = self._records[self._pending]
+        record['device'] = device
+        record['flags'] = flags
+        record['sample'] = (state.seq // 2) & 0xFFFFFFFF
+        record['orientation'] = (state.roll, state.pitch, state.yaw)
+        record['accel'] = (state.ax, state.ay, state.az)
+        record['buttons'] = inputs.buttons if inputs is not None else 0
+        record['stick'] = inputs.stick if inputs is not None else 0
+        if flags == RECORD_INPUT:
+            record['t'] = inputs.t
+        else:
+            record['t'] = state.t + monotonic_offset() if realtime else state.t
+        if self._pending == 0:
+            self._first_added = time.monotonic()
+        self._pending += 1
+        if self._pending >= self.batch or flags & RECORD_INPUT:
+            self.flush()
+
+    def flush_due(self):
+        """Seconds until the pending batch must be sent, None if nothing is pending."""
+        if self._pending == 0:
+            return None
+        return max(0.0, self._first_added + self.max_delay - time.monotonic())
+
+    def flush(self):
+        """Sends the pending records, if any."""
+        n = self._pending
+        if n == 0:
+            return
+        records = self._records[:n]
+        sent = time.monotonic()
+        packet = PACKET_HEADER.pack(MAGIC, VERSION, n, self.seq & 0xFFFFFFFF, sent) + records.tobytes()
+        try:
+            self.sock.send(packet)
+        except OSError:
+            # e.g. ECONNREFUSED from a previous packet when nothing listens yet
+            self.send_errors += 1
+        else:
+            self.packets += 1
+            self.bytes += len(packet)
+        self.seq += 1
+        for t in records['t'].tolist():
+            self.latency.add(sent - t)
+        self._pending = 0
+
+    def stats(self):
+        return {'packets': self.packets, 'bytes': self.bytes, 'send_errors': self.send_errors,
+                'latency': self.latency.stats()}
+
+    def close(self):
+        self.flush()
+        self.sock.close()
+
+
+class TeleopReceiver:
+    """
+    Receives the packets of a TeleopPublisher (a stand-in for the robot side) and keeps
+    loss and latency statistics. The latencies use the sender's monotonic clock, so
+    they are only meaningful on the same host.
+
+    Parameters:
+    - port: UDP port to listen on
+    - host: address to bind
+    """
+
+    def __init__(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.packets = 0
+        self.records = 0
+        self.lost = 0  # packets missing from the sequence
+        self.reordered = 0  # packets older than one already received
+        self.wire_latency = LatencyStats()  # send to receive
+        self.latency = LatencyStats()  # sample or input event to receive
+        self._next_seq = None
+
+    def receive(self, timeout=None):
+        """Waits for a packet and returns its records, None on timeout or if it is not a teleop packet."""
+        self.sock.settimeout(timeout)
+        try:
+            packet = self.sock.recv(MAX_PACKET_SIZE)
+        except socket.timeout:
+            return None
+        return self.decode(packet, time.monotonic())
+
+    def decode(self, packet, received):
+        if len(packet) < PACKET_HEADER.size:
+            return None
+        magic, version, count, seq, sent = PACKET_HEADER.unpack_from(packet)
+        if magic != MAGIC or version != VERSION:
+            return None
+        records = np.frombuffer(packet, dtype=TELEOP_RECORD_DTYPE, count=count, offset=PACKET_HEADER.size)
+
+        self.packets += 1
+        self.records += count
+        if self._next_seq is not None:
+            gap = (seq - self._next_seq) & 0xFFFFFFFF
+            if gap >= 0x80000000:
+                self.reordered += 1
+                self.lost = max(0, self.lost - 1)  # counted as lost when it was skipped
+            else:
+                self.lost += gap
+        if self._next_seq is None or (seq - self._next_seq) & 0xFFFFFFFF < 0x80000000:
+            self._next_seq = (seq + 1) & 0xFFFFFFFF
+        self.wire_latency.add(received - sent)
+        for t in records['t'].tolist():
+            self.latency.add(received - t)
+        return records
+
+    def stats(self):
+        return {'packets': self.packets, 'records': self.records, 'lost': self.lost,
+                'reordered': self.reordered, 'wire_latency': self.wire_latency.stats(),
+                'latency': self.latency.stats()}
+
+    def close(self):
+        self.sock.close()
+
+
+class TeleopBridge:
+    """
+    Reads the Joy-Cons of a JoyConHub and their buttons nodes in one loop and
+    publishes every new orientation and every button or stick change through a
+    TeleopPublisher, as soon as they are read.
+
+    The hub's epoll selector and the buttons nodes are waited on together, so an
+    event is handled and sent in the same wake-up it arrives in. Without pyudev the
+    wait is cut at the hub's next rescan (JoyConHub.rescan_due), so Joy-Cons that
+    dropped out are still found again when nothing else wakes the loop.
+
+    Parameters:
+    - hub: JoyConHub of the Joy-Cons to publish
+    - publisher: TeleopPublisher to send through
+    - buttons: also read the buttons nodes (found by serial in the device registry)
+    """
+
+    def __init__(self, hub, publisher, buttons=True):
+        self.hub = hub
+        self.publisher = publisher
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(hub.selector.fileno(), selectors.EVENT_READ, None)
+        self.inputs = [ControllerInputs() for _ in hub.joycons]
+        self._seqs = [0] * len(hub.joycons)
+        self._button_devices = []
+        if buttons:
+            registry = get_registry()
+            for i, joycon in enumerate(hub.joycons):
+                nodes = registry.lookup(joycon.serial) if joycon.serial else None
+                if nodes is None or nodes.buttons_node is None:
+                    continue
+                try:
+                    device = evdev.InputDevice(nodes.buttons_node)
+                except OSError:
+                    continue
+                self.inputs[i].realtime = not use_monotonic_clock(device)
+                self._button_devices.append(device)
+                self.selector.register(device.fd, selectors.EVENT_READ, i)
+
+    def _read_buttons(self, device, i):
+        inputs = self.inputs[i]
+        try:
+            for event in device.read():
+                if inputs.handle_event(event):
+                    self.publisher.add(i, self.hub.states[i], inputs, RECORD_INPUT)
+        except BlockingIOError:
+            pass
+        except OSError:
+            # Joy-Con gone, the hub waits for it to come back
+            self.selector.unregister(device.fd)
+            self._button_devices.remove(device)
+
+    def step(self, timeout=None):
+        """Waits for events, publishes what changed and sends the batches that are due."""
+        for due in (self.publisher.flush_due(), self.hub.rescan_due()):
+            if due is not None:
+                timeout = due if timeout is None else min(timeout, due)
+        polled = False
+        for key, _ in self.selector.select(timeout):
+            if key.data is None:
+                self.hub.poll(0)
+                polled = True
+            else:
+                device = next(d for d in self._button_devices if d.fd == key.fd)
+                self._read_buttons(device, key.data)
+        if not polled and self.hub.rescan_due() == 0.0:
+            self.hub.poll(0)  # rescans for the Joy-Cons that dropped out
+        # Joy-Cons added by the hub since the last step
+        while len(self.inputs) < len(self.hub.joycons):
+            self.inputs.append(ControllerInputs())
+            self._seqs.append(0)
+        for i, (joycon, state) in enumerate(zip(self.hub.joycons, self.hub.states)):
+            if state.seq != self._seqs[i] and not state.seq & 1:
+                self._seqs[i] = state.seq
+                self.publisher.add(i, state, self.inputs[i], realtime=not joycon.monotonic_clock)
+        if self.publisher.flush_due() == 0.0:
+            self.publisher.flush()
+
+    def run(self):
+        while True:
+            self.step()
+
+    def close(self):
+        for device in self._button_devices:
+            device.close()
+        self.selector.close()
+        self.publisher.close()
+
+
+def _receive_until_idle(port, results, idle=1.0):
+    receiver = TeleopReceiver(port)
+    results.put('ready')
+    while receiver.receive(idle) is not None or receiver.packets == 0:
+        pass
+    results.put(receiver.stats())
+    receiver.close()
+
+
+def loopback_test(devices=2, duration=5.0, batch=1, max_delay=0.002, port=DEFAULT_PORT + 1):
+    """
+    Streams synthetic 200 Hz samples of `devices` Joy-Cons to a receiver in another
+    process on this host, and returns the sender and receiver statistics.
+    """
+    results = multiprocessing.Queue()
+    receiver = multiprocessing.Process(target=_receive_until_idle, args=(port, results), daemon=True)
+    receiver.start()
+    results.get()
+
+    publisher = TeleopPublisher(('127.0.0.1', port), batch, max_delay)
+    states = [JoyConState() for _ in range(devices)]
+    start = time.monotonic()
+    n = 0
+    while n * 0.005 < duration:
+        t = start + n * 0.005
+        while time.monotonic() < t:
+            due = publisher.flush_due()
+            if due is not None and due == 0.0:
+                publisher.flush()
+            time.sleep(min(0.0005, max(0.0, t - time.monotonic())))
+        for i, state in enumerate(states):
+            state.publish(t, (0.0, 0.0, 1.0), (0.0, 0.0, 0.0), (float(n % 360), 0.0, 0.0))
+            publisher.add(i, state)
+        n += 1
+    publisher.close()
+    received = results.get()
+    receiver.join()
+    return publisher.stats(), received
+
+
+def _format_latency(stats):
+    return (f"mean {stats['mean']:.3f} p50 {stats['p50']:.3f} p99 {stats['p99']:.3f} "
+            f"max {stats['max']:.3f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--loopback":
+        for batch in (1, 4):
+            sent, received = loopback_test(batch=batch)
+            print(f"batch {batch}: {sent['packets']} packets sent, {received['packets']} received, "
+                  f"{received['lost']} lost, {received['reordered']} reordered")
+            print(f"  sample to wire:    {_format_latency(sent['latency'])}")
+            print(f"  sample to receive: {_format_latency(received['latency'])}")
+    else:
+        from imu_calibration import DEFAULT_CACHE_PATH
+        from joycon_hub import JoyConHub
+        # Receiver as HOST[:PORT], this host by default
+        host, _, port = (sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1').partition(':')
+        port = int(port or DEFAULT_PORT)
+        hub = JoyConHub(calibration_path=DEFAULT_CACHE_PATH)
+        bridge = TeleopBridge(hub, TeleopPublisher((host, port)))
+        print(f"Publishing {len(hub.joycons)} Joy-Cons to {host}:{port}")
+        try:
+            bridge.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stats = bridge.publisher.stats()
+            print(f"\n{stats['packets']} packets sent, sample to wire: {_format_latency(stats['latency'])}")
+            bridge.close()
+            hub.close()
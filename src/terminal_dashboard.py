@@ -0,0 +1,212 @@
+import asyncio
+import contextlib
+import io
+import sys
+import time
+from collections import namedtuple
+from joycon_state import JoyConState
+
+# One column of the dashboard: title, JoyConState attribute and format of its value
+Field = namedtuple('Field', 'title attribute format')
+
+ORIENTATION_FIELDS = (Field("Roll", 'roll', "{: >+7.1f}"),
+                      Field("Pitch", 'pitch', "{: >+7.1f}"),
+                      Field("Yaw", 'yaw', "{: >+7.1f}"))
+ACCELERATION_FIELDS = (Field("accelX", 'ax', "{: >+7.2f}"),
+                       Field("accelY", 'ay', "{: >+7.2f}"),
+                       Field("accelZ", 'az', "{: >+7.2f}"))
+
+LABEL_WIDTH = 24
+FIELD_WIDTH = 8
+
+# ANSI escape sequences
+SAVE_CURSOR = "\x1b7"
+RESTORE_CURSOR = "\x1b8"
+ERASE_LINE = "\x1b[K"  # from the cursor to the end of the line
+ERASE_DOWN = "\x1b[J"  # from the cursor to the end of the screen
+
+
+def _move(up, column):
+    """From the saved cursor position (below the table), to a row above it and a column (0-based)."""
+    return f"{RESTORE_CURSOR}\x1b[{up}A\x1b[{column + 1}G"
+
+
+def default_label(i, joycon):
+    return f"{i}: {joycon.device.name}"
+
+
+class ForeignOutput(io.TextIOBase):
+    """
+    Stand-in for sys.stdout while a TerminalDashboard owns the terminal: every complete
+    line printed by other code (e.g. "Lost JoyCon ..." from JoyConHub) goes through
+    TerminalDashboard.message, so it appears above the table instead of over it.
+    """
+
+    def __init__(self, dashboard):
+        self.dashboard = dashboard
+        self._pending = ""
+
+    def isatty(self):
+        return self.dashboard.out.isatty()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._pending += text
+        end = self._pending.rfind("\n") + 1
+        if end:
+            self.dashboard.message(self._pending[:end])
+            self._pending = self._pending[end:]
+        return len(text)
+
+    def close_line(self):
+        """Shows what was printed without a final newline."""
+        if self._pending:
+            self.write("\n")
+
+
+class TerminalDashboard:
+    """
+    Live table of any number of Joy-Cons in the terminal, one row per controller.
+
+    The dashboard waits for new samples instead of polling: every Joy-Con sets the
+    dashboard's `updated` event when it publishes one (myJoyCon.updated). Whatever
+    arrived since the last refresh is then shown at once, at most `refresh_rate`
+    times per second, so fast motion is not missed between wake-ups and idle
+    controllers cost nothing. Only the cells whose text changed are rewritten, with
+    cursor-addressed writes, all in one write to the terminal per refresh.
+
+    Joy-Cons appended to the `joycons` list later get a new row at the next refresh;
+    given a JoyConHub, the Joy-Cons it adds on hotplug wake the dashboard at once.
+    Must run in the event loop the Joy-Cons are read from (JoyConHub.attach or
+    myJoyCon.monitor).
+
+    The cells are addressed from the cursor position saved below the table, which
+    goes stale as soon as other output scrolls the screen. So while run() owns a
+    terminal, sys.stdout goes to message() instead: lines printed meanwhile are
+    written where the table was, and the whole table is drawn again below them.
+
+    Parameters:
+    - joycons: list of myJoyCon, may grow, or a JoyConHub
+    - fields: columns, e.g. ORIENTATION_FIELDS or ACCELERATION_FIELDS
+    - label: function (index, joycon) returning the title of a row
+    - units: shown after the column titles
+    - refresh_rate: maximum refreshes per second, about the terminal's frame rate
+    - out: text stream to write to; without a terminal, changed rows are printed as lines
+    """
+
+    def __init__(self, joycons, fields=ORIENTATION_FIELDS, label=default_label, units="", refresh_rate=60.0,
+                 out=sys.stdout):
+        self.updated = asyncio.Event()
+        if hasattr(joycons, 'joycons'):
+            joycons.updated = self.updated  # JoyConHub: sets it when it adds a Joy-Con
+            joycons = joycons.joycons
+        self.joycons = joycons
+        self.fields = fields
+        self.label = label
+        self.units = units
+        self.period = 1.0 / refresh_rate
+        self.out = out
+        self.ansi = out.isatty()
+        # First character of every cell, so the values line up with the right-aligned titles
+        self.columns = [LABEL_WIDTH + 3 + k * FIELD_WIDTH for k in range(len(fields))]
+        self._header = None  # set by start()
+        self._snapshots = []  # JoyConState copy of every row
+        self._cells = []  # text currently shown in every cell, per row
+        # Statistics
+        self.refreshes = 0
+        self.cells_written = 0
+
+    def start(self):
+        """Prints the header and the rows of the current Joy-Cons."""
+        header = f"{'': <{LABEL_WIDTH}} |" + "".join(f"{field.title: >{FIELD_WIDTH}}" for field in self.fields)
+        self._header = f"{header}  {self.units}"
+        self.out.write(self._header + "\n")
+        if self.ansi:
+            self.out.write(SAVE_CURSOR)
+        self._add_rows()
+        self.out.flush()
+
+    def _row(self, row):
+        label = self.label(row, self.joycons[row])[:LABEL_WIDTH]
+        return f"{label: <{LABEL_WIDTH}} |" + "".join(f" {cell: >{FIELD_WIDTH - 1}}" for cell in self._cells[row])
+
+    def _add_rows(self):
+        parts = []
+        for i in range(len(self._snapshots), len(self.joycons)):
+            self.joycons[i].updated = self.updated
+            self._snapshots.append(JoyConState())
+            self._cells.append([""] * len(self.fields))
+            parts.append(self._row(i) + ERASE_LINE + "\n")
+        if parts and self.ansi:
+            # Below the table, which may scroll the screen: save the new position
+            self.out.write(RESTORE_CURSOR + "".join(parts) + SAVE_CURSOR)
+
+    def message(self, text):
+        """
+        Prints lines of text (ending with a newline) above the table, then the whole
+        table again below them, wherever the screen has scrolled to.
+        """
+        if not self.ansi or self._header is None:
+            self.out.write(text)
+            self.out.flush()
+            return
+        # Up to the header line, then everything from there down is written again
+        parts = [RESTORE_CURSOR, f"\x1b[{len(self._snapshots) + 1}A\r", ERASE_DOWN, text,
+                 self._header, ERASE_LINE, "\n"]
+        parts.extend(self._row(row) + ERASE_LINE + "\n" for row in range(len(self._snapshots)))
+        parts.append(SAVE_CURSOR)
+        self.out.write("".join(parts))
+        self.out.flush()
+
+    def refresh(self):
+        """Shows the latest sample of every Joy-Con that changed; returns the number of cells written."""
+        self._add_rows()
+        rows = len(self._snapshots)
+        last = len(self.fields) - 1
+        parts = []
+        written = 0
+        for row, (joycon, snapshot, cells) in enumerate(zip(self.joycons, self._snapshots, self._cells)):
+            if not joycon.state.read_into(snapshot):
+                continue
+            changed = False
+            for k, field in enumerate(self.fields):
+                text = field.format.format(getattr(snapshot, field.attribute))
+                if text != cells[k]:
+                    cells[k] = text
+                    changed = True
+                    written += 1
+                    if self.ansi:
+                        # After the last column, clear whatever else ended up on the line
+                        parts.append(_move(rows - row, self.columns[k]) + text + (ERASE_LINE if k == last else ""))
+            if changed and not self.ansi:
+                parts.append(self._row(row) + "\n")
+        if parts:
+            if self.ansi:
+                parts.append(RESTORE_CURSOR)
+            self.out.write("".join(parts))
+            self.out.flush()
+        self.refreshes += 1
+        self.cells_written += written
+        return written
+
+    async def run(self):
+        """Shows the Joy-Cons until cancelled."""
+        self.start()
+        foreign = ForeignOutput(self) if self.ansi else None
+        with contextlib.redirect_stdout(foreign) if foreign else contextlib.nullcontext():
+            try:
+                last_refresh = 0.0
+                while True:
+                    await self.updated.wait()
+                    # Coalesce the samples of all the Joy-Cons into one refresh per frame
+                    wait = last_refresh + self.period - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self.updated.clear()
+                    self.refresh()
+                    last_refresh = time.monotonic()
+            finally:
+                if foreign:
+                    foreign.close_line()
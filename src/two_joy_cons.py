@@ -1,65 +1,68 @@
 import asyncio
 import sys
 from myjoycon import myJoyCon 
+from imu_calibration import DEFAULT_CACHE_PATH
+from imu_recorder import playback_devices
+from joycon_hub import JoyConHub, joycon_side
+from terminal_dashboard import ACCELERATION_FIELDS, ORIENTATION_FIELDS, TerminalDashboard
 
 
-def show_orientation(orientations):
-    for device_name, orientation in orientations.items():
-        angles = (f" {orientation['roll']: >+6.1f}"
-                   f" {orientation['pitch']: >+6.1f}"
-                   f" {orientation['yaw']: >+6.1f}")
-        if device_name == "Nintendo Switch Left Joy-Con IMU":
-            angles_left = angles
-        elif device_name == "Nintendo Switch Right Joy-Con IMU":
-            angles_right = angles
-            
-    sys.stdout.write(f"\r{angles_left} |{angles_right}")
-    sys.stdout.flush()
+def row_label(i, joycon):
+    """Row title: Joy-Con (L) / Joy-Con (R) and the device index, to tell several apart."""
+    side = joycon_side(joycon.device.name)
+    return f"{i}: Joy-Con ({side})" if side else f"{i}: {joycon.device.name}"
 
-async def display_orientations(joycons, interval=0.1):
-    # setup
-    header = (" Joy-Con (L)          | Joy-Con (R) Units: deg \n"
-              "  Roll   Pitch  Yaw   |  Roll   Pitch  Yaw   ")
-    print(header)
-    
-    # loop
-    while True:
-        orientations = {joycon.device.name: joycon.get_orientation() for joycon in joycons}
-        show_orientation(orientations)
-        await asyncio.sleep(interval)
+async def display_orientations(joycons):
+    # Refreshed when samples arrive, one row per device
+    dashboard = TerminalDashboard(joycons, ORIENTATION_FIELDS, row_label, units="Units: deg")
+    await dashboard.run()
+
+async def display_accelerations(joycons):
+    dashboard = TerminalDashboard(joycons, ACCELERATION_FIELDS, row_label, units="Units: g")
+    await dashboard.run()
 
-def show_acceleration(accelerations):
-    for device_name, accel in accelerations.items():
-        accels = (f" {accel['x']: >+6.1f}"
-                   f" {accel['y']: >+6.1f}"
-                   f" {accel['z']: >+6.1f}")
-        if device_name == "Nintendo Switch Left Joy-Con IMU":
-            accels_left = accels
-        elif device_name == "Nintendo Switch Right Joy-Con IMU":
-            accels_right = accels
-            
-    sys.stdout.write(f"\r{accels_left} |{accels_right}")
-    sys.stdout.flush()
+async def display_timing_stats(joycons, interval=1.0):
+    """
+    Prints the timing and connection stats of every Joy-Con each `interval` seconds.
 
-async def display_accelerations(joycons, interval=0.1):
-    header = (" Joy-Con (L)          | Joy-Con (R) Units: g \n"
-              " accelX accelY accelZ | accelX accelY accelZ ")
+    Parameters:
+    - joycons: list of myJoyCon, may grow, or a JoyConHub: its list is read again at
+      each refresh to show the Joy-Cons it adds on hotplug
+    """
+    header = (" Sample timing and reconnections per device. Units: ms \n"
+              " device                               |  rate  mean_dt jitter max_dt  late dropped reconnects attach")
     print(header)
     while True:
-        accelerations = {joycon.device.name: joycon.get_accel() for joycon in joycons}
-        show_acceleration(accelerations)
+        lines = []
+        for joycon in getattr(joycons, 'joycons', joycons):
+            stats = joycon.get_timing_stats()
+            connection = joycon.get_connection_stats()
+            lines.append(f" {joycon.device.name: <36} | {stats['rate']: >5.0f}"
+                         f" {stats['mean_dt']: >7.2f} {stats['jitter']: >6.2f} {stats['max_dt']: >6.1f}"
+                         f" {stats['late']: >5} {stats['dropped']: >7}"
+                         f" {connection['reconnects']: >10} {connection['last_attach_latency']: >6.2f}")
+        sys.stdout.write("\r" + " ||".join(lines))
+        sys.stdout.flush()
         await asyncio.sleep(interval)
 
-async def main():
-    device_paths = ['/dev/input/event20', '/dev/input/event22']
-    joycons = [myJoyCon(path) for path in device_paths]
-    monitor_tasks = [joycon.monitor() for joycon in joycons]
+async def main(recording=None):
+    if recording:
+        # Replay a session recorded with imu_recorder.py instead of reading the Joy-Cons
+        joycons = [myJoyCon(recording, device=device) for device in playback_devices(recording)]
+        monitor_tasks = [joycon.monitor() for joycon in joycons]
+    else:
+        # Every connected Joy-Con, read from the event loop without a task per device
+        hub = JoyConHub(calibration_path=DEFAULT_CACHE_PATH)
+        hub.attach(asyncio.get_running_loop())
+        joycons = hub  # the dashboards also show the Joy-Cons it adds on hotplug
+        monitor_tasks = []
     display_task = display_orientations(joycons)
     # display_task = display_accelerations(joycons)
+    # display_task = display_timing_stats(joycons)
 
     await asyncio.gather(*monitor_tasks, display_task)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(*sys.argv[1:2]))
 
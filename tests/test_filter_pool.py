@@ -0,0 +1,31 @@
+import time
+import numpy as np
+from filter_pool import FilterPool
+from orientation_filters import make_filter
+
+
+def test_remote_samples_keep_their_timestamps():
+    rng = np.random.default_rng(0)
+    n = 50
+    t = 100.0 + np.arange(n) * 0.005
+    dt = np.full(n, 0.005)
+    accel = rng.normal((0.0, 0.0, 1.0), 0.05, (n, 3))
+    gyro = rng.normal(0.0, 20.0, (n, 3))
+
+    pool = FilterPool(workers=1)
+    try:
+        remote = pool.estimator('madgwick')
+        done = [remote.filter_samples(t[i:i + 1], accel[i:i + 1], gyro[i:i + 1], dt[i:i + 1]) for i in range(n)]
+        deadline = time.monotonic() + 10.0
+        while sum(len(d[0]) for d in done) < n and time.monotonic() < deadline:
+            time.sleep(0.01)
+            done.append(remote.filter_samples(t[:0], accel[:0], gyro[:0], dt[:0]))
+    finally:
+        pool.close()
+
+    t_done, accel_done, gyro_done, orientation = (np.concatenate(arrays) for arrays in zip(*done))
+    # Every sample once, in order, with its own timestamp and the orientation computed for it
+    np.testing.assert_array_equal(t_done, t)
+    np.testing.assert_array_equal(accel_done, accel)
+    np.testing.assert_array_equal(gyro_done, gyro)
+    np.testing.assert_allclose(orientation, make_filter('madgwick').update_many(accel, gyro, dt))
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from imu_recorder import FRAME_DTYPE, HEADER_SIZE, ImuRecorder, device_frames, open_recording
+
+DEVICES = ["Nintendo Switch Left Joy-Con IMU", "Nintendo Switch Right Joy-Con IMU"]
+
+
+def record(path, frames, devices=DEVICES):
+    with ImuRecorder(path, devices) as recorder:
+        for device, t, accel, gyro in frames:
+            recorder.write_frame(device, t, accel, gyro)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "session.imu")
+    record(path, [(0, 1.0, (1, 2, 3), (4, 5, 6)), (1, 1.005, (-1, -2, -3), (-4, -5, -6))])
+    device_names, frames = open_recording(path)
+    assert device_names == DEVICES
+    t, imu = device_frames(frames, 1)
+    assert t.tolist() == [1.005]
+    assert imu.tolist() == [[-1, -2, -3, -4, -5, -6]]
+
+
+def test_append_after_truncated_tail(tmp_path):
+    path = str(tmp_path / "session.imu")
+    record(path, [(0, 1.0, (1, 2, 3), (4, 5, 6)), (0, 1.005, (7, 8, 9), (10, 11, 12))])
+    # A recorder killed in the middle of the second frame
+    with open(path, 'r+b') as f:
+        f.truncate(HEADER_SIZE + FRAME_DTYPE.itemsize + 10)
+    assert len(open_recording(path)[1]) == 1
+
+    record(path, [(1, 1.010, (13, 14, 15), (16, 17, 18))])
+    _, frames = open_recording(path)
+    assert frames['t'].tolist() == [1.0, 1.010]
+    assert frames['device'].tolist() == [0, 1]
+    np.testing.assert_array_equal(frames['gyro'][1], (16, 17, 18))
+
+
+def test_append_with_other_devices(tmp_path):
+    path = str(tmp_path / "session.imu")
+    record(path, [(0, 1.0, (1, 2, 3), (4, 5, 6))])
+    with pytest.raises(ValueError):
+        ImuRecorder(path, DEVICES[:1])
+    assert len(open_recording(path)[1]) == 1
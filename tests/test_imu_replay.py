@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from imu_recorder import ImuRecorder, PlaybackDevice, device_frames, open_recording, read_calibrations
+from imu_replay import replay_complementary, replay_kalman
+from myjoycon import myJoyCon
+
+CALIBRATION = {'gyro_bias': [1.0, -0.5, 0.25], 'accel_scale': 1.01, 'blocks': 3}
+
+
+def synthetic_recording(path, n=800):
+    """At rest with a gyro bias for 2 s (two calibration blocks), then turning."""
+    rng = np.random.default_rng(1)
+    t = 1000.0 + np.arange(n) * 0.005
+    accel = np.tile((0, 0, 4096), (n, 1)) + rng.integers(-2, 3, (n, 3))
+    gyro = np.tile((20, -10, 5), (n, 1)) + rng.integers(-1, 2, (n, 3))
+    moving = np.arange(n) >= 400
+    accel[moving] += rng.integers(-800, 800, (moving.sum(), 3))
+    gyro[moving] += rng.integers(-3000, 3000, (moving.sum(), 3))
+    with ImuRecorder(path, ["Nintendo Switch Left Joy-Con IMU"], [CALIBRATION]) as recorder:
+        for i in range(n):
+            recorder.write_frame(0, t[i], accel[i], gyro[i])
+
+
+@pytest.mark.parametrize("estimator, replay", [("complementary", replay_complementary),
+                                               ("kalman", replay_kalman)])
+def test_replay_matches_live(tmp_path, estimator, replay):
+    path = str(tmp_path / "session.imu")
+    synthetic_recording(path)
+
+    device = PlaybackDevice(path)
+    joycon = myJoyCon(path, device=device, estimator=estimator)
+    live = []
+    for event in device.read_loop():
+        seq = joycon.state.seq
+        joycon.handle_event(event)
+        if joycon.state.seq != seq:
+            live.append((joycon.state.roll, joycon.state.pitch, joycon.state.yaw))
+    # Started from the recorded calibration, and refined it at rest
+    assert joycon.calibrator.blocks == CALIBRATION['blocks'] + 2
+    assert not joycon.calibrator.updated
+
+    _, frames = open_recording(path)
+    t, imu = device_frames(frames, 0)
+    replayed = replay(t, imu, calibration=read_calibrations(path)[0])
+    np.testing.assert_allclose(replayed, live, atol=1e-6)
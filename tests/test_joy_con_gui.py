@@ -0,0 +1,70 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+from types import SimpleNamespace
+import joy_con_gui
+from joy_con_gui import JOYCON_COLORS, JoyConRenderer, setup_figure
+from joycon_state import JoyConState
+from mesh_lod import joycon_lods
+
+DEVICE_NAMES = ["Nintendo Switch Left Joy-Con IMU", "Nintendo Switch Right Joy-Con IMU"]
+
+
+def pixels_near(image, color, tolerance=30):
+    """Number of pixels of an RGB(A) image within `tolerance` of an RGB color in [0, 1]."""
+    target = np.array(color) * 255
+    return int((np.abs(image[..., :3].astype(int) - target).max(axis=-1) <= tolerance).sum())
+
+
+def test_meshes_render_offscreen(monkeypatch, tmp_path):
+    # Levels of detail built into a temporary cache, not the user's
+    monkeypatch.setattr(joy_con_gui, 'joycon_lods', lambda side: joycon_lods(side, cache_dir=str(tmp_path)))
+    fig, ax = setup_figure()
+    renderer = JoyConRenderer(fig, ax, DEVICE_NAMES, mesh=True)
+    assert all(mesh is not None for mesh in renderer.meshes)
+
+    states = [JoyConState(), JoyConState()]
+    states[0].roll, states[0].pitch = 30.0, -10.0
+    states[1].roll, states[1].pitch = -45.0, 20.0
+    renderer.update(states)
+    fig.canvas.draw()  # first frame: full draw, which caches the background
+    renderer.update(states)
+    renderer.draw("smoke test")  # blitted frame
+    renderer.set_level(renderer.lod.n_levels - 1)
+    renderer.update(states)
+    renderer.render()
+
+    image = np.asarray(fig.canvas.buffer_rgba())
+    # Both Joy-Cons are on screen, in their colors (shaded, so only roughly)
+    for color in JOYCON_COLORS.values():
+        assert pixels_near(image, color, tolerance=60) > 200
+    assert renderer.fps_text.get_text() == ""
+
+
+def test_joycons_added_on_hotplug_are_drawn(monkeypatch):
+    def fake_joycon(name):
+        return SimpleNamespace(device=SimpleNamespace(name=name), state=JoyConState(),
+                               get_ingest_stats=lambda: {'overflows': 0, 'dropped': 0})
+
+    hub = SimpleNamespace(joycons=[fake_joycon(DEVICE_NAMES[0])])
+    renderers = []
+
+    class RecordingRenderer(JoyConRenderer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            renderers.append(self)
+
+    frames = iter([True, True, False])  # the window is closed after two frames
+
+    def window_open(number):
+        if len(renderers) == 1:
+            hub.joycons.append(fake_joycon(DEVICE_NAMES[1]))  # plugged in after the first layout
+        return next(frames)
+
+    monkeypatch.setattr(joy_con_gui, 'JoyConRenderer', RecordingRenderer)
+    monkeypatch.setattr(joy_con_gui.plt, 'fignum_exists', window_open)
+    joy_con_gui.display_joycons(hub, interval=0)
+
+    assert len(renderers) == 2
+    assert len(renderers[-1].bricks) == 2
+    assert len(renderers[-1].ax.collections) == 2  # the first layout was taken off the axis
@@ -0,0 +1,85 @@
+import asyncio
+import socket
+import struct
+import pytest
+import joycon_hid
+from joycon_hid import (FULL_REPORT_ID, FULL_REPORT_SIZE, IMU_OFFSET, IMU_SAMPLE, SUBCOMMAND_ENABLE_IMU,
+                        SUBCOMMAND_REPLY_ID, SUBCOMMAND_SPI_READ, HidImuReader)
+
+ACCEL_OFFSET, GYRO_OFFSET = (10, -20, 30), (5, -5, 2)
+FACTORY_CALIBRATION = struct.pack('<12h', *ACCEL_OFFSET, 16384, 16384, 16384, *GYRO_OFFSET, 13371, 13371, 13371)
+
+
+class FakeJoyCon:
+    """
+    The other end of the hidraw node: replies to the subcommands with the factory
+    calibration in its SPI flash, losing the first `lost` subcommands and rejecting
+    those in `rejected`.
+    """
+
+    def __init__(self, sock, lost=0, rejected=()):
+        self.sock = sock
+        self.lost = lost
+        self.rejected = rejected
+        self.subcommands = []
+        self.flash = {0x6020: FACTORY_CALIBRATION}
+
+    def handle(self):
+        report = self.sock.recv(64)
+        subcommand, argument = report[10], report[11:]
+        self.subcommands.append(subcommand)
+        if self.lost:
+            self.lost -= 1
+            return
+        data = b''
+        if subcommand == SUBCOMMAND_SPI_READ:
+            address, size = struct.unpack_from('<IB', argument)
+            data = argument[:5] + self.flash.get(address, b'\xff' * size)[:size]
+        ack = 0x00 if subcommand in self.rejected else 0x80
+        self.sock.send(bytes((SUBCOMMAND_REPLY_ID,)) + bytes(12) + bytes((ack, subcommand)) + data)
+
+
+async def open_reader(monkeypatch, **fake_params):
+    ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    ours.setblocking(False)
+    monkeypatch.setattr(joycon_hid.os, 'open', lambda path, flags: ours.detach())
+    monkeypatch.setattr(joycon_hid, 'SUBCOMMAND_TIMEOUT', 0.05)
+    joycon = FakeJoyCon(theirs, **fake_params)
+    loop = asyncio.get_running_loop()
+    loop.add_reader(theirs.fileno(), joycon.handle)
+    reader = HidImuReader("/dev/hidraw-test", "test")
+    try:
+        await reader.open()
+    finally:
+        loop.remove_reader(theirs.fileno())
+        theirs.close()
+    return reader, joycon
+
+
+def test_samples_use_the_calibration_of_the_joycon(monkeypatch):
+    async def scenario():
+        reader, joycon = await open_reader(monkeypatch, lost=1)  # the first read of the flash is lost
+        reader.close()
+        return reader, joycon
+
+    reader, joycon = asyncio.run(scenario())
+    # The user calibration is missing (erased flash), so the factory one is used
+    assert joycon.subcommands == [SUBCOMMAND_SPI_READ] * 3 + [SUBCOMMAND_ENABLE_IMU, 0x03]
+
+    report = bytearray(FULL_REPORT_SIZE)
+    report[0] = FULL_REPORT_ID
+    for k in range(3):
+        IMU_SAMPLE.pack_into(report, IMU_OFFSET + k * IMU_SAMPLE.size, 10, -20, 4126, 105, -5, 2)
+    reader.handle_report(bytes(report), 1.0)
+    state = reader.state.snapshot()
+    assert (state.ax, state.ay) == (0.0, 0.0)
+    assert state.az == pytest.approx(4096 * 4.0 / (0x4000 - 30))
+    assert (state.gx, state.gy, state.gz) == (pytest.approx(100 * 936.0 / (0x343B - 5)), 0.0, 0.0)
+
+
+def test_rejected_subcommand_fails_open(monkeypatch):
+    async def scenario():
+        await open_reader(monkeypatch, rejected=(SUBCOMMAND_ENABLE_IMU,))
+
+    with pytest.raises(OSError, match="rejected"):
+        asyncio.run(scenario())
@@ -0,0 +1,12 @@
+from joycon_state import JoyConState
+
+
+def test_snapshot_is_a_consistent_copy():
+    state = JoyConState()
+    assert state.snapshot().roll == 0.0
+    state.publish(1.0, (0.0, 0.0, 1.0), (1.0, 2.0, 3.0), (10.0, 20.0, 30.0))
+    snapshot = state.snapshot()
+    state.publish(2.0, (0.0, 1.0, 0.0), (4.0, 5.0, 6.0), (40.0, 50.0, 60.0))
+    assert (snapshot.t, snapshot.roll, snapshot.pitch, snapshot.yaw, snapshot.az) == (1.0, 10.0, 20.0, 30.0, 1.0)
+    assert snapshot.seq == 2
+    assert state.snapshot().yaw == 60.0
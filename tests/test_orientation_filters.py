@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from orientation_filters import FILTERS, ComplementaryFilter, OrientationFilter, QuaternionFilter, make_filter
+
+
+class BrokenFilter(ComplementaryFilter):
+    def __init__(self, params):
+        super().__init__(params['alpha'])
+
+
+def test_make_filter(monkeypatch):
+    assert isinstance(make_filter('kalman', process_noise=1e-4), FILTERS['kalman'])
+    with pytest.raises(ValueError, match="choose one of"):
+        make_filter('unscented')
+    # An error in the constructor is not reported as an unknown filter
+    monkeypatch.setitem(FILTERS, 'broken', BrokenFilter)
+    with pytest.raises(KeyError):
+        make_filter('broken', params={})
+
+
+def test_interfaces_are_abstract():
+    with pytest.raises(TypeError):
+        OrientationFilter()
+    with pytest.raises(TypeError):
+        QuaternionFilter()
+
+
+@pytest.mark.parametrize("name", sorted(FILTERS))
+def test_update_many_matches_update(name):
+    rng = np.random.default_rng(3)
+    accel = rng.normal((0.0, 0.0, 1.0), 0.05, (100, 3))
+    gyro = rng.normal(0.0, 20.0, (100, 3))
+    dt = np.full(100, 0.005)
+    one, many = make_filter(name), make_filter(name)
+    expected = [one.update(a, g, step) for a, g, step in zip(accel.tolist(), gyro.tolist(), dt.tolist())]
+    np.testing.assert_allclose(many.update_many(accel, gyro, dt), expected, atol=1e-9)
@@ -0,0 +1,79 @@
+import os
+import struct
+import numpy as np
+import pytest
+from raw_events import (EV_ABS, EV_SYN, IMU_AXES, INPUT_EVENT_DTYPE, SYN_REPORT, FrameAssembler,
+                        RawEventReader)
+
+# struct input_event as the kernel writes it on this machine
+INPUT_EVENT = struct.Struct("llHHi")
+
+
+def pack(*events):
+    return b"".join(INPUT_EVENT.pack(*event) for event in events)
+
+
+def frame(sec, usec, values):
+    events = [(sec, usec, EV_ABS, code, value) for code, value in zip(IMU_AXES, values)]
+    return events + [(sec, usec, EV_SYN, SYN_REPORT, 0)]
+
+
+def test_dtype_matches_kernel_struct():
+    assert INPUT_EVENT_DTYPE.itemsize == INPUT_EVENT.size
+
+
+def test_read_decodes_input_events():
+    events = frame(12, 345678, [1, -2, 3, 400, -500, 600]) + frame(12, 350678, [7, 8, 9, 10, 11, 12])
+    r, w = os.pipe()
+    try:
+        os.set_blocking(r, False)
+        reader = RawEventReader(r)
+        assert len(reader.read()) == 0
+        os.write(w, pack(*events))
+        decoded = reader.read()
+        assert decoded.tolist() == events
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+def test_read_rejects_partial_records():
+    r, w = os.pipe()
+    try:
+        os.set_blocking(r, False)
+        os.write(w, pack((1, 2, EV_SYN, SYN_REPORT, 0))[:-4])
+        with pytest.raises(ValueError):
+            RawEventReader(r).read()
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+def test_assemble_matches_event_by_event():
+    rng = np.random.default_rng(0)
+    rows = []
+    for i in range(50):
+        # Axis events in any order, some repeated, some missing, and empty frames
+        for code in rng.choice(len(IMU_AXES), size=rng.integers(0, 8)):
+            rows.append((1, i * 5000, EV_ABS, int(code), int(rng.integers(-1000, 1000))))
+        rows.append((1, i * 5000, EV_SYN, SYN_REPORT, 0))
+    events = np.array(rows, dtype=INPUT_EVENT_DTYPE)
+
+    # Reference: one event at a time, as myJoyCon.handle_event
+    values = [0] * len(IMU_AXES)
+    pending = False
+    expected_t, expected_imu = [], []
+    for sec, usec, type_, code, value in rows:
+        if type_ == EV_ABS:
+            values[code] = value
+            pending = True
+        elif pending:
+            expected_t.append(sec + usec * 1e-6)
+            expected_imu.append(list(values))
+            pending = False
+
+    # In chunks that split frames
+    assembler = FrameAssembler()
+    t, imu = zip(*(assembler.assemble(events[i:i + 7]) for i in range(0, len(events), 7)))
+    np.testing.assert_allclose(np.concatenate(t), expected_t)
+    np.testing.assert_array_equal(np.concatenate(imu), expected_imu)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from sample_clock import SampleClock
+
+
+def timestamps():
+    rng = np.random.default_rng(2)
+    t = 50.0 + np.cumsum(rng.normal(0.005, 0.0005, 300))
+    t[40] = t[39]            # two samples with the same timestamp: a step of 0, counted
+    t[100:] += 0.05          # a gap: late, with dropped samples
+    t[200] = t[199] - 0.01   # the clock went backwards: not counted
+    return t
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 300])
+def test_tick_many_matches_tick(chunk):
+    t = timestamps()
+    one, many = SampleClock(), SampleClock()
+    dt_one = [one.tick(x) for x in t]
+    dt_many = np.concatenate([many.tick_many(t[i:i + chunk]) for i in range(0, len(t), chunk)])
+
+    np.testing.assert_allclose(dt_many, dt_one, rtol=0, atol=1e-12)
+    stats_one, stats_many = one.stats(), many.stats()
+    assert stats_many['samples'] == stats_one['samples'] == len(t) - 2
+    assert stats_many['late'] == stats_one['late'] > 0
+    assert stats_many['dropped'] == stats_one['dropped'] > 0
+    for key in ('mean_dt', 'std_dt', 'jitter', 'max_dt'):
+        assert stats_many[key] == pytest.approx(stats_one[key], rel=1e-9)
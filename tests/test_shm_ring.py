@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+from imu_stream import ImuStream, ImuSubscriber
+from shm_ring import ShmRing
+
+DTYPE = np.dtype([('i', '<i8'), ('x', '<f8')])
+
+
+def records(start, stop):
+    out = np.empty(stop - start, dtype=DTYPE)
+    out['i'] = np.arange(start, stop)
+    out['x'] = out['i'] * 0.5
+    return out
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(DTYPE, 8)
+    yield ring
+    ring.close()
+
+
+def test_wraparound(ring):
+    reader = ShmRing(DTYPE, name=ring.name)
+    try:
+        for start in range(0, 30, 5):
+            ring.write_many(records(start, start + 5))
+            assert reader.read()['i'].tolist() == list(range(start, start + 5))
+        for i in range(30, 33):
+            ring.write((i, i * 0.5))
+        assert reader.read(max_records=2)['i'].tolist() == [30, 31]
+        assert reader.read()['i'].tolist() == [32]
+        assert reader.lost == 0
+        assert ring.latest()['i'] == 32
+    finally:
+        reader.close()
+
+
+def test_slow_reader_loses_oldest(ring):
+    reader = ShmRing(DTYPE, name=ring.name)
+    try:
+        ring.write_many(records(0, 20))
+        assert reader.read()['i'].tolist() == list(range(12, 20))
+        assert reader.lost == 12
+        # More records than the ring holds in one call
+        ring.write_many(records(20, 45))
+        assert reader.read()['i'].tolist() == list(range(37, 45))
+    finally:
+        reader.close()
+
+
+def test_oldest(ring):
+    ring.write_many(records(0, 11))
+    reader = ShmRing(DTYPE, name=ring.name, oldest=True)
+    try:
+        assert reader.read()['i'].tolist() == list(range(3, 11))
+    finally:
+        reader.close()
+
+
+def test_slot_not_visible_yet(ring):
+    reader = ShmRing(DTYPE, name=ring.name)
+    try:
+        ring.write_many(records(0, 10))
+        reader.read()
+        ring.write_many(records(10, 13))
+        # `written` seen before the sequence number of the slot of record 11, as on ARM
+        ring.seqs[11 % 8] = 3
+        assert reader.read()['i'].tolist() == [10]
+        assert ring.latest()['i'] == 12
+        ring.seqs[11 % 8] = 11
+        assert reader.read()['i'].tolist() == [11, 12]
+        # The writer storing record 21 over record 13: not returned torn, then lost
+        ring.write_many(records(13, 20))
+        lost = reader.lost
+        ring.seqs[13 % 8] = -1
+        assert len(reader.read()) == 0
+        ring.write_many(records(20, 22))
+        assert reader.read()['i'].tolist() == list(range(14, 22))
+        assert reader.lost == lost + 1
+    finally:
+        reader.close()
+
+
+def test_reuse_resets_in_place(ring):
+    reader = ShmRing(DTYPE, name=ring.name)
+    ring.write_many(records(0, 5))
+    reader.read()
+    # A new writer takes over the block of one that did not exit cleanly
+    restarted = ShmRing(DTYPE, 8, name=ring.name, reuse=True)
+    try:
+        restarted.write_many(records(100, 103))
+        assert reader.read()['i'].tolist() == [100, 101, 102]
+        assert reader.restarts == 1
+    finally:
+        reader.close()
+        restarted.close(unlink=False)
+    with pytest.raises(FileExistsError):
+        ShmRing(DTYPE, 8, name=ring.name)
+
+
+def test_subscriber_follows_restarted_producer():
+    serial = "00:11:22:33:44:55-test"
+    stream = ImuStream(serial, capacity=16)
+    subscriber = ImuSubscriber(serial)
+    try:
+        stream.publish(1.0, (0, 0, 1), (0, 0, 0), (1, 2, 3))
+        assert subscriber.read()['seq'].tolist() == [0]
+
+        # Producer killed without freeing its block: the next one reuses it
+        stream.ring.close(unlink=False)
+        stream = ImuStream(serial, capacity=16)
+        stream.publish(2.0, (0, 0, 1), (0, 0, 0), (4, 5, 6))
+        assert subscriber.read()['t'].tolist() == [2.0]
+
+        # Clean exit, then a new producer with a new block
+        stream.close()
+        assert len(subscriber.read()) == 0
+        stream = ImuStream(serial, capacity=32)
+        stream.publish_many(np.array([3.0, 3.005]), np.zeros((2, 3)), np.zeros((2, 3)), np.zeros((2, 3)))
+        assert subscriber.read()['t'].tolist() == [3.0, 3.005]
+        assert subscriber.restarts == 2
+    finally:
+        subscriber.close()
+        stream.close()
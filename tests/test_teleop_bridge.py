@@ -0,0 +1,70 @@
+import selectors
+import time
+import numpy as np
+import pytest
+from joycon_state import JoyConState
+from teleop_bridge import RECORD_IMU, TeleopBridge, TeleopPublisher, TeleopReceiver
+
+
+@pytest.fixture
+def link():
+    receiver = TeleopReceiver(port=0)
+    publisher = TeleopPublisher(receiver.sock.getsockname())
+    yield publisher, receiver
+    publisher.close()
+    receiver.close()
+
+
+def test_records_round_trip(link):
+    publisher, receiver = link
+    state = JoyConState()
+    state.publish(time.monotonic(), (0.1, 0.2, 1.0), (0.0, 0.0, 0.0), (10.0, -20.0, 30.0))
+    publisher.add(1, state)
+    records = receiver.receive(timeout=1.0)
+    assert len(records) == 1
+    assert records['device'][0] == 1 and records['flags'][0] == RECORD_IMU
+    np.testing.assert_allclose(records['orientation'][0], (10.0, -20.0, 30.0))
+    np.testing.assert_allclose(records['accel'][0], (0.1, 0.2, 1.0), rtol=1e-6)
+    assert receiver.stats()['lost'] == 0
+
+
+def test_realtime_timestamps_are_sent_as_monotonic(link):
+    publisher, receiver = link
+    state = JoyConState()
+    state.publish(time.time(), (0.0, 0.0, 1.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+    publisher.add(0, state, realtime=True)
+    records = receiver.receive(timeout=1.0)
+    assert abs(records['t'][0] - time.monotonic()) < 0.5
+    assert 0.0 <= receiver.stats()['latency']['max'] < 500.0
+
+
+class FakeHub:
+    """A JoyConHub without Joy-Cons, that rescans like one without pyudev."""
+
+    def __init__(self, rescan_interval):
+        self.selector = selectors.DefaultSelector()
+        self.joycons = []
+        self.states = []
+        self.rescan_interval = rescan_interval
+        self.last_scan = time.monotonic()
+        self.scans = 0
+
+    def rescan_due(self):
+        return max(0.0, self.last_scan + self.rescan_interval - time.monotonic())
+
+    def poll(self, timeout=None):
+        if self.rescan_due() == 0.0:
+            self.last_scan = time.monotonic()
+            self.scans += 1
+        return 0
+
+
+def test_step_wakes_up_to_rescan(link):
+    publisher, _ = link
+    hub = FakeHub(rescan_interval=0.05)
+    bridge = TeleopBridge(hub, publisher, buttons=False)
+    start = time.monotonic()
+    while hub.scans < 2:
+        bridge.step()
+        assert time.monotonic() - start < 1.0
+    bridge.selector.close()
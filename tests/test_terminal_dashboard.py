@@ -0,0 +1,131 @@
+import asyncio
+import io
+import re
+from types import SimpleNamespace
+from joycon_state import JoyConState
+from terminal_dashboard import TerminalDashboard
+
+_CONTROL = re.compile(r"\x1b7|\x1b8|\x1b\[(\d*)([AGKJ])|[\r\n]|[^\x1b\r\n]+")
+
+
+class FakeTerminal(io.TextIOBase):
+    """
+    The few ANSI sequences the dashboard uses, on a small screen that scrolls like a
+    real terminal: the saved cursor position stays where it was on the screen.
+    """
+
+    def __init__(self, width=60, height=8):
+        self.width, self.height = width, height
+        self.lines = [""] * height
+        self.row = self.column = 0
+        self.saved = (0, 0)
+
+    def isatty(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def _put(self, text):
+        line = self.lines[self.row].ljust(self.column)
+        self.lines[self.row] = line[:self.column] + text + line[self.column + len(text):]
+        self.column += len(text)
+
+    def write(self, text):
+        for match in _CONTROL.finditer(text):
+            token = match.group(0)
+            if token == "\x1b7":
+                self.saved = (self.row, self.column)
+            elif token == "\x1b8":
+                self.row, self.column = self.saved
+            elif token == "\r":
+                self.column = 0
+            elif token == "\n":
+                self.column = 0
+                if self.row == self.height - 1:
+                    self.lines = self.lines[1:] + [""]
+                else:
+                    self.row += 1
+            elif match.group(2) == "A":
+                self.row = max(0, self.row - int(match.group(1) or 1))
+            elif match.group(2) == "G":
+                self.column = int(match.group(1) or 1) - 1
+            elif match.group(2) == "K":
+                self.lines[self.row] = self.lines[self.row][:self.column]
+            elif match.group(2) == "J":
+                self.lines[self.row] = self.lines[self.row][:self.column]
+                for row in range(self.row + 1, self.height):
+                    self.lines[row] = ""
+            else:
+                self._put(token)
+        return len(text)
+
+    def screen(self):
+        return [line.rstrip() for line in self.lines]
+
+
+def fake_joycon(name):
+    return SimpleNamespace(device=SimpleNamespace(name=name), state=JoyConState(), updated=None)
+
+
+class FakeHub:
+    """What TerminalDashboard uses of JoyConHub: its list and the event set on hotplug."""
+
+    def __init__(self, joycons):
+        self.joycons = joycons
+        self.updated = None
+
+    def add(self, joycon):
+        print(f"Initialized JoyCon {joycon.device.name}")
+        self.joycons.append(joycon)
+        joycon.updated = self.updated
+        self.updated.set()
+
+
+def publish(joycon, roll, pitch, yaw):
+    joycon.state.publish(0.0, (0, 0, 1), (0, 0, 0), (roll, pitch, yaw))
+    joycon.updated.set()
+
+
+def test_rows_survive_foreign_output_and_hotplug():
+    terminal = FakeTerminal()
+    hub = FakeHub([fake_joycon("left")])
+    joycons = hub.joycons
+    dashboard = TerminalDashboard(hub, refresh_rate=1000, out=terminal)
+
+    async def scenario():
+        task = asyncio.create_task(dashboard.run())
+        await asyncio.sleep(0)
+        publish(joycons[0], 1.0, 2.0, 3.0)
+        await asyncio.sleep(0.01)
+        # Enough lines to scroll the screen, then a Joy-Con plugged in, as JoyConHub does
+        for i in range(6):
+            print(f"Lost JoyCon {i}")
+        hub.add(fake_joycon("right"))
+        publish(joycons[1], -4.0, -5.0, -6.0)
+        await asyncio.sleep(0.01)
+        publish(joycons[0], 10.0, 2.0, 3.0)
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    screen = terminal.screen()
+    assert screen[-5:] == [
+        "Initialized JoyCon right",
+        "                         |    Roll   Pitch     Yaw",
+        "0: left                  |   +10.0    +2.0    +3.0",
+        "1: right                 |    -4.0    -5.0    -6.0",
+        "",
+    ]
+    assert screen[0] == "Lost JoyCon 3"
+
+
+def test_without_terminal_changed_rows_are_printed():
+    out = io.StringIO()
+    joycons = [fake_joycon("left"), fake_joycon("right")]
+    dashboard = TerminalDashboard(joycons, out=out)
+    dashboard.start()
+    joycons[1].state.publish(0.0, (0, 0, 1), (0, 0, 0), (1.0, 2.0, 3.0))
+    assert dashboard.refresh() == 3
+    assert dashboard.refresh() == 0
+    assert out.getvalue().splitlines()[-1] == "1: right                 |    +1.0    +2.0    +3.0"
@@ -0,0 +1,32 @@
+import asyncio
+from types import SimpleNamespace
+from joycon_hub import JoyConHub
+from two_joy_cons import display_timing_stats
+
+TIMING_STATS = {'rate': 200.0, 'mean_dt': 5.0, 'jitter': 0.1, 'max_dt': 7.5, 'late': 1, 'dropped': 2}
+CONNECTION_STATS = {'reconnects': 3, 'last_attach_latency': 0.25}
+
+
+def fake_joycon(name):
+    return SimpleNamespace(device=SimpleNamespace(name=name),
+                           get_timing_stats=lambda: TIMING_STATS,
+                           get_connection_stats=lambda: CONNECTION_STATS)
+
+
+async def one_tick(joycons):
+    task = asyncio.create_task(display_timing_stats(joycons, interval=60))
+    await asyncio.sleep(0)
+    task.cancel()
+
+
+def test_timing_stats_of_a_hub(capsys):
+    hub = JoyConHub(device_paths=[], hotplug=False)
+    hub.joycons.append(fake_joycon("Nintendo Switch Left Joy-Con IMU"))  # as added on hotplug
+    try:
+        asyncio.run(one_tick(hub))
+    finally:
+        hub.joycons.clear()
+        hub.close()
+    line = capsys.readouterr().out.splitlines()[-1]
+    assert line.startswith(" Nintendo Switch Left Joy-Con IMU ")
+    assert line.split("|")[1].split() == ["200", "5.00", "0.10", "7.5", "1", "2", "3", "0.25"]